@@ -1,54 +1,286 @@
-import os, io, uuid, json, shutil, csv, zipfile, re
+import os, uuid, json, re, shutil, time
+from functools import lru_cache
 from typing import Optional, Dict, Any, List
 
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, jsonify, send_file, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-from PIL import Image, ImageOps
 
 # ---- Utilidades existentes ----
-from utils.file_utils import is_allowed, ensure_session_dirs, save_upload, thumb_path, make_thumbnail
-from utils.metadata_store import new_session_state, new_item
+from utils.file_utils import is_allowed, ensure_session_dirs, save_upload
+from utils.blob_store import BlobStore
+from utils.chunked_upload import ChunkedUploads, UploadError
+from utils.thumbnails import ThumbnailPipeline, FORMATS as THUMB_FORMATS, snap_size, thumb_file
+from utils.metadata_store import Item, new_item
+from utils.session_store import SessionStore
+from utils.catalog_store import CatalogStore
 from utils.renamer import compute_new_name
+from utils.jobs import Job, JobManager
+from utils.result_cache import ResultCache
+from utils.rendition_cache import RenditionCache, snap_width
+from utils.hashing import file_digest
+from utils.zip_stream import stream_zip
+from utils.export_engine import parse_derivatives
+from utils.incremental_export import incremental_export
+from utils.metrics import REGISTRY, REQUEST_SECONDS, EXPORT_BYTES, begin_request, end_request, observe
 # from utils.export_utils import export_zip  
 
-from classifiers.heuristics import guess_type
-from classifiers.cnn import predict_with_cnn
+from classifiers.engine import iter_classify_items, cnn_predictions
+from classifiers.cnn import get_registry
+from classifiers.ocr_utils import ocr_engine_info, warm_up_ocr
 
 APP_DIR = os.path.dirname(os.path.abspath(__file__))
 WORKSPACE = os.path.join(APP_DIR, "workspace")
 os.makedirs(WORKSPACE, exist_ok=True)
 
-app = Flask(__name__)
-CORS(app)
+# Caché de resultados por contenido (OCR, features, CNN), compartida entre sesiones
+RESULT_CACHE = ResultCache(
+    os.path.join(WORKSPACE, "_cache"),
+    max_bytes=int(os.environ.get("RESULT_CACHE_MAX_MB", "256")) * 1024 * 1024,
+)
+
+# Caché de vistas previas renderizadas (por contenido, ancho normalizado y calidad)
+PREVIEW_CACHE = RenditionCache(
+    os.path.join(WORKSPACE, "_previews"),
+    max_bytes=int(os.environ.get("PREVIEW_CACHE_MAX_MB", "1024")) * 1024 * 1024,
+    widths=[int(w) for w in os.environ.get("PREVIEW_WIDTHS", "320,640,1024,1600,2400").split(",") if w.strip()],
+)
+PREVIEW_MAX_AGE = int(os.environ.get("PREVIEW_MAX_AGE", "86400"))  # Cache-Control max-age (s)
+
+# Originales deduplicados por contenido (workspace/_blobs); las sesiones los ven
+# mediante hardlinks en originals/ y el recuento de referencias permite borrarlos
+BLOBS = BlobStore(os.path.join(WORKSPACE, "_blobs"))
+
+# Subidas por trozos reanudables (originals/.partial/)
+UPLOADS = ChunkedUploads(WORKSPACE, blobs=BLOBS)
+
+# Miniaturas en segundo plano (THUMB_WORKERS hilos), fuera de la petición de /upload;
+# se comparten por contenido a través del blob store
+THUMBS = ThumbnailPipeline(shared_root=BLOBS.thumbs_root)
+
+# Estado de sesiones persistente (SQLite en WAL) con caché LRU de sesiones activas.
+# Compartido entre procesos (gunicorn -w N): cada escritura sube el rev de la sesión.
+SESSIONS_DB = os.path.join(WORKSPACE, "sessions.db")
+STORE = SessionStore(SESSIONS_DB, cache_size=int(os.environ.get("SESSION_CACHE_SIZE", "32")))
+
+# Catálogo maestro compartido (SQLite indexado por versión + catalog_id);
+# las sesiones guardan sólo la versión del CSV que cargaron
+CATALOG = CatalogStore(os.path.join(WORKSPACE, "catalog.db"))
+# Versiones sin sesión que las use: se conservan las CATALOG_KEEP_VERSIONS más recientes
+CATALOG_KEEP_VERSIONS = int(os.environ.get("CATALOG_KEEP_VERSIONS", "2"))
+
+
+class _JSONProvider(DefaultJSONProvider):
+    """
+    Los ítems compactos (Item) salen con su forma dict de siempre. Las listas
+    "items" de las respuestas se componen con Item.to_json (texto escrito
+    directamente, claves en orden fijo), sin construir un dict por ítem.
+    """
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, Item):
+            return o.to_dict()
+        return DefaultJSONProvider.default(o)
+
+    def dumps(self, obj, **kwargs):
+        items = obj.get("items") if isinstance(obj, dict) else None
+        if not (isinstance(items, list) and items and isinstance(items[0], Item)):
+            return super().dumps(obj, **kwargs)
+        try:
+            body = ",".join([it.to_json() if isinstance(it, Item) else super().dumps(it) for it in items])
+        except TypeError:  # algún valor que sólo sabe serializar default()
+            return super().dumps(obj, **kwargs)
+        head = super().dumps({k: v for k, v in obj.items() if k != "items"}, **kwargs).rstrip()
+        sep = "," if head[:-1].strip() != "{" else ""
+        return f'{head[:-1]}{sep}"items":[{body}]}}'
+
 
-# -------------------- Estado en memoria (demo) --------------------
-SESSIONS: Dict[str, Dict[str, Any]] = {}
+app = Flask(__name__)
+app.json = _JSONProvider(app)
+CORS(app, expose_headers=["Content-Disposition", "X-Export-Cached", "X-Export-Reused", "X-Export-Files", "X-Export-Derivatives",
+                          "X-Export-Errors", "X-Export-Error-Files", "Server-Timing"])
+
+# -------------------- Métricas --------------------
+# Tiempos por etapa (decode/features/ocr/cnn/export/preview), páginas
+# clasificadas, aciertos de caché y bytes exportados en formato Prometheus
+# (GET /metrics). Cada worker vuelca su instantánea en workspace/_metrics
+# cada METRICS_FLUSH_SECONDS (hilo en segundo plano, también durante jobs
+# largos) y /metrics suma la de todos; los totales de workers terminados
+# se acumulan en retired.json para que los contadores nunca bajen.
+REGISTRY.share(os.path.join(WORKSPACE, "_metrics"), interval=float(os.environ.get("METRICS_FLUSH_SECONDS", "1")))
+REGISTRY.counter_func(
+    "preservia_cache_hits_total", "Cache lookups answered from disk.", ["cache"],
+    lambda: {("results",): RESULT_CACHE.hits, ("previews",): PREVIEW_CACHE.hits},
+)
+REGISTRY.counter_func(
+    "preservia_cache_misses_total", "Cache lookups that had to compute the result.", ["cache"],
+    lambda: {("results",): RESULT_CACHE.misses, ("previews",): PREVIEW_CACHE.misses},
+)
+
+
+@app.before_request
+def _begin_timing():
+    begin_request()
+
+
+@app.after_request
+def _server_timing(resp):
+    """Server-Timing: tiempo acumulado por etapa en esta petición + total."""
+    timing = end_request()
+    if timing is not None:
+        total = timing.elapsed()
+        REQUEST_SECONDS.observe(total, endpoint=request.endpoint or "unmatched")
+        resp.headers["Server-Timing"] = timing.header(total)
+        resp.headers["Timing-Allow-Origin"] = "*"
+    REGISTRY.flush()
+    return resp
+
+
+def metered_stream(chunks, stage: str, mode: str):
+    """
+    Reenvía los trozos de una respuesta en streaming contando bytes
+    (EXPORT_BYTES) y el tiempo de generación (sin la espera al cliente).
+    """
+    spent, sent = 0.0, 0
+    it = iter(chunks)
+    try:
+        while True:
+            t0 = time.perf_counter()
+            try:
+                chunk = next(it)
+            except StopIteration:
+                break
+            finally:
+                spent += time.perf_counter() - t0
+            sent += len(chunk)
+            yield chunk
+    finally:
+        if hasattr(it, "close"):
+            it.close()  # cliente desconectado: cerrar también el generador interno
+        observe(stage, spent)
+        EXPORT_BYTES.inc(sent, mode=mode)
+
+
+# -------------------- Estado de sesiones --------------------
+JOBS = JobManager(SESSIONS_DB)  # estado y cancelación visibles desde cualquier worker
+
+
+def bad_session_id(session_id: str) -> bool:
+    """Ids que no pueden ser directorios de sesión (internos o con separadores)."""
+    return (
+        not session_id
+        or session_id.startswith("_")
+        or session_id.startswith(".")
+        or "/" in session_id
+        or "\\" in session_id
+    )
 
 
 def get_state(session_id: str) -> Optional[Dict[str, Any]]:
-    """Obtiene (o intenta lazy-load) el estado de una sesión."""
-    state = SESSIONS.get(session_id)
-    if not state:
+    """
+    Obtiene el estado de una sesión: de la caché en memoria o, tras un
+    reinicio, de la base de datos (ítems, clasificación y validación).
+    Un directorio de sesión sin registro (anterior al store) se da de alta vacío.
+    """
+    if bad_session_id(session_id):
+        return None  # _cache, _previews...: directorios internos, no sesiones
+    state = STORE.load(session_id)
+    if state is None:
         session_dir = os.path.join(WORKSPACE, session_id)
         if os.path.isdir(session_dir):
-            state = new_session_state(session_id)
-            SESSIONS[session_id] = state
+            with STORE.locked(session_id, create=True) as state:
+                pass
     # Asegura campos base
     if state is not None and "label" not in state:
         state["label"] = None  # nombre amigable opcional
     return state
 
 
+def _new_name(it: Dict[str, Any]) -> str:
+    return compute_new_name(
+        it["original_filename"],
+        it.get("type") or "sin-tipo",
+        it.get("page_number"),
+        it.get("number_scheme", "arabic"),
+        it.get("extra", ""),
+        it.get("ghost_number", False),
+    )
+
+
+# Subir si cambia compute_new_name: fuerza un recálculo completo de cada sesión
+NAMES_VERSION = 1
+
+
+def apply_renames(state: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Recalcula new_filename sólo de los ítems marcados por set_fields()."""
+    renamed = state.take_renames()
+    for it in renamed:
+        it["new_filename"] = _new_name(it)
+    return renamed
+
+
+def refresh_new_names(state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Completa los new_filename que falten. Los nombres se recalculan al
+    editar (apply_renames), así que normalmente no hay nada que hacer; sólo
+    las sesiones de una versión anterior de NAMES_VERSION se recalculan enteras.
+    Devuelve el estado vigente (puede ser más nuevo que el recibido si
+    otro proceso lo modificó entre medias), o el recibido si la sesión se
+    borró entretanto.
+    """
+    if state.get("names_version") == NAMES_VERSION and all(
+        it.get("new_filename") is not None for it in state["items"]
+    ):
+        return state
+    with STORE.locked(state["session_id"]) as st:
+        if st is None:
+            return state
+        full = st.get("names_version") != NAMES_VERSION
+        changed = []
+        for it in st["items"]:
+            if not full and it.get("new_filename") is not None:
+                continue
+            name = _new_name(it)
+            if name != it.get("new_filename"):
+                it["new_filename"] = name
+                changed.append(it)
+        if full:
+            st["names_version"] = NAMES_VERSION
+            STORE.save_session(st)
+        STORE.save_items(st, changed)
+    return st
+
+
 # -------------------- Catálogo / CSV helpers --------------------
 def ensure_catalog(state: Dict[str, Any]) -> Dict[str, Any]:
     """Asegura estructura de catálogo dentro del estado."""
     if "catalog" not in state:
         state["catalog"] = {"detected_id": None, "entry": None}
-    if "catalog_map" not in state:
-        state["catalog_map"] = {}  # id -> fila normalizada
     return state["catalog"]
 
 
+def catalog_entry(state: Dict[str, Any], catalog_id: Optional[str]) -> Optional[Dict[str, Any]]:
+    """
+    Fila del catálogo para catalog_id: búsqueda indexada en la versión de
+    catalog.db de la sesión, o en su catalog_map (sesiones anteriores).
+    """
+    if not catalog_id:
+        return None
+    version = state.get("catalog_version")
+    if version is not None:
+        return CATALOG.get(version, catalog_id)
+    return (state.get("catalog_map") or {}).get(catalog_id)
+
+
+def prune_catalog() -> List[int]:
+    """Borra de catalog.db las versiones que ya no usa ninguna sesión."""
+    try:
+        return CATALOG.prune(STORE.catalog_versions(), keep_last=CATALOG_KEEP_VERSIONS)
+    except Exception:
+        return []  # sólo libera espacio: nunca debe romper la petición
+
+
 def extract_catalog_id_from_name(filename: str) -> Optional[str]:
     """Extrae ID tipo 'BO0624_5445' de nombres como 'BO0624_5445_00001.jpg'."""
     base = os.path.splitext(os.path.basename(filename))[0]
@@ -89,13 +321,17 @@ CSV_KEY_MAP = {
 }
 
 
+@lru_cache(maxsize=1024)
+def _canon_key(k: str) -> Optional[str]:
+    return CSV_KEY_MAP.get(str(k).strip().lower())
+
+
 def _normalize_row(row: Dict[str, Any]) -> Dict[str, Any]:
     out: Dict[str, Any] = {}
     for k, v in row.items():
         if k is None:
             continue
-        key = str(k).strip().lower()
-        canon = CSV_KEY_MAP.get(key)
+        canon = _canon_key(k)  # mismas cabeceras en todas las filas del CSV
         if canon:
             out[canon] = (v or "").strip()
     # Tipar año si es posible
@@ -140,15 +376,7 @@ def build_metadata_array(
     header["catalog_keywords"] = pick("catalog_keywords", "")
 
     # Asegurar nombres nuevos al día
-    for it in state["items"]:
-        it["new_filename"] = compute_new_name(
-            it["original_filename"],
-            it.get("type") or "sin-tipo",
-            it.get("page_number"),
-            it.get("number_scheme", "arabic"),
-            it.get("extra", ""),
-            it.get("ghost_number", False),
-        )
+    state = refresh_new_names(state)
 
     pages: List[Dict[str, Any]] = []
     for it in state["items"]:
@@ -184,11 +412,101 @@ def nice_export_basename(state: Dict[str, Any], session_id: str) -> str:
 
 
 # -------------------- Endpoints --------------------
+def _flag(value) -> bool:
+    return value in (True, 1, "1", "true", "yes")
+
+
+def item_view(state: Dict[str, Any], params) -> Optional[Dict[str, Any]]:
+    """
+    Respuesta reducida de ítems para los clientes que la piden (query o body JSON):
+    - since=<rev>: sólo ítems cambiados después de esa rev; si además se
+      añadieron o reordenaron ítems, "order" trae la lista completa de ids
+    - offset/limit: paginación sobre la lista (ya filtrada); "total" es su tamaño
+    - compact=1: sin "path" (ruta absoluta en el servidor)
+    None si no se pidió ninguno: la respuesta completa sigue siendo la de siempre.
+    ValueError si since/offset/limit no son enteros válidos.
+    """
+    if not any(params.get(k) not in (None, "") for k in ("since", "offset", "limit", "compact")):
+        return None
+    since = params.get("since")
+    since = int(since) if since not in (None, "") else None
+    offset = int(params.get("offset") or 0)
+    limit = params.get("limit")
+    limit = int(limit) if limit not in (None, "") else None
+    if (since is not None and since < 0) or offset < 0 or (limit is not None and limit < 0):
+        raise ValueError("negative value")
+
+    items = state["items"]
+    if since is not None:
+        items = [it for it in items if it.get("rev", 0) > since]
+    page = items[offset: offset + limit if limit is not None else None]
+    if _flag(params.get("compact")):
+        page = [{k: v for k, v in it.items() if k != "path"} for it in page]
+
+    view = {
+        "rev": state.get("rev"),
+        "count": len(state["items"]),
+        "total": len(items),
+        "offset": offset,
+        "limit": limit,
+        "items": page,
+    }
+    if since is not None:
+        view["since"] = since
+        if state.get("order_rev", 0) > since:
+            view["order"] = [it["id"] for it in state["items"]]
+    return view
+
+
+def items_response(state: Dict[str, Any], params, **fields):
+    """jsonify de {session_id, items} completo, o de la vista pedida (item_view)."""
+    try:
+        view = item_view(state, params)
+    except (TypeError, ValueError):
+        return jsonify({"error": "invalid since/offset/limit"}), 400
+    out = {"session_id": state["session_id"], **fields}
+    out.update(view if view is not None else {"items": state["items"]})
+    return jsonify(out)
+
+
 @app.route("/ping")
 def ping():
     return jsonify({"ok": True})
 
 
+@app.get("/model_info")
+def model_info():
+    """Estado del modelo CNN residente (versión, tiempo de carga, dispositivo)."""
+    return jsonify(get_registry().info())
+
+
+@app.get("/ocr_info")
+def ocr_info():
+    """Motor OCR en uso (pool persistente o pytesseract) y su tamaño."""
+    return jsonify(ocr_engine_info())
+
+
+@app.get("/cache_stats")
+def cache_stats():
+    """Contadores de las cachés de resultados y de vistas previas (aciertos, fallos, tamaño)."""
+    out = RESULT_CACHE.stats()
+    out["previews"] = PREVIEW_CACHE.stats()
+    out["blobs"] = BLOBS.stats()
+    return jsonify(out)
+
+
+@app.get("/metrics")
+def metrics():
+    """Métricas en formato de texto Prometheus (suma de todos los workers)."""
+    return Response(REGISTRY.exposition(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.post("/model_warmup")
+def model_warmup():
+    """Carga el modelo (si existe) y ejecuta una pasada de prueba."""
+    return jsonify(get_registry().warm_up())
+
+
 # ---------- Etiqueta de sesión (nombre amigable) ----------
 @app.get("/session_label_get")
 def session_label_get():
@@ -207,11 +525,12 @@ def session_label_set():
     session_id = data.get("session_id")
     if not session_id:
         return jsonify({"error": "missing session_id"}), 400
-    st = get_state(session_id)
-    if not st:
+    if not get_state(session_id):
         return jsonify({"error": "session not found"}), 404
     label = (data.get("label") or "").strip() or None
-    st["label"] = label
+    with STORE.locked(session_id) as st:
+        st["label"] = label
+        STORE.save_session(st)
     return jsonify({"session_id": session_id, "label": label or ""})
 
 
@@ -223,10 +542,9 @@ def upload():
     - Detecta catalog_id desde el primer archivo y vincula entrada del CSV si existe.
     """
     session_id = request.form.get("session_id") or str(uuid.uuid4())
+    if bad_session_id(session_id):
+        return jsonify({"error": "invalid session_id"}), 400
     session_dir, orig_dir = ensure_session_dirs(WORKSPACE, session_id)
-    state = get_state(session_id) or new_session_state(session_id)
-    SESSIONS[session_id] = state
-    ensure_catalog(state)
 
     files = request.files.getlist("files")
     if not files:
@@ -236,32 +554,162 @@ def upload():
     if not files:
         return jsonify({"error": "missing files", "hint": "Use field 'files' (multiple) or 'file' (single)"}), 400
 
+    paths = []
     for f in files:
         if not f or not is_allowed(f.filename):
             continue
         path = save_upload(f, orig_dir)
+        BLOBS.adopt(path, session_id)  # un contenido ya visto se enlaza al existente
+        paths.append(path)
+    state, _ = add_uploaded_files(session_id, session_dir, paths)
+
+    return jsonify({
+        "session_id": session_id,
+        "label": state.get("label") or "",
+        "count": len(state["items"]),
+        "items": state["items"],
+        "catalog": state["catalog"]
+    })
+
+
+def add_uploaded_files(session_id: str, session_dir: str, paths: List[str]):
+    """
+    Da de alta en la sesión archivos ya guardados en originals/ (atómico,
+    bajo lock) y encola sus miniaturas. Devuelve (estado, ítems añadidos).
+    """
+    added = []
+    for path in paths:
         image_id = str(uuid.uuid4())
         item = new_item(image_id, path, os.path.basename(path))
         item.setdefault("keywords", "")  # campo por página
-        state["items"].append(item)
-        make_thumbnail(path, thumb_path(session_dir, image_id))
-
-    # Orden por nombre original
-    state["items"].sort(key=lambda x: x["original_filename"])
-
-    # Detectar ID de catálogo con el primer archivo
-    if state["items"]:
-        first_name = state["items"][0]["original_filename"]
-        detected = extract_catalog_id_from_name(first_name)
-        state["catalog"]["detected_id"] = detected
-        entry = state.get("catalog_map", {}).get(detected) if detected else None
-        state["catalog"]["entry"] = entry
+        item["new_filename"] = _new_name(item)
+        added.append(item)
+        THUMBS.submit(path, session_dir, image_id, digest=file_digest(path))
+
+    with STORE.locked(session_id, create=True) as state:
+        ensure_catalog(state)
+        if not state["items"]:
+            state["names_version"] = NAMES_VERSION  # sesión nueva: nombres ya calculados
+        state["items"].extend(added)
+
+        # Orden por nombre original
+        state["items"].sort(key=lambda x: x["original_filename"])
+
+        # Detectar ID de catálogo con el primer archivo
+        if state["items"]:
+            first_name = state["items"][0]["original_filename"]
+            detected = extract_catalog_id_from_name(first_name)
+            state["catalog"]["detected_id"] = detected
+            state["catalog"]["entry"] = catalog_entry(state, detected)
+
+        STORE.save(state)
+    return state, added
+
+
+@app.post("/session_delete")
+def session_delete():
+    """
+    Borra una sesión: estado, directorio y sus referencias en el blob store
+    (los originales que ya no usa ninguna sesión se eliminan).
+    """
+    data = request.get_json(force=True)
+    session_id = data.get("session_id")
+    if bad_session_id(session_id):
+        return jsonify({"error": "invalid session_id"}), 400
+    if not get_state(session_id):
+        return jsonify({"error": "session not found"}), 404
+    if JOBS.active_for_session(session_id, "classify"):
+        return jsonify({"error": "session has a running job"}), 409
+    STORE.delete(session_id)
+    freed = BLOBS.release_session(session_id)
+    shutil.rmtree(os.path.join(WORKSPACE, session_id), ignore_errors=True)
+    pruned = prune_catalog()
+    return jsonify({"ok": True, "session_id": session_id, "blobs_removed": len(freed),
+                    "catalog_versions_removed": len(pruned)})
+
+
+# ---------- Subida por trozos (reanudable) ----------
+def _upload_error(e: UploadError):
+    return jsonify({"error": str(e), **e.fields}), e.status
+
+
+@app.post("/upload_init")
+def upload_init():
+    """
+    Inicia (o retoma) una subida por trozos.
+    Body JSON: {session_id?, filename, size, sha256?}
+    Devuelve upload_id, offset ya recibido y chunk_size sugerido.
+    """
+    data = request.get_json(force=True)
+    session_id = data.get("session_id") or str(uuid.uuid4())
+    if bad_session_id(session_id):
+        return jsonify({"error": "invalid session_id"}), 400
+    ensure_session_dirs(WORKSPACE, session_id)
+    try:
+        info = UPLOADS.init(session_id, data.get("filename"), data.get("size"), data.get("sha256"))
+    except (TypeError, ValueError):
+        return jsonify({"error": "invalid size"}), 400
+    except UploadError as e:
+        return _upload_error(e)
+    return jsonify({"session_id": session_id, **info})
+
+
+@app.put("/upload_chunk")
+def upload_chunk():
+    """
+    Escribe un trozo: PUT /upload_chunk?session_id=..&upload_id=..&offset=N
+    con los bytes en el cuerpo (se vuelcan a disco en streaming). Si el offset
+    no cuadra responde 409 con el offset correcto para reanudar.
+    """
+    session_id = request.args.get("session_id")
+    if bad_session_id(session_id):
+        return jsonify({"error": "invalid session_id"}), 400
+    try:
+        info = UPLOADS.write_chunk(
+            session_id, request.args.get("upload_id"), request.args.get("offset", type=int),
+            request.stream, request.content_length,
+        )
+    except UploadError as e:
+        return _upload_error(e)
+    return jsonify({"session_id": session_id, **info})
+
+
+@app.get("/upload_status")
+def upload_status():
+    """Bytes recibidos de una subida (para reanudar tras un corte)."""
+    session_id = request.args.get("session_id")
+    if bad_session_id(session_id):
+        return jsonify({"error": "invalid session_id"}), 400
+    try:
+        info = UPLOADS.status(session_id, request.args.get("upload_id"))
+    except UploadError as e:
+        return _upload_error(e)
+    return jsonify({"session_id": session_id, **info})
+
+
+@app.post("/upload_finalize")
+def upload_finalize():
+    """
+    Cierra una subida: comprueba tamaño y sha256 (si se dio en init o aquí),
+    mueve el archivo a originals/ y lo añade a la sesión.
+    Body JSON: {session_id, upload_id, sha256?}
+    """
+    data = request.get_json(force=True)
+    session_id = data.get("session_id")
+    if bad_session_id(session_id):
+        return jsonify({"error": "invalid session_id"}), 400
+    try:
+        path, digest, reused = UPLOADS.finalize(session_id, data.get("upload_id"), data.get("sha256"))
+    except UploadError as e:
+        return _upload_error(e)
 
+    state, added = add_uploaded_files(session_id, os.path.join(WORKSPACE, session_id), [path])
     return jsonify({
         "session_id": session_id,
-        "label": state.get("label") or "",
+        "sha256": digest,
+        "duplicate": reused,
+        "item": added[0],
         "count": len(state["items"]),
-        "items": state["items"],
         "catalog": state["catalog"]
     })
 
@@ -272,39 +720,27 @@ def upload_csv():
     Carga un CSV maestro (opcional).
     - Acepta 'file' o 'csv'
     - Si no se provee session_id, crea uno
-    - Normaliza cabeceras y guarda un mapa id->fila
+    - Normaliza cabeceras y lo vuelca en streaming a catalog.db como nueva
+      versión (un CSV idéntico ya cargado reutiliza su versión sin reprocesarlo);
+      la sesión guarda sólo catalog_version
     - Si hay imágenes, intenta detectar catalog_id y vincular entrada
     """
     session_id = request.form.get("session_id") or str(uuid.uuid4())
-    state = get_state(session_id) or new_session_state(session_id)
-    SESSIONS[session_id] = state
-    ensure_catalog(state)
-
+    if bad_session_id(session_id):
+        return jsonify({"error": "invalid session_id"}), 400
     f = request.files.get("file") or request.files.get("csv")
     if not f:
         return jsonify({"error": "missing CSV file. Use field 'file' or 'csv'"}), 400
 
     try:
-        raw = f.read()
-        text = raw.decode("utf-8-sig", errors="ignore")
-
-        # Detectar delimitador
-        sample = "\n".join(text.splitlines()[:5])
-        try:
-            dialect = csv.Sniffer().sniff(sample)
-        except Exception:
-            class _D: delimiter = ','
-            dialect = _D()
-
-        reader = csv.DictReader(io.StringIO(text), dialect=dialect)
-        catalog_map = {}
-        for row in reader:
-            norm = _normalize_row(row)
-            cid = norm.get("catalog_id")
-            if cid:
-                catalog_map[cid] = norm
+        loaded = CATALOG.ingest(f.stream, _normalize_row, source=f.filename or "")
+    except Exception as e:
+        return jsonify({"error": f"CSV parse error: {e}"}), 400
 
-        state["catalog_map"] = catalog_map
+    with STORE.locked(session_id, create=True) as state:
+        ensure_catalog(state)
+        state["catalog_version"] = loaded["version"]
+        state.pop("catalog_map", None)  # copia por sesión de versiones anteriores
 
         # Si ya hay imágenes cargadas, intenta detectar ID del primer archivo
         detected = state.get("catalog", {}).get("detected_id")
@@ -314,19 +750,21 @@ def upload_csv():
             state["catalog"]["detected_id"] = detected
 
         # Vincular entrada si existe
-        entry = catalog_map.get(detected) if detected else None
+        entry = catalog_entry(state, detected)
         state["catalog"]["entry"] = entry
+        STORE.save_session(state)
+    prune_catalog()  # la versión anterior de esta sesión puede haber quedado sin uso
 
-        return jsonify({
-            "ok": True,
-            "session_id": session_id,
-            "label": state.get("label") or "",
-            "loaded": len(catalog_map),
-            "detected_id": detected,
-            "entry": entry
-        })
-    except Exception as e:
-        return jsonify({"error": f"CSV parse error: {e}"}), 400
+    return jsonify({
+        "ok": True,
+        "session_id": session_id,
+        "label": state.get("label") or "",
+        "loaded": loaded["rows"],
+        "catalog_version": loaded["version"],
+        "reused": loaded["reused"],
+        "detected_id": detected,
+        "entry": entry
+    })
 
 
 @app.get("/catalog_status")
@@ -340,8 +778,11 @@ def catalog_status():
         return jsonify({"error": "session not found"}), 404
     ensure_catalog(state)
     detected = state["catalog"].get("detected_id")
-    entry = state.get("catalog_map", {}).get(detected) if detected else None
-    state["catalog"]["entry"] = entry
+    entry = catalog_entry(state, detected)
+    if state["catalog"].get("entry") != entry:
+        with STORE.locked(session_id) as st:
+            ensure_catalog(st)["entry"] = entry
+            STORE.save_session(st)
     return jsonify({
         "session_id": session_id,
         "label": state.get("label") or "",
@@ -350,6 +791,93 @@ def catalog_status():
     })
 
 
+CLASSIFY_FLUSH_EVERY = max(1, int(os.environ.get("CLASSIFY_FLUSH_EVERY", "50")))
+
+
+def _keeps_edit(it: Dict[str, Any], rev: Optional[int]) -> bool:
+    """True si el ítem se validó o cambió (rev) desde que empezó la clasificación."""
+    return bool(it.get("validated")) or it.get("rev") != rev
+
+
+def _save_types(session_id: str, results: List[tuple]) -> None:
+    """
+    Aplica (image_id, tipo, rev inicial) sobre el estado vigente y lo persiste
+    (bajo lock). Los ítems validados o editados entretanto (p.ej. con
+    /validate mientras corre un job) se dejan como están.
+    """
+    if not results:
+        return
+    with STORE.locked(session_id) as st:
+        if st is None:
+            return
+        touched = []
+        for iid, t, rev in results:
+            it = st.get_item(iid)
+            if it is not None and not _keeps_edit(it, rev):
+                st.set_fields(it, {"type": t, "validated": False})
+                touched.append(it)
+        apply_renames(st)
+        STORE.save_items(st, touched)
+
+
+def run_classification(state: Dict[str, Any], opts: Dict[str, Any], job: Optional[Job] = None) -> None:
+    """
+    Clasifica todos los ítems de la sesión (CNN por lotes + heurísticas en paralelo).
+    Cada ítem se actualiza en el estado en cuanto termina, de modo que /session
+    muestra resultados parciales; se persisten por tandas (CLASSIFY_FLUSH_EVERY)
+    y al terminar sobre el estado vigente en la base de datos, sin pisar
+    ediciones hechas entretanto: los ítems validados, o cuyo rev cambió desde
+    el inicio, conservan su tipo. Si se pasa un job, informa progreso y se
+    detiene al cancelarlo.
+    """
+    items = list(state["items"])
+    revs = [it.get("rev") for it in items]
+    names = [it["original_filename"] for it in items]
+    paths = [it["path"] for it in items]
+
+    # CNN por lotes sobre toda la sesión; lo que no resuelva va a heurísticas.
+    # Con job: etapa "cnn" con su propio progreso y cancelación entre lotes
+    should_stop = progress = None
+    if job is not None:
+        job.set_stage("cnn", len(items))
+        should_stop, progress = (lambda: job.cancelled), job.advance
+    preds = cnn_predictions(
+        paths, batch_size=opts.get("batch_size"), cache=RESULT_CACHE,
+        should_stop=should_stop, progress=progress,
+    )
+    if job is not None:
+        if job.cancelled:
+            return
+        job.set_stage("classify", len(items))
+
+    # Heurísticas en paralelo (pool de procesos), resultados en orden original;
+    # las páginas ya vistas (mismo contenido) salen de la caché
+    results = iter_classify_items(
+        paths, names, preds,
+        workers=opts.get("workers"),
+        chunksize=opts.get("chunksize"),
+        cache=RESULT_CACHE,
+    )
+    pending: List[tuple] = []
+    try:
+        for idx, t in results:
+            it = items[idx]
+            if not _keeps_edit(it, revs[idx]):
+                it["type"] = t
+                it["validated"] = False
+            pending.append((it["id"], t, revs[idx]))
+            if len(pending) >= CLASSIFY_FLUSH_EVERY:
+                _save_types(state["session_id"], pending)
+                pending = []
+            if job is not None:
+                job.record(it["id"], t)
+                if job.cancelled:
+                    break
+    finally:
+        results.close()
+        _save_types(state["session_id"], pending)
+
+
 @app.route("/classify", methods=["POST"])
 def classify():
     """Clasificación automática (CNN ligera + heurísticas)."""
@@ -359,21 +887,57 @@ def classify():
     if not state:
         return jsonify({"error": "session not found"}), 404
 
-    names = [it["original_filename"] for it in state["items"]]
-    total = len(state["items"])
-    for idx, it in enumerate(state["items"]):
-        try:
-            with Image.open(it["path"]) as im:
-                pred = predict_with_cnn(im)
-                if pred:
-                    it["type"] = pred
-                else:
-                    it["type"] = guess_type(im, it["original_filename"], idx, total, names)
-        except Exception:
-            it["type"] = "text"
-        it["validated"] = False
+    run_classification(state, data)
+    state = get_state(session_id)
+    return items_response(state, data)
+
+
+@app.post("/classify_async")
+def classify_async():
+    """
+    Lanza la clasificación en segundo plano y devuelve un job_id al instante.
+    Progreso en /job_status, cancelación en /job_cancel.
+    """
+    data = request.get_json(force=True)
+    session_id = data.get("session_id")
+    state = get_state(session_id)
+    if not state:
+        return jsonify({"error": "session not found"}), 404
+
+    running = JOBS.active_for_session(session_id, "classify")
+    if running:
+        return jsonify(running.to_dict(with_results=False)), 202
+
+    job = JOBS.submit(
+        "classify", session_id, len(state["items"]),
+        lambda j: run_classification(state, data, job=j),
+    )
+    return jsonify(job.to_dict(with_results=False)), 202
 
-    return jsonify({"session_id": session_id, "items": state["items"]})
+
+@app.get("/job_status")
+def job_status():
+    """Progreso de un job: hechos/total, ETA y resultados parciales por ítem."""
+    job_id = request.args.get("job_id")
+    if not job_id:
+        return jsonify({"error": "missing job_id"}), 400
+    job = JOBS.get(job_id)
+    if not job:
+        return jsonify({"error": "job not found"}), 404
+    with_results = request.args.get("results", "1") not in ("0", "false")
+    return jsonify(job.to_dict(with_results=with_results))
+
+
+@app.post("/job_cancel")
+def job_cancel():
+    data = request.get_json(force=True)
+    job_id = data.get("job_id")
+    if not job_id:
+        return jsonify({"error": "missing job_id"}), 400
+    job = JOBS.cancel(job_id)
+    if not job:
+        return jsonify({"error": "job not found"}), 404
+    return jsonify(job.to_dict(with_results=False))
 
 
 @app.route("/validate", methods=["POST"])
@@ -384,26 +948,42 @@ def validate():
     - session_id
     - updates: [ {id, type?, validated?, page_number?, number_scheme?, extra?, ghost_number?, graphic?, keywords?}, ... ]
     - bulk_numbering: { ids: [..], start: int, step: int, scheme: "arabic"|"roman", extra: "", ghost: bool }
+    - rev (opcional): rev de la sesión que vio el cliente; si ya cambió -> 409
+    - since/offset/limit/compact (opcional): respuesta reducida (ver item_view)
+    Se aplica bajo el lock de escritura de la sesión (seguro con varios workers).
     """
     data = request.get_json(force=True)
     session_id = data.get("session_id")
-    state = get_state(session_id)
-    if not state:
+    if not get_state(session_id):
         return jsonify({"error": "session not found"}), 404
 
+    with STORE.locked(session_id) as state:
+        if state is None:
+            return jsonify({"error": "session not found"}), 404
+        expected = data.get("rev")
+        if expected is not None and expected != state.get("rev"):
+            return jsonify({"error": "session changed", "rev": state.get("rev")}), 409
+        _apply_validation(state, data)
+
+    return items_response(state, data, rev=state.get("rev"))
+
+
+def _apply_validation(state: Dict[str, Any], data: Dict[str, Any]) -> None:
+    """Aplica updates y bulk_numbering de /validate y persiste los ítems tocados."""
     updates = data.get("updates", [])
-    id2item = {it["id"]: it for it in state["items"]}
+    touched: Dict[str, Dict[str, Any]] = {}
 
     # Apply direct updates
     for u in updates:
-        it = id2item.get(u.get("id"))
+        it = state.get_item(u.get("id"))
         if not it:
             continue
-        for field in ["type", "validated", "number_scheme", "extra", "ghost_number", "graphic", "keywords"]:
-            if field in u:
-                it[field] = u[field]
-        if "page_number" in u:
-            it["page_number"] = u["page_number"]
+        touched[it["id"]] = it
+        state.set_fields(it, {
+            field: u[field]
+            for field in ["type", "validated", "page_number", "number_scheme", "extra", "ghost_number", "graphic", "keywords"]
+            if field in u
+        })
 
     # Bulk numbering
     bn = data.get("bulk_numbering")
@@ -416,35 +996,27 @@ def validate():
         ghost = bool(bn.get("ghost", False))
         n = start
         for iid in ids:
-            it = id2item.get(iid)
+            it = state.get_item(iid)
             if not it:
                 continue
-            it["page_number"] = n
-            it["number_scheme"] = scheme
-            it["extra"] = extra
-            it["ghost_number"] = ghost
+            touched[it["id"]] = it
+            state.set_fields(it, {"page_number": n, "number_scheme": scheme, "extra": extra, "ghost_number": ghost})
             n += step
 
-    return jsonify({"session_id": session_id, "items": state["items"]})
+    # Sólo los ítems con campos de nombre tocados se renombran
+    apply_renames(state)
+    STORE.save_items(state, touched.values())
 
 
 @app.route("/preview", methods=["GET"])
 def preview():
-    """Actualiza y devuelve nombres nuevos (para UI)."""
+    """Actualiza y devuelve nombres nuevos (para UI). Admite since/offset/limit/compact."""
     session_id = request.args.get("session_id")
     state = get_state(session_id)
     if not state:
         return jsonify({"error": "session not found"}), 404
-    for it in state["items"]:
-        it["new_filename"] = compute_new_name(
-            it["original_filename"],
-            it.get("type") or "sin-tipo",
-            it.get("page_number"),
-            it.get("number_scheme", "arabic"),
-            it.get("extra", ""),
-            it.get("ghost_number", False)
-        )
-    return jsonify({"session_id": session_id, "items": state["items"]})
+    state = refresh_new_names(state)
+    return items_response(state, request.args)
 
 
 # ------- Export preview (para modal en el frontend) -------
@@ -470,8 +1042,14 @@ def export():
     """
     Genera ZIP con:
     - metadata.json (primer objeto = catálogo, luego cada página)
-    - todas las imágenes renombradas (copiadas con new_filename en raíz del ZIP)
-    Admite 'catalog_override' para sobreescribir campos del catálogo.
+    - todas las imágenes renombradas (con new_filename en raíz del ZIP;
+      enlazadas con hardlink/reflink en export/ cuando es posible)
+    - derivados opcionales en derivatives/<formato>_<tamaño>/
+    Admite 'catalog_override' para sobreescribir campos del catálogo y
+    'derivatives': [{"format": "jpeg"|"webp", "max_size": 1600, "quality": 85}].
+    Los fallos por archivo van en export_errors.json y en X-Export-Errors.
+    Incremental: sólo se rehacen las entradas cambiadas desde la última
+    exportación (X-Export-Cached / X-Export-Reused).
     """
     data = request.get_json(force=True)
     session_id = data.get("session_id")
@@ -482,71 +1060,81 @@ def export():
         return jsonify({"error": "session not found"}), 404
 
     catalog_override = data.get("catalog_override") or {}
+    state = refresh_new_names(state)
 
     # Construir metadata (y asegurar new_filename al día)
     metadata_array = build_metadata_array(state, catalog_override=catalog_override)
 
-    # Directorio de exportación limpio
-    export_dir = os.path.join(WORKSPACE, session_id, "export")
-    if os.path.isdir(export_dir):
-        shutil.rmtree(export_dir)
-    os.makedirs(export_dir, exist_ok=True)
+    # Exportación incremental: export/ y el ZIP se actualizan sólo en las
+    # entradas cuyo nombre o contenido cambió (manifest en la sesión);
+    # si nada cambió se devuelve el ZIP anterior tal cual.
+    # Los originales se colocan con hardlink/reflink (o copia);
+    # transcodificación y derivados en un pool de procesos.
+    session_dir = os.path.join(WORKSPACE, session_id)
+    export_dir = os.path.join(session_dir, "export")
+    # (nombre de archivo físico interno fijo; el que ve el usuario va en download_name)
+    zip_path = os.path.join(session_dir, f"export_{session_id}.zip")
+    files = [(it["path"], it["new_filename"]) for it in state["items"]]
+    derivatives = parse_derivatives(data.get("derivatives"))
+    report = incremental_export(
+        session_dir, export_dir, zip_path, files, metadata_array,
+        derivatives=derivatives, workers=data.get("workers"),
+    )
 
-    # Escribir metadata.json
-    meta_path = os.path.join(export_dir, "metadata.json")
-    with open(meta_path, "w", encoding="utf-8") as f:
-        json.dump(metadata_array, f, ensure_ascii=False, indent=2)
+    # <- aquí aplicamos el nombre "bonito"
+    pretty = nice_export_basename(state, session_id)
+    download_name = f"export_{pretty}.zip"
+    resp = send_file(zip_path, as_attachment=True, download_name=download_name)
+    EXPORT_BYTES.inc(os.path.getsize(zip_path), mode="zip")
+    resp.headers["X-Export-Cached"] = "1" if report["cached"] else "0"
+    resp.headers["X-Export-Reused"] = str(report["reused"])
+    resp.headers["X-Export-Files"] = str(len(report["files"]))
+    resp.headers["X-Export-Derivatives"] = str(len(report["derivatives"]))
+    resp.headers["X-Export-Errors"] = str(len(report["errors"]))
+    if report["errors"]:
+        resp.headers["X-Export-Error-Files"] = json.dumps([e["file"] for e in report["errors"][:20]], ensure_ascii=True)
+    return resp
+
+
+@app.route("/export_stream", methods=["GET", "POST"])
+def export_stream():
+    """
+    Exportación en streaming: el ZIP se genera al vuelo directamente desde
+    los originales (con su new_filename), sin copias intermedias en disco.
+    - metadata.json va primero
+    - JPEG/PNG (y TIFF comprimidos) se guardan sin recomprimir (ZIP_STORED)
+    - ZIP64 para volúmenes > 4 GB; memoria constante
+    Los archivos ilegibles se omiten y se listan en export_errors.json al final.
+    Acepta session_id (query o JSON) y catalog_override (JSON).
+    """
+    data = request.get_json(silent=True) or {}
+    session_id = data.get("session_id") or request.args.get("session_id")
+    if not session_id:
+        return jsonify({"error": "missing session_id"}), 400
+    state = get_state(session_id)
+    if not state:
+        return jsonify({"error": "session not found"}), 404
 
-    # Copiar imágenes con el nuevo nombre en export_dir
-    for it in state["items"]:
-        src = it["path"]
-        new_name = it.get("new_filename") or compute_new_name(
-            it["original_filename"],
-            it.get("type") or "sin-tipo",
-            it.get("page_number"),
-            it.get("number_scheme", "arabic"),
-            it.get("extra", ""),
-            it.get("ghost_number", False),
-        )
-        dst = os.path.join(export_dir, new_name)
-        os.makedirs(os.path.dirname(dst), exist_ok=True)
-        try:
-            shutil.copy2(src, dst)
-        except Exception:
-            try:
-                with Image.open(src) as im:
-                    im = ImageOps.exif_transpose(im)
-                    if im.mode in ("RGBA", "LA", "P"):
-                        im = im.convert("RGBA")
-                        bg = Image.new("RGB", im.size, (255, 255, 255))
-                        bg.paste(im, mask=im.split()[-1])
-                        im = bg
-                    elif im.mode not in ("RGB",):
-                        im = im.convert("RGB")
-                    base_no_ext, _ = os.path.splitext(dst)
-                    dst = base_no_ext + ".jpg"
-                    im.save(dst, format="JPEG", quality=90)
-            except Exception:
-                continue
+    catalog_override = data.get("catalog_override") or {}
+    state = refresh_new_names(state)
+    metadata_array = build_metadata_array(state, catalog_override=catalog_override)
+    meta_bytes = json.dumps(metadata_array, ensure_ascii=False, indent=2).encode("utf-8")
+    items = [(it["new_filename"], it["path"]) for it in state["items"]]
+    errors: List[Dict[str, Any]] = []
 
-    # Crear ZIP (nombre de archivo físico interno puede ser fijo,
-    # el nombre que ve el usuario lo controlamos con download_name)
-    zip_path = os.path.join(WORKSPACE, session_id, f"export_{session_id}.zip")
-    if os.path.exists(zip_path):
-        os.remove(zip_path)
-    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
-        zf.write(meta_path, arcname="metadata.json")
-        for name in os.listdir(export_dir):
-            if name == "metadata.json":
-                continue
-            full = os.path.join(export_dir, name)
-            if os.path.isfile(full):
-                zf.write(full, arcname=name)
+    def entries():
+        yield "metadata.json", meta_bytes
+        for name, path in items:
+            yield name, path
+        if errors:
+            yield "export_errors.json", json.dumps(errors, ensure_ascii=False, indent=2).encode("utf-8")
 
-    # <- aquí aplicamos el nombre "bonito"
     pretty = nice_export_basename(state, session_id)
-    download_name = f"export_{pretty}.zip"
-    return send_file(zip_path, as_attachment=True, download_name=download_name)
+    return Response(
+        stream_with_context(metered_stream(stream_zip(entries(), errors=errors), "export.stream", "stream")),
+        mimetype="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="export_{pretty}.zip"'},
+    )
 
 
 # -------------------- Archivos / Previews --------------------
@@ -556,7 +1144,13 @@ def session_state():
     state = get_state(session_id)
     if not state:
         return jsonify({"error": "session not found"}), 404
-    return jsonify(state)
+    try:
+        view = item_view(state, request.args)
+    except ValueError:
+        return jsonify({"error": "invalid since/offset/limit"}), 400
+    if view is None:
+        return jsonify(state)
+    return jsonify({**state, **view})
 
 
 @app.route("/file/<session_id>/<image_id>", methods=["GET"])
@@ -564,58 +1158,82 @@ def serve_file(session_id, image_id):
     state = get_state(session_id)
     if not state:
         return jsonify({"error": "session not found"}), 404
-    for it in state["items"]:
-        if it["id"] == image_id:
-            return send_file(it["path"])
-    return jsonify({"error": "image not found"}), 404
+    it = state.get_item(image_id)
+    if not it:
+        return jsonify({"error": "image not found"}), 404
+    return send_file(it["path"])
 
 
 @app.route("/thumb/<session_id>/<image_id>", methods=["GET"])
 def serve_thumb(session_id, image_id):
+    """
+    Miniatura. ?size=150|300|600 (se ajusta a THUMB_SIZES) y ?format=jpeg|webp;
+    sin parámetros, la JPEG de 300 px de siempre.
+    Si aún se está generando responde 202 {"status": "pending"} con Retry-After.
+    """
     session_dir = os.path.join(WORKSPACE, session_id)
-    p = os.path.join(session_dir, "thumbs", f"{image_id}.jpg")
+    size = snap_size(request.args.get("size", type=int))
+    fmt = (request.args.get("format") or "jpeg").lower().replace("jpg", "jpeg")
+    if fmt not in THUMB_FORMATS:
+        fmt = "jpeg"
+    p = thumb_file(session_dir, image_id, size, fmt)
     if os.path.exists(p):
-        return send_file(p)
+        return send_file(p, max_age=PREVIEW_MAX_AGE)
+
+    state = get_state(session_id)
+    it = state.get_item(image_id) if state else None
+    status = THUMBS.status(session_dir, image_id, src=it["path"] if it else None, path=p)
+    if status == "ready":
+        return send_file(p, max_age=PREVIEW_MAX_AGE)
+    if status == "pending":
+        resp = jsonify({"status": "pending", "session_id": session_id, "image_id": image_id})
+        resp.status_code = 202
+        resp.headers["Retry-After"] = "1"
+        return resp
+    if status == "failed":
+        return jsonify({"status": "failed", "error": "thumbnail generation failed"}), 500
     return jsonify({"error": "thumb not found"}), 404
 
 
 @app.route("/file_preview/<session_id>/<image_id>", methods=["GET"])
 def serve_preview(session_id, image_id):
     """
-    Renderiza una vista previa web-segura (JPEG). Soporta ?w=1600 para limitar ancho.
+    Vista previa web-segura (JPEG). Soporta ?w=1600 para limitar ancho y ?q= (calidad).
+    El ancho se normaliza al siguiente de PREVIEW_WIDTHS y la imagen sale de la
+    caché de renditions (se renderiza sólo la primera vez). Responde con
+    ETag/Last-Modified/Cache-Control y 304 si el navegador ya la tiene.
     """
     state = get_state(session_id)
     if not state:
         return jsonify({"error": "session not found"}), 404
 
-    for it in state["items"]:
-        if it["id"] == image_id:
-            try:
-                with Image.open(it["path"]) as im:
-                    im = ImageOps.exif_transpose(im)
-                    if im.mode in ("RGBA", "LA", "P"):
-                        im = im.convert("RGBA")
-                        bg = Image.new("RGB", im.size, (255, 255, 255))
-                        bg.paste(im, mask=im.split()[-1])
-                        im = bg
-                    elif im.mode not in ("RGB",):
-                        im = im.convert("RGB")
-
-                    w = request.args.get("w", type=int)
-                    if w and w < im.width:
-                        h = int(im.height * (w / im.width))
-                        im = im.resize((w, h), Image.LANCZOS)
-
-                    buf = io.BytesIO()
-                    im.save(buf, format="JPEG", quality=85)
-                    buf.seek(0)
-                    return send_file(buf, mimetype="image/jpeg")
-            except Exception as e:
-                return jsonify({"error": f"cannot render preview: {e}"}), 500
-
-    return jsonify({"error": "image not found"}), 404
+    it = state.get_item(image_id)
+    if not it:
+        return jsonify({"error": "image not found"}), 404
+    width = snap_width(request.args.get("w", type=int), PREVIEW_CACHE.widths)
+    quality = min(95, max(40, request.args.get("q", 85, type=int)))
+    try:
+        digest = file_digest(it["path"])
+        if not digest:
+            return jsonify({"error": "image not found"}), 404
+        path = PREVIEW_CACHE.get_or_render(it["path"], digest, width, quality)
+    except Exception as e:
+        return jsonify({"error": f"cannot render preview: {e}"}), 500
+
+    resp = send_file(
+        path,
+        mimetype="image/jpeg",
+        etag=PREVIEW_CACHE.rendition_key(digest, width, quality),
+        last_modified=os.path.getmtime(it["path"]),
+        max_age=PREVIEW_MAX_AGE,
+        conditional=True,
+    )
+    resp.headers["Cache-Control"] = f"private, max-age={PREVIEW_MAX_AGE}, must-revalidate"
+    return resp
 
 
 # -------------------- App --------------------
 if __name__ == "__main__":
+    get_registry().warm_up()
+    warm_up_ocr()
     app.run(host="0.0.0.0", port=5001, debug=True)
@@ -0,0 +1,88 @@
+"""
+Per-image lookup latency vs. session size.
+
+Compares the old access pattern (linear scan of state["items"] in /file and
+/file_preview, id2item dict rebuilt on every /validate) with the indexed
+SessionState lookups. Indexed times should stay flat as the session grows.
+
+Run from backend/:
+
+    python -m benchmarks.bench_item_lookup --sizes 100 1000 2000 10000 --json lookup.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.metadata_store import new_session_state, new_item  # noqa: E402
+
+
+def _make_state(n):
+    state = new_session_state("bench")
+    for i in range(n):
+        state["items"].append(new_item(f"id-{i:06d}", f"/tmp/p{i}.jpg", f"BO0624_4866_{i:06d}.jpg"))
+    return state
+
+
+def _linear(state, image_id):
+    for it in state["items"]:
+        if it["id"] == image_id:
+            return it
+    return None
+
+
+def _rebuild(state, image_id):
+    id2item = {it["id"]: it for it in state["items"]}
+    return id2item.get(image_id)
+
+
+def _per_call_us(fn, state, ids):
+    t0 = time.perf_counter()
+    for iid in ids:
+        fn(state, iid)
+    return (time.perf_counter() - t0) / len(ids) * 1e6
+
+
+def bench(sizes, lookups=2000, seed=0):
+    rng = random.Random(seed)
+    rows = []
+    for n in sizes:
+        state = _make_state(n)
+        ids = [f"id-{rng.randrange(n):06d}" for _ in range(lookups)]
+        state.get_item(ids[0])  # index built once, as after the first request
+        rows.append({
+            "items": n,
+            "linear_scan_us": _per_call_us(_linear, state, ids),
+            "rebuild_dict_us": _per_call_us(_rebuild, state, ids[: max(1, lookups // 10)]),
+            "indexed_us": _per_call_us(lambda s, i: s.get_item(i), state, ids),
+            "position_us": _per_call_us(lambda s, i: s.position(i), state, ids),
+        })
+    return {"lookups": lookups, "sizes": rows}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[100, 500, 2000, 10000])
+    ap.add_argument("--lookups", type=int, default=2000)
+    ap.add_argument("--json", help="write the report to this file")
+    args = ap.parse_args(argv)
+
+    report = bench(args.sizes, lookups=args.lookups)
+
+    print(f"{'items':>7} {'scan us':>10} {'rebuild us':>11} {'index us':>9} {'pos us':>7}")
+    for r in report["sizes"]:
+        print(f"{r['items']:>7} {r['linear_scan_us']:>10.2f} {r['rebuild_dict_us']:>11.2f} "
+              f"{r['indexed_us']:>9.3f} {r['position_us']:>7.3f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
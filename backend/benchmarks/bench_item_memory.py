@@ -0,0 +1,126 @@
+"""
+Memory per item and JSON serialization time: plain dicts vs. Item (slots).
+
+Items are built the way a session is restored from sessions.db (one
+json.loads per row), which is how large sessions live in memory after a
+restart: with dicts, every item carries its own copies of the path, type
+and scheme strings. Memory is measured with tracemalloc.
+
+JSON is timed the way responses are built, with Flask's settings (sorted
+keys, compact): dicts through json.dumps, and items both through
+to_dict() as a default= fallback and through Item.to_json, which the app's
+JSON provider uses for "items".
+
+Run from backend/:
+
+    python -m benchmarks.bench_item_memory --sizes 10000 100000 --json memory.json
+"""
+
+import os
+import sys
+import gc
+import json
+import time
+import uuid
+import random
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.metadata_store import Item, as_dict  # noqa: E402
+
+TYPES = ["cover", "endpapers", "blank page", "illustration", "text", "index"]
+ROOT = "/srv/preservia/backend/workspace/8f1c2a4e-5b7d-4e7a-9c1f-2d3e4f5a6b7c/originals"
+
+
+def _rows(n, seed=0):
+    """Item rows as stored in sessions.db."""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n):
+        name = f"BO0624_4866_{i:06d}.tif"
+        t = rng.choice(TYPES)
+        rows.append(json.dumps({
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "path": f"{ROOT}/{name}",
+            "original_filename": name,
+            "type": t,
+            "validated": True,
+            "page_number": i + 1,
+            "number_scheme": "arabic",
+            "extra": "",
+            "ghost_number": False,
+            "graphic": False,
+            "keywords": "",
+            "new_filename": f"BO0624_4866_{i:06d} {t}_{i + 1}.tif",
+            "rev": 1,
+        }))
+    return rows
+
+
+def _measure(build, rows):
+    gc.collect()
+    tracemalloc.start()
+    items = build(rows)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return items, size / len(rows)
+
+
+def _ms(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1e3
+
+
+def _items_json(items):
+    """What the app's JSON provider does for an "items" list."""
+    return "[" + ",".join([it.to_json() for it in items]) + "]"
+
+
+def bench(sizes):
+    out = []
+    for n in sizes:
+        rows = _rows(n)
+        dicts, dict_bytes = _measure(lambda rs: [json.loads(r) for r in rs], rows)
+        items, item_bytes = _measure(lambda rs: [Item.from_dict(json.loads(r)) for r in rs], rows)
+        out.append({
+            "items": n,
+            "dict_bytes_per_item": dict_bytes,
+            "item_bytes_per_item": item_bytes,
+            "dict_json_ms": _ms(lambda: json.dumps(dicts, sort_keys=True, separators=(",", ":"))),
+            "item_to_dict_json_ms": _ms(lambda: json.dumps(items, default=as_dict, sort_keys=True, separators=(",", ":"))),
+            "item_json_ms": _ms(lambda: _items_json(items)),
+            "dict_load_ms": _ms(lambda: [json.loads(r) for r in rows]),
+            "item_load_ms": _ms(lambda: [Item.from_dict(json.loads(r)) for r in rows]),
+        })
+        del dicts, items
+    return {"sizes": out}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    ap.add_argument("--json", help="write the report to this file")
+    args = ap.parse_args(argv)
+
+    report = bench(args.sizes)
+
+    print(f"{'items':>7} {'dict B':>8} {'slots B':>8} {'dict json':>10} {'to_dict json':>13} {'to_json':>8} "
+          f"{'dict load':>10} {'slots load':>11}  (ms)")
+    for r in report["sizes"]:
+        print(f"{r['items']:>7} {r['dict_bytes_per_item']:>8.0f} {r['item_bytes_per_item']:>8.0f} "
+              f"{r['dict_json_ms']:>10.1f} {r['item_to_dict_json_ms']:>13.1f} {r['item_json_ms']:>8.1f} "
+              f"{r['dict_load_ms']:>10.1f} {r['item_load_ms']:>11.1f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Rename cost per /preview request vs. session size.
+
+Compares the old refresh (compute_new_name for every item on every request,
+roman numerals built by string concatenation) with dirty tracking: an edit
+marks the touched items, only those are renamed, and /preview just checks
+that no name is missing. Also times int_to_roman alone (table vs. loop).
+
+Run from backend/:
+
+    python -m benchmarks.bench_rename --sizes 1000 10000 --json rename.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.metadata_store import new_session_state, new_item  # noqa: E402
+from utils.renamer import compute_new_name  # noqa: E402
+from utils.roman import int_to_roman  # noqa: E402
+
+TYPES = ["cover", "endpapers", "blank page", "illustration", "text", "index"]
+
+
+def _roman_concat(num):
+    """int_to_roman before the lookup table."""
+    val = [1000, 900, 500, 400, 100, 90, 50, 40, 10, 9, 5, 4, 1]
+    syms = ["M", "CM", "D", "CD", "C", "XC", "L", "XL", "X", "IX", "V", "IV", "I"]
+    roman_num = ""
+    i = 0
+    while num > 0:
+        for _ in range(num // val[i]):
+            roman_num += syms[i]
+            num -= val[i]
+        i += 1
+    return roman_num
+
+
+def _name(it):
+    return compute_new_name(it["original_filename"], it.get("type") or "sin-tipo", it.get("page_number"),
+                            it.get("number_scheme", "arabic"), it.get("extra", ""), it.get("ghost_number", False))
+
+
+def _make_state(n, rng):
+    state = new_session_state("bench")
+    for i in range(n):
+        it = new_item(f"id-{i:06d}", f"/tmp/p{i}.jpg", f"BO0624_4866_{i:06d}.jpg")
+        it["type"] = rng.choice(TYPES)
+        it["page_number"] = i + 1
+        it["number_scheme"] = "roman" if i < n // 10 else "arabic"  # roman front matter
+        it["new_filename"] = _name(it)
+        state["items"].append(it)
+    return state
+
+
+def _full_refresh(state):
+    changed = []
+    for it in state["items"]:
+        name = _name(it)
+        if name != it.get("new_filename"):
+            it["new_filename"] = name
+            changed.append(it)
+    return changed
+
+
+def _dirty_refresh(state, edits):
+    for iid, t in edits:  # /validate
+        state.set_fields(state.get_item(iid), {"type": t})
+    for it in state.take_renames():
+        it["new_filename"] = _name(it)
+    return all(it.get("new_filename") is not None for it in state["items"])  # /preview
+
+
+def _ms(fn, *args, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best * 1e3
+
+
+def bench(sizes, edits=1, seed=0):
+    rng = random.Random(seed)
+    rows = []
+    for n in sizes:
+        state = _make_state(n, rng)
+        batch = [(f"id-{rng.randrange(n):06d}", rng.choice(TYPES)) for _ in range(edits)]
+        rows.append({
+            "items": n,
+            "full_refresh_ms": _ms(_full_refresh, state),
+            "dirty_refresh_ms": _ms(_dirty_refresh, state, batch),
+        })
+    nums = list(range(1, 4000))
+    roman = {
+        "numbers": len(nums),
+        "concat_us": _ms(lambda: [_roman_concat(x) for x in nums]) * 1e3 / len(nums),
+        "table_us": _ms(lambda: [int_to_roman(x) for x in nums]) * 1e3 / len(nums),
+    }
+    return {"edits_per_request": edits, "sizes": rows, "roman": roman}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1000, 3000, 10000])
+    ap.add_argument("--edits", type=int, default=1, help="items touched by each /validate")
+    ap.add_argument("--json", help="write the report to this file")
+    args = ap.parse_args(argv)
+
+    report = bench(args.sizes, edits=args.edits)
+
+    print(f"{'items':>7} {'full ms':>9} {'dirty ms':>9}")
+    for r in report["sizes"]:
+        print(f"{r['items']:>7} {r['full_refresh_ms']:>9.2f} {r['dirty_refresh_ms']:>9.3f}")
+    ro = report["roman"]
+    print(f"int_to_roman: concat {ro['concat_us']:.3f} us, table {ro['table_us']:.3f} us")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
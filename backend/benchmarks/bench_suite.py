@@ -0,0 +1,306 @@
+"""
+Micro-benchmark suite over synthetic heritage pages.
+
+Times each hot function on its own, per page kind (blank aged paper, dense
+text, line art, low-contrast tissue; see benchmarks/synthetic.py):
+
+    to_gray_np, is_blank_from_gray, edge_density,
+    get_text_stats (budget / full, with and without Tesseract),
+    guess_type (with and without OCR), compute_new_name,
+    make_thumbnail, make_thumbnails (all sizes/formats),
+    export: incremental_export cold / unchanged, stream_zip.
+
+"With Tesseract" cases are skipped (and listed as such) when no OCR engine
+works in this environment. With Tesseract, it also checks that budget OCR
+counts the same words as full OCR on a page whose text straddles a band
+boundary (benchmarks.synthetic.boundary_text), and that both reach the
+same text / no-text decision on a page whose first bands are a hatched
+plate (benchmarks.synthetic.plate_over_text); a mismatch exits with 1.
+Results are saved as JSON; --compare checks them against a previous run and
+exits with status 1 on regressions, so it can gate a deploy:
+
+    python -m benchmarks.bench_suite --json base.json
+    ... change code ...
+    python -m benchmarks.bench_suite --json new.json --compare base.json --threshold 0.15
+
+Run from backend/. --size 1240x1754 gives a quick run; compare only runs
+made with the same size and on the same machine.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import statistics
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+import cv2  # noqa: E402
+import PIL  # noqa: E402
+
+from benchmarks.synthetic import A4_300PPI, make_pages, boundary_text, plate_over_text  # noqa: E402
+from classifiers import heuristics, ocr_utils  # noqa: E402
+from utils.file_utils import make_thumbnail  # noqa: E402
+from utils.thumbnails import make_thumbnails  # noqa: E402
+from utils.renamer import compute_new_name  # noqa: E402
+from utils.incremental_export import incremental_export  # noqa: E402
+from utils.zip_stream import stream_zip  # noqa: E402
+
+
+# ---------- timing ----------
+def _measure(fn, repeat=5, number=1):
+    """min / median milliseconds per call over `repeat` samples of `number` calls."""
+    fn()  # warm-up (lazy imports, OCR engine start, caches)
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - t0) / number * 1e3)
+    return {"min_ms": min(samples), "median_ms": statistics.median(samples), "runs": repeat * number}
+
+
+@contextmanager
+def _ocr(enabled):
+    """Forces get_text_stats on/off (off = the no-Tesseract path)."""
+    saved = ocr_utils.TESS_AVAILABLE
+    ocr_utils.TESS_AVAILABLE = enabled and saved
+    try:
+        yield
+    finally:
+        ocr_utils.TESS_AVAILABLE = saved
+
+
+def tesseract_works():
+    if not ocr_utils.TESS_AVAILABLE:
+        return False
+    try:
+        ocr_utils.get_engine(ocr_utils.OCR_LANG).image_to_data(
+            np.full((64, 64), 255, np.uint8), ocr_utils.OCR_LANG
+        )
+        return True
+    except Exception:
+        return False
+
+
+# ---------- checks ----------
+def ocr_band_check(size, seed=0):
+    """
+    Budget vs. full word count on a page with text in two bands (and their
+    overlap). With the full count as threshold, budget has to read both
+    bands and land on it exactly; a word counted twice overshoots.
+    """
+    gray = heuristics.to_gray_np(boundary_text(size, seed, bands=ocr_utils.BUDGET_BANDS))
+    full = ocr_utils.get_text_stats(gray, mode="full")["word_count"]
+    budget = ocr_utils.get_text_stats(gray, mode="budget", min_words=max(1, full))
+    return {"full_words": full, "budget_words": budget["word_count"],
+            "regions_scanned": budget.get("regions_scanned"), "ok": full == budget["word_count"]}
+
+
+def ocr_decision_check(size, seed=0):
+    """Budget vs. full text decision (>= WORDS_TEXT) when the first bands read hold no words."""
+    gray = heuristics.to_gray_np(plate_over_text(size, seed))
+    min_words = heuristics.WORDS_TEXT
+    full = ocr_utils.get_text_stats(gray, mode="full")["word_count"]
+    budget = ocr_utils.get_text_stats(gray, mode="budget", min_words=min_words)
+    return {"full_words": full, "budget_words": budget["word_count"],
+            "stop_reason": budget.get("stop_reason"),
+            "ok": (full >= min_words) == (budget["word_count"] >= min_words)}
+
+
+# ---------- cases ----------
+def page_cases(pages, tmp, with_tesseract):
+    """(name, fn, number) per page kind."""
+    cases = []
+    names = [f"BO0624_4866_{i:06d}.jpg" for i in range(200)]
+    for kind, im in pages.items():
+        src = os.path.join(tmp, f"{kind}.jpg")
+        im.save(src, "JPEG", quality=90)
+        gray = heuristics.to_gray_np(im)
+
+        def guess(im=im):
+            return heuristics.guess_type(im, names[100], 100, len(names), names)
+
+        cases += [
+            (f"to_gray_np/{kind}", lambda im=im: heuristics.to_gray_np(im), 1),
+            (f"is_blank_from_gray/{kind}", lambda g=gray: heuristics.is_blank_from_gray(g), 1),
+            (f"edge_density/{kind}", lambda g=gray: heuristics.edge_density(g), 1),
+            (f"get_text_stats.no_tesseract/{kind}", (lambda g=gray: _no_ocr(ocr_utils.get_text_stats, g)), 1000),
+            (f"guess_type.no_ocr/{kind}", lambda f=guess: _no_ocr(f), 1),
+            (f"make_thumbnail/{kind}", lambda s=src: make_thumbnail(s, os.path.join(tmp, "t", "x.jpg")), 1),
+            (f"make_thumbnails/{kind}", lambda s=src, k=kind: make_thumbnails(s, os.path.join(tmp, "s"), k), 1),
+        ]
+        if with_tesseract:
+            cases += [
+                (f"get_text_stats.budget/{kind}", lambda g=gray: ocr_utils.get_text_stats(g, mode="budget"), 1),
+                (f"get_text_stats.full/{kind}", lambda g=gray: ocr_utils.get_text_stats(g, mode="full"), 1),
+                (f"guess_type/{kind}", guess, 1),
+            ]
+    return cases
+
+
+def _no_ocr(fn, *args):
+    with _ocr(False):
+        return fn(*args)
+
+
+def rename_cases():
+    args = [
+        ("BO0624_4866_000123.tif", "text", 123, "arabic", "", False),
+        ("BO0624_4866_000012.tif", "text", 12, "roman", "bis", True),
+        ("BO0624_4866_000001.tif", "cover", None, "arabic", "", False),
+    ]
+    return [(f"compute_new_name/{a[3]}{'_ghost' if a[5] else ''}{'_none' if a[2] is None else ''}",
+             lambda a=a: compute_new_name(*a), 10000) for a in args]
+
+
+def export_cases(pages, tmp, n_pages):
+    """A session of n_pages JPEG originals exported like /export and /export_stream."""
+    originals = os.path.join(tmp, "export_src")
+    os.makedirs(originals, exist_ok=True)
+    kinds = list(pages)
+    files = []
+    for i in range(n_pages):
+        src = os.path.join(originals, f"BO0624_4866_{i:06d}.jpg")
+        shutil.copyfile(os.path.join(tmp, f"{kinds[i % len(kinds)]}.jpg"), src)
+        files.append((src, f"BO0624_4866_{i:06d} text_{i + 1}.jpg"))
+    metadata = [{"catalog_id": "BO0624_4866"}] + [{"new_filename": n} for _, n in files]
+    session = os.path.join(tmp, "export_session")
+
+    def cold():
+        shutil.rmtree(session, ignore_errors=True)
+        os.makedirs(session)
+        incremental_export(session, os.path.join(session, "export"), os.path.join(session, "e.zip"),
+                           files, metadata, workers=1)
+
+    def unchanged():
+        incremental_export(session, os.path.join(session, "export"), os.path.join(session, "e.zip"),
+                           files, metadata, workers=1)
+
+    def streamed():
+        entries = [("metadata.json", json.dumps(metadata).encode("utf-8"))] + [(n, p) for p, n in files]
+        for _ in stream_zip(entries):
+            pass
+
+    return [
+        (f"export.cold/{n_pages}p", cold, 1),
+        (f"export.unchanged/{n_pages}p", unchanged, 1),
+        (f"export_stream/{n_pages}p", streamed, 1),
+    ]
+
+
+def run(size=A4_300PPI, repeat=5, only=None, export_pages=20, seed=0, log=print):
+    with_tesseract = tesseract_works()
+    tmp = tempfile.mkdtemp(prefix="bench_suite_")
+    try:
+        pages = make_pages(size, seed)
+        cases = page_cases(pages, tmp, with_tesseract) + rename_cases() + export_cases(pages, tmp, export_pages)
+        results = {}
+        for name, fn, number in cases:
+            if only and not any(o in name for o in only):
+                continue
+            results[name] = _measure(fn, repeat=repeat, number=number)
+            log(f"{name:<44} {results[name]['median_ms']:>10.3f} ms")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    checks = {}
+    if with_tesseract:
+        checks = {"ocr_band_counts": ocr_band_check(size, seed), "ocr_plate_decision": ocr_decision_check(size, seed)}
+    skipped = [] if with_tesseract else [
+        "get_text_stats.budget", "get_text_stats.full", "guess_type", "ocr_band_counts", "ocr_plate_decision",
+    ]
+    return {
+        "meta": {
+            "created": time.time(),
+            "size": list(size),
+            "repeat": repeat,
+            "seed": seed,
+            "export_pages": export_pages,
+            "tesseract": with_tesseract,
+            "skipped": skipped,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+            "pillow": PIL.__version__,
+        },
+        "checks": checks,
+        "results": results,
+    }
+
+
+# ---------- comparison ----------
+def compare(current, baseline, threshold=0.15, noise_ms=0.001):
+    """Rows (name, base_ms, cur_ms, ratio, status) for cases in both runs (by median)."""
+    rows = []
+    for name, cur in sorted(current["results"].items()):
+        base = baseline["results"].get(name)
+        if base is None:
+            rows.append((name, None, cur["median_ms"], None, "new"))
+            continue
+        b, c = base["median_ms"], cur["median_ms"]
+        ratio = c / b if b else float("inf")
+        if ratio > 1 + threshold and c - b > noise_ms:
+            status = "REGRESSION"
+        elif ratio < 1 - threshold and b - c > noise_ms:
+            status = "faster"
+        else:
+            status = "ok"
+        rows.append((name, b, c, ratio, status))
+    return rows
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--size", default=f"{A4_300PPI[0]}x{A4_300PPI[1]}", help="page WxH in pixels")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--export-pages", type=int, default=20)
+    ap.add_argument("--only", nargs="+", help="run only cases whose name contains one of these")
+    ap.add_argument("--json", help="write the report to this file")
+    ap.add_argument("--compare", help="baseline report to compare against")
+    ap.add_argument("--threshold", type=float, default=0.15, help="relative slowdown counted as regression")
+    ap.add_argument("--noise-ms", type=float, default=0.001, help="ignore differences below this (ms per call)")
+    args = ap.parse_args(argv)
+
+    size = tuple(int(v) for v in args.size.lower().split("x"))
+    report = run(size, repeat=args.repeat, only=args.only, export_pages=args.export_pages)
+    if report["meta"]["skipped"]:
+        print(f"skipped (no working Tesseract): {', '.join(report['meta']['skipped'])}")
+    failed = [name for name, c in report["checks"].items() if not c["ok"]]
+    for name, c in report["checks"].items():
+        print(f"check {name}: {'ok' if c['ok'] else 'FAILED'} {c}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if not args.compare:
+        return 1 if failed else 0
+    with open(args.compare, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    for key in ("size", "export_pages", "tesseract"):
+        if baseline["meta"].get(key) != report["meta"][key]:
+            print(f"warning: baseline {key}={baseline['meta'].get(key)} differs from this run ({report['meta'][key]})")
+
+    rows = compare(report, baseline, threshold=args.threshold, noise_ms=args.noise_ms)
+    print(f"\n{'case':<44} {'base ms':>10} {'now ms':>10} {'ratio':>7}  status")
+    for name, b, c, ratio, status in rows:
+        b_s = f"{b:>10.3f}" if b is not None else f"{'-':>10}"
+        r_s = f"{ratio:>7.2f}" if ratio is not None else f"{'-':>7}"
+        print(f"{name:<44} {b_s} {c:>10.3f} {r_s}  {status}")
+    regressions = [r for r in rows if r[4] == "REGRESSION"]
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) above {args.threshold:.0%}")
+        return 1
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+"""
+Calibration benchmark for ANALYSIS_MAX_SIDE.
+
+Classifies every image in a folder at full resolution and at a set of
+reduced analysis sizes, then reports, per size, how often the label agrees
+with full resolution, how far the structural metrics drift and how long
+feature extraction takes. OCR runs as in the app: on a gray decoded
+separately at OCR_MAX_SIDE (0 = full), so it should agree at every size;
+"ocr agree" is how often the text/no-text decision (word_count >=
+WORDS_TEXT) matches the full-resolution run.
+
+Run from backend/:
+
+    python -m benchmarks.calibrate_analysis_resolution /path/to/scans \
+        --sizes 4000 3000 2400 2000 1600 1200 --json calib.json
+
+Use --no-ocr to time only the structural heuristics (OCR is skipped and
+word_count treated as 0 for every run, so agreement reflects geometry only).
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image  # noqa: E402
+
+from classifiers import heuristics  # noqa: E402
+from classifiers.features import extract_features  # noqa: E402
+from utils.file_utils import ALLOWED  # noqa: E402
+
+
+def _list_images(folder):
+    out = []
+    for name in sorted(os.listdir(folder)):
+        if os.path.splitext(name.lower())[1] in ALLOWED:
+            out.append(os.path.join(folder, name))
+    return out
+
+
+def _run(path, max_side):
+    t0 = time.perf_counter()
+    with Image.open(path) as im:
+        feats = extract_features(im, max_side=max_side)
+    t_feat = time.perf_counter() - t0
+    details = {}
+    label = heuristics.classify_content(feats, os.path.basename(path), details=details, source=path)
+    t_total = time.perf_counter() - t0
+    # None when the page is settled before OCR (blank, tissue)
+    words = (details.get("ocr") or {}).get("word_count")
+    return label, feats.scalars(), words, t_feat, t_total
+
+
+def _is_text(words):
+    return None if words is None else words >= heuristics.WORDS_TEXT
+
+
+def calibrate(paths, sizes, ocr=True):
+    if not ocr:
+        heuristics.get_text_stats = lambda *_a, **_k: {"word_count": 0}
+        heuristics.load_ocr_gray = lambda *_a: None
+
+    full = {}
+    runs = {0: []}
+    for p in paths:
+        label, sc, words, t_feat, t_total = _run(p, 0)
+        full[p] = (label, sc, words)
+        runs[0].append((t_feat, t_total))
+
+    report = {"images": len(paths), "ocr": ocr, "sizes": []}
+    base_feat = statistics.mean(t for t, _ in runs[0]) if paths else 0.0
+    report["sizes"].append({
+        "max_side": 0,
+        "agreement": 1.0,
+        "ocr_agreement": 1.0,
+        "feature_seconds_mean": base_feat,
+        "total_seconds_mean": statistics.mean(t for _, t in runs[0]) if paths else 0.0,
+        "speedup": 1.0,
+        "mismatches": [],
+    })
+
+    for size in sizes:
+        agree = ocr_agree = 0
+        t_feats, t_totals, d_edge, d_blank, d_cnt = [], [], [], [], []
+        mismatches = []
+        for p in paths:
+            label, sc, words, t_feat, t_total = _run(p, size)
+            base_label, base_sc, base_words = full[p]
+            if _is_text(words) == _is_text(base_words):
+                ocr_agree += 1
+            t_feats.append(t_feat)
+            t_totals.append(t_total)
+            d_edge.append(abs(sc["edge_density"] - base_sc["edge_density"]))
+            d_blank.append(abs(sc["blank_edge_ratio"] - base_sc["blank_edge_ratio"]))
+            d_cnt.append(abs(sc["contour_density_per_mp"] - base_sc["contour_density_per_mp"]))
+            if label == base_label:
+                agree += 1
+            else:
+                mismatches.append({
+                    "file": os.path.basename(p), "full": base_label, "reduced": label,
+                    "full_words": base_words, "reduced_words": words,
+                })
+        mean_feat = statistics.mean(t_feats)
+        report["sizes"].append({
+            "max_side": size,
+            "agreement": agree / len(paths),
+            "ocr_agreement": ocr_agree / len(paths),
+            "feature_seconds_mean": mean_feat,
+            "total_seconds_mean": statistics.mean(t_totals),
+            "speedup": (base_feat / mean_feat) if mean_feat > 0 else None,
+            "edge_density_abs_err_mean": statistics.mean(d_edge),
+            "blank_edge_ratio_abs_err_mean": statistics.mean(d_blank),
+            "contour_density_abs_err_mean": statistics.mean(d_cnt),
+            "mismatches": mismatches,
+        })
+    return report
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("folder", help="folder with sample scans (JPG/PNG/TIFF)")
+    ap.add_argument("--sizes", type=int, nargs="+", default=[4000, 3000, 2400, 2000, 1600, 1200])
+    ap.add_argument("--no-ocr", action="store_true", help="skip Tesseract, compare structure only")
+    ap.add_argument("--json", help="write the full report to this file")
+    args = ap.parse_args(argv)
+
+    paths = _list_images(args.folder)
+    if not paths:
+        ap.error(f"no images found in {args.folder}")
+
+    report = calibrate(paths, args.sizes, ocr=not args.no_ocr)
+
+    print(f"{len(paths)} images, OCR {'on' if report['ocr'] else 'off'}")
+    print(f"{'max_side':>9} {'agree':>7} {'ocr agree':>10} {'feat s':>8} {'total s':>8} {'speedup':>8}")
+    for row in report["sizes"]:
+        label = "full" if row["max_side"] == 0 else str(row["max_side"])
+        print(f"{label:>9} {row['agreement']:>7.1%} {row['ocr_agreement']:>10.1%} {row['feature_seconds_mean']:>8.3f} "
+              f"{row['total_seconds_mean']:>8.3f} {row['speedup'] or 0:>7.1f}x")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+Synthetic heritage pages for benchmarks.
+
+Deterministic (seeded) generators for the page kinds that stress different
+paths of the classifier: blank aged paper (blank detection), dense text
+(OCR), line-art illustrations (edge density) and low-contrast tissue
+(velum detection). Default size is an A4 scan at 300 ppi.
+
+    python -m benchmarks.synthetic /tmp/pages   # writes one JPEG per kind
+"""
+
+import os
+import random
+import argparse
+from typing import Callable, Dict, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter, ImageFont, ImageOps
+
+A4_300PPI = (2480, 3508)
+
+_WORDS = (
+    "libro capitulo historia reyno senor dicho tiempo ciudad iglesia obra parte grande "
+    "primero segundo tierra gente cosas mucho assi fueron tenia hizo dixo santo nuestra "
+    "liber caput historia regni domini tempore civitate ecclesia opus pars magna primus"
+).split()
+
+
+def _rng(seed: int) -> np.random.Generator:
+    return np.random.default_rng(seed)
+
+
+def _font(size: int):
+    try:
+        return ImageFont.load_default(size=size)
+    except (TypeError, OSError, ImportError):  # Pillow < 10.1 or no FreeType
+        return ImageFont.load_default()
+
+
+def aged_paper(size: Tuple[int, int] = A4_300PPI, seed: int = 0, foxing: int = 12) -> Image.Image:
+    """Warm off-white paper: uneven tone, fibre noise and a few foxing spots."""
+    w, h = size
+    g = _rng(seed)
+    # Low-frequency tone (computed small, upscaled) + vignette towards the edges
+    tone = g.normal(0, 6, (h // 64 + 2, w // 64 + 2)).astype(np.float32)
+    tone = np.asarray(Image.fromarray(tone, mode="F").resize((w, h), Image.BICUBIC))
+    yy, xx = np.ogrid[-1:1:complex(0, h), -1:1:complex(0, w)]
+    vignette = -10 * (xx ** 2 + yy ** 2)
+    fibre = g.normal(0, 3, (h, w)).astype(np.float32)
+    base = tone + vignette + fibre
+    rgb = np.stack([231 + base, 219 + base * 0.95, 192 + base * 0.85], axis=-1)
+    im = Image.fromarray(np.clip(rgb, 0, 255).astype(np.uint8), "RGB")
+
+    if foxing:
+        spots = Image.new("L", size, 0)
+        d = ImageDraw.Draw(spots)
+        r = random.Random(seed)
+        for _ in range(foxing):
+            x, y, rad = r.randrange(w), r.randrange(h), r.randrange(w // 200 + 2, w // 60 + 4)
+            d.ellipse((x - rad, y - rad, x + rad, y + rad), fill=r.randrange(30, 90))
+        spots = spots.filter(ImageFilter.GaussianBlur(w / 400))
+        im = Image.composite(Image.new("RGB", size, (150, 110, 70)), im, spots)
+    return im
+
+
+def blank_page(size: Tuple[int, int] = A4_300PPI, seed: int = 0) -> Image.Image:
+    return aged_paper(size, seed)
+
+
+def dense_text(size: Tuple[int, int] = A4_300PPI, seed: int = 0) -> Image.Image:
+    """Full text block (about 40 lines) in dark ink, with margins and a running head."""
+    w, h = size
+    im = aged_paper(size, seed)
+    d = ImageDraw.Draw(im)
+    r = random.Random(seed)
+    font = _font(max(10, h // 90))
+    left, right, top = int(w * 0.14), int(w * 0.86), int(h * 0.1)
+    line_h = int(h * 0.019)
+    d.text((w // 2 - w // 12, top - 2 * line_h), "HISTORIA DEL REYNO", fill=(40, 30, 25), font=font)
+    y = top
+    while y < h * 0.88:
+        x = left
+        while True:
+            word = r.choice(_WORDS)
+            ww = d.textlength(word + " ", font=font)
+            if x + ww > right:
+                break
+            d.text((x, y), word, fill=(35 + r.randrange(20), 28, 22), font=font)
+            x += ww
+        y += line_h
+    return im.filter(ImageFilter.GaussianBlur(0.6))  # ink spread / scan softness
+
+
+def line_art(size: Tuple[int, int] = A4_300PPI, seed: int = 0) -> Image.Image:
+    """Engraving-like plate: framed, hatched shading, contour curves, short caption."""
+    w, h = size
+    im = aged_paper(size, seed)
+    d = ImageDraw.Draw(im)
+    r = random.Random(seed)
+    ink = (30, 25, 20)
+    x0, y0, x1, y1 = int(w * 0.12), int(h * 0.12), int(w * 0.88), int(h * 0.78)
+    d.rectangle((x0, y0, x1, y1), outline=ink, width=max(2, w // 500))
+    lw = max(1, w // 1200)
+    # Hatched regions (diagonal strokes of varying density)
+    for _ in range(14):
+        rx, ry = r.randrange(x0, x1 - w // 8), r.randrange(y0, y1 - h // 10)
+        rw, rh, step = r.randrange(w // 12, w // 4), r.randrange(h // 20, h // 6), r.randrange(6, 18)
+        for k in range(0, rw + rh, step):
+            d.line((rx + max(0, k - rh), ry + min(k, rh), rx + min(k, rw), ry + max(0, k - rw)), fill=ink, width=lw)
+    # Contour curves
+    for _ in range(40):
+        pts, x, y = [], r.randrange(x0, x1), r.randrange(y0, y1)
+        for _ in range(30):
+            x = min(x1, max(x0, x + r.randrange(-w // 60, w // 60)))
+            y = min(y1, max(y0, y + r.randrange(-h // 80, h // 80)))
+            pts.append((x, y))
+        d.line(pts, fill=ink, width=lw + 1)
+    d.text((w // 2 - w // 10, int(h * 0.81)), "Vista de la ciudad", fill=ink, font=_font(max(10, h // 80)))
+    return im.filter(ImageFilter.GaussianBlur(0.5))
+
+
+def tissue(size: Tuple[int, int] = A4_300PPI, seed: int = 0) -> Image.Image:
+    """Tissue guard / velum: bright, very low contrast, faint mirrored show-through of a caption."""
+    w, h = size
+    ghost = Image.new("L", size, 0)
+    d = ImageDraw.Draw(ghost)
+    r = random.Random(seed)
+    d.rectangle((int(w * 0.12), int(h * 0.12), int(w * 0.88), int(h * 0.78)), outline=255, width=max(2, w // 500))
+    font = _font(max(10, h // 60))
+    for i in range(8):
+        line = " ".join(r.choice(_WORDS) for _ in range(5)).upper()
+        d.text((int(w * 0.2), int(h * (0.2 + i * 0.035))), line, fill=255, font=font)
+    ghost = np.asarray(ImageOps.mirror(ghost), dtype=np.float32) / 255.0
+    fibre = _rng(seed).normal(0, 1.5, (h, w)).astype(np.float32)
+    base = 238 + fibre - ghost * 50
+    rgb = np.stack([base, base - 1, base - 4], axis=-1)
+    return Image.fromarray(np.clip(rgb, 0, 255).astype(np.uint8), "RGB")
+
+
+def boundary_text(size: Tuple[int, int] = A4_300PPI, seed: int = 0, bands: int = 6, boundary: int = 2) -> Image.Image:
+    """
+    Text lines only around one band boundary of budget OCR (bands of h/bands),
+    so the text falls in exactly two bands and several lines sit in their
+    overlap. Budget and full OCR must count the same words on it.
+    """
+    w, h = size
+    im = aged_paper(size, seed, foxing=0)
+    d = ImageDraw.Draw(im)
+    r = random.Random(seed)
+    font = _font(max(10, h // 90))
+    line_h = int(h * 0.019)
+    y_mid = boundary * h // bands
+    y = y_mid - 4 * line_h
+    while y < y_mid + 4 * line_h:
+        line = " ".join(r.choice(_WORDS) for _ in range(6))
+        d.text((int(w * 0.14), y), line, fill=(30, 25, 20), font=font)
+        y += line_h
+    return im
+
+
+def plate_over_text(size: Tuple[int, int] = A4_300PPI, seed: int = 0, lines: int = 6) -> Image.Image:
+    """
+    Densely hatched plate over the top third and a few text lines below it,
+    so budget OCR reads the plate bands (no words) first. It must still
+    reach the same text / no-text decision as full OCR.
+    """
+    w, h = size
+    im = aged_paper(size, seed, foxing=0)
+    d = ImageDraw.Draw(im)
+    r = random.Random(seed)
+    ink = (30, 25, 20)
+    for k in range(0, w + h // 3, max(4, w // 300)):
+        d.line((k, 0, k - h // 3, h // 3), fill=ink, width=max(1, w // 1200))
+    font = _font(max(10, h // 90))
+    line_h = int(h * 0.019)
+    for i in range(lines):
+        line = " ".join(r.choice(_WORDS) for _ in range(6))
+        d.text((int(w * 0.14), int(h * 0.6) + i * line_h), line, fill=ink, font=font)
+    return im
+
+
+GENERATORS: Dict[str, Callable[..., Image.Image]] = {
+    "blank_aged": blank_page,
+    "dense_text": dense_text,
+    "line_art": line_art,
+    "tissue": tissue,
+}
+
+
+def make_pages(size: Tuple[int, int] = A4_300PPI, seed: int = 0) -> Dict[str, Image.Image]:
+    return {name: gen(size, seed) for name, gen in GENERATORS.items()}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("out_dir")
+    ap.add_argument("--size", default=f"{A4_300PPI[0]}x{A4_300PPI[1]}", help="WxH in pixels")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args(argv)
+    size = tuple(int(v) for v in args.size.lower().split("x"))
+    os.makedirs(args.out_dir, exist_ok=True)
+    for name, im in make_pages(size, args.seed).items():
+        p = os.path.join(args.out_dir, f"{name}.jpg")
+        im.save(p, "JPEG", quality=90)
+        print(p)
+
+
+if __name__ == "__main__":
+    main()
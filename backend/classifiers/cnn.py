@@ -1,4 +1,11 @@
 import os
+import time
+import hashlib
+import queue
+import threading
+
+from utils.metrics import timed
+
 CATEGORIES = [
     "cover",
     "back cover",
@@ -12,27 +19,226 @@ CATEGORIES = [
     "reference"
 ]
 
-def predict_with_cnn(pil_image):
-    """Optional CNN inference. If model not found or torch not available, returns None."""
-    try:
+MODEL_PATH = os.path.join(os.path.dirname(__file__), "model.pth")
+CNN_BATCH_SIZE = int(os.environ.get("CNN_BATCH_SIZE", "16"))
+
+
+class ModelRegistry:
+    """Process-wide holder for the optional CNN.
+
+    The model is loaded lazily on first use and kept resident; it is reloaded
+    only when ``model.pth`` changes on disk (mtime/size, then content hash).
+    If torch or the weights are missing, ``get()`` returns None.
+    """
+
+    def __init__(self, model_path: str = MODEL_PATH):
+        self.model_path = model_path
+        self._lock = threading.Lock()
+        self._model = None
+        self._transform = None
+        self._device = None
+        self._stat_sig = None
+        self._version = None
+        self._load_seconds = None
+        self._loaded_at = None
+        self._error = None
+
+    def _current_sig(self):
+        try:
+            st = os.stat(self.model_path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _load(self, sig):
         import torch
         from torchvision import transforms
-        model_path = os.path.join(os.path.dirname(__file__), "model.pth")
-        if not os.path.exists(model_path):
-            return None
+
+        t0 = time.perf_counter()
+        h = hashlib.sha256()
+        with open(self.model_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        version = h.hexdigest()[:12]
+
+        # Same bytes under a new mtime (e.g. re-copied file): keep the resident model
+        if self._model is not None and version == self._version:
+            self._stat_sig = sig
+            return
+
         device = "cuda" if torch.cuda.is_available() else "cpu"
-        model = torch.load(model_path, map_location=device)
+        model = torch.load(self.model_path, map_location=device)
         model.eval()
-        t = transforms.Compose([
-            transforms.Resize((224,224)),
+        self._transform = transforms.Compose([
+            transforms.Resize((224, 224)),
             transforms.ToTensor(),
         ])
-        x = t(pil_image).unsqueeze(0).to(device)
-        with torch.no_grad():
-            logits = model(x)
-            pred = int(torch.argmax(logits, dim=1).cpu())
-        if 0 <= pred < len(CATEGORIES):
-            return CATEGORIES[pred]
-        return None
+        self._model = model
+        self._device = device
+        self._version = version
+        self._stat_sig = sig
+        self._loaded_at = time.time()
+        self._load_seconds = time.perf_counter() - t0
+        self._error = None
+
+    def get(self):
+        """Returns (model, transform, device) or None if no model is usable."""
+        sig = self._current_sig()
+        if sig is None:
+            return None
+        if sig != self._stat_sig or self._model is None:
+            with self._lock:
+                if sig != self._stat_sig or self._model is None:
+                    try:
+                        self._load(sig)
+                    except Exception as e:
+                        # Remember the failing file so we don't retry on every page
+                        self._error = str(e)
+                        self._stat_sig = sig
+                        self._model = None
+                        return None
+        if self._model is None:
+            return None
+        return self._model, self._transform, self._device
+
+    def warm_up(self) -> dict:
+        """Loads the model (if present) and runs one dummy forward pass."""
+        loaded = self.get()
+        if loaded is not None:
+            try:
+                import torch
+                model, _, device = loaded
+                with torch.no_grad():
+                    model(torch.zeros((1, 3, 224, 224), device=device))
+            except Exception as e:
+                self._error = str(e)
+        return self.info()
+
+    def info(self) -> dict:
+        return {
+            "model_path": self.model_path,
+            "available": self._model is not None,
+            "version": self._version,
+            "device": self._device,
+            "load_seconds": self._load_seconds,
+            "loaded_at": self._loaded_at,
+            "error": self._error,
+        }
+
+
+_REGISTRY = ModelRegistry()
+
+
+def get_registry() -> ModelRegistry:
+    return _REGISTRY
+
+
+def _label(pred: int):
+    if 0 <= pred < len(CATEGORIES):
+        return CATEGORIES[pred]
+    return None
+
+
+def predict_with_cnn(pil_image):
+    """Optional CNN inference. If model not found or torch not available, returns None."""
+    try:
+        loaded = _REGISTRY.get()
+        if loaded is None:
+            return None
+        import torch
+        model, transform, device = loaded
+        with timed("cnn"):
+            x = transform(pil_image).unsqueeze(0).to(device)
+            with torch.no_grad():
+                logits = model(x)
+                pred = int(torch.argmax(logits, dim=1).cpu())
+        return _label(pred)
     except Exception:
         return None
+
+
+def _preprocess_worker(images, transform, batch_size, out_q, stop):
+    """Producer thread: decodes/transforms images and enqueues (indices, tensors)."""
+    idxs, tensors = [], []
+    for i, src in enumerate(images):
+        if stop.is_set():
+            break
+        try:
+            if isinstance(src, (str, bytes, os.PathLike)):
+                from PIL import Image
+                with Image.open(src) as im:
+                    x = transform(im.convert("RGB"))
+            else:
+                x = transform(src.convert("RGB"))
+            idxs.append(i)
+            tensors.append(x)
+        except Exception:
+            continue
+        if len(tensors) >= batch_size:
+            out_q.put((idxs, tensors))
+            idxs, tensors = [], []
+    if tensors:
+        out_q.put((idxs, tensors))
+    out_q.put(None)
+
+
+def predict_batch(images, batch_size: int = None, should_stop=None, progress=None):
+    """
+    Batched CNN inference over a list of PIL images or file paths.
+    Preprocessing runs in a background thread while the model runs forward
+    passes of ``batch_size`` images. Returns one label (or None) per input,
+    in the same order; all None if no model is available.
+
+    ``should_stop()`` is checked between batches: when it returns True the
+    remaining inputs are left as None. ``progress(done, total)`` is called
+    after each batch.
+    """
+    results = [None] * len(images)
+    if not images:
+        return results
+    loaded = _REGISTRY.get()
+    if loaded is None:
+        return results
+    try:
+        import torch
+    except Exception:
+        return results
+
+    model, transform, device = loaded
+    batch_size = max(1, int(batch_size or CNN_BATCH_SIZE))
+    out_q = queue.Queue(maxsize=2)  # bounded: at most two batches decoded ahead
+    stop = threading.Event()
+    producer = threading.Thread(
+        target=_preprocess_worker,
+        args=(images, transform, batch_size, out_q, stop),
+        daemon=True,
+    )
+    producer.start()
+    try:
+        with timed("cnn.batch"):
+            done = 0
+            while not (should_stop and should_stop()):
+                batch = out_q.get()
+                if batch is None:
+                    break
+                idxs, tensors = batch
+                done += len(idxs)
+                try:
+                    x = torch.stack(tensors).to(device)
+                    with torch.no_grad():
+                        preds = torch.argmax(model(x), dim=1).cpu().tolist()
+                except Exception:
+                    preds = []
+                for i, pred in zip(idxs, preds):
+                    results[i] = _label(int(pred))
+                if progress:
+                    progress(done, len(images))
+    finally:
+        stop.set()
+        # Drain so a blocked producer can exit
+        while producer.is_alive():
+            try:
+                out_q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+    return results
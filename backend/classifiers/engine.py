@@ -0,0 +1,272 @@
+# classifiers/engine.py
+# ------------------------------------------------------------
+# Motor de clasificación multi-núcleo:
+# - Las reglas por nombre/posición (portada, guardas, contraportada)
+#   se resuelven en el proceso principal con la lista completa de nombres.
+# - El análisis de imagen (Canny/contornos + OCR) se reparte en un
+#   ProcessPoolExecutor por bloques ("chunks") de páginas.
+# - Los resultados se devuelven en el orden original; si un worker
+#   falla, sus páginas se reclasifican en el proceso principal.
+# - Con una ResultCache, las páginas ya analizadas (mismo contenido y
+#   misma configuración) se resuelven sin abrir la imagen, y las
+#   predicciones CNN se reutilizan por versión de modelo.
+# - Los tiempos por etapa medidos en los workers vuelven con cada bloque
+#   y se registran en el proceso principal (utils.metrics).
+# ------------------------------------------------------------
+
+import os
+import threading
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+
+from PIL import Image
+
+from classifiers.heuristics import (
+    hint_from_name_position, classify_content, needs_ocr, config_version,
+)
+from classifiers.features import PageFeatures
+from classifiers.cnn import predict_batch, get_registry
+from utils.hashing import file_digests
+from utils.metrics import PAGES_CLASSIFIED, deferred, replay
+
+CLASSIFY_WORKERS = int(os.environ.get("CLASSIFY_WORKERS", "0")) or (os.cpu_count() or 1)
+CLASSIFY_CHUNKSIZE = max(1, int(os.environ.get("CLASSIFY_CHUNKSIZE", "4")))
+
+# Valor por defecto cuando una página no puede analizarse (igual que /classify)
+FALLBACK_TYPE = "text"
+
+_POOL: Optional[ProcessPoolExecutor] = None
+_POOL_WORKERS = 0
+_POOL_LOCK = threading.Lock()
+
+
+def _classify_one(path: str, original_name: str) -> Tuple[str, Optional[dict]]:
+    """(tipo, detalles) — detalles = features/OCR para la caché, None si falló."""
+    try:
+        details: dict = {}
+        with Image.open(path) as im:
+            t = classify_content(im, original_name, details=details, source=path)
+        return t, details
+    except Exception:
+        return FALLBACK_TYPE, None
+
+
+def _classify_chunk(chunk: Sequence[Tuple[int, str, str]]) -> Tuple[List[Tuple[int, str, Optional[dict]]], list]:
+    """
+    Se ejecuta en el worker: [(idx, path, name)] -> ([(idx, tipo, detalles)], tiempos).
+    Los tiempos por etapa no se registran aquí (otro proceso) sino que se
+    devuelven para que el proceso principal los añada con replay().
+    """
+    with deferred() as timings:
+        results = [(idx,) + _classify_one(path, name) for idx, path, name in chunk]
+    return results, timings
+
+
+def _mp_context():
+    methods = mp.get_all_start_methods()
+    # forkserver evita heredar hilos/locks de Flask; spawn como alternativa portable
+    return mp.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def get_pool(workers: int) -> ProcessPoolExecutor:
+    """Pool compartido entre peticiones (se recrea si cambia el tamaño o se rompe)."""
+    global _POOL, _POOL_WORKERS
+    with _POOL_LOCK:
+        broken = _POOL is not None and getattr(_POOL, "_broken", False)
+        if _POOL is None or broken or _POOL_WORKERS != workers:
+            if _POOL is not None:
+                _POOL.shutdown(wait=False, cancel_futures=True)
+            _POOL = ProcessPoolExecutor(max_workers=workers, mp_context=_mp_context())
+            _POOL_WORKERS = workers
+        return _POOL
+
+
+def shutdown_pool():
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is not None:
+            _POOL.shutdown(wait=False, cancel_futures=True)
+            _POOL = None
+
+
+def _chunks(seq: Sequence, size: int):
+    for i in range(0, len(seq), size):
+        yield seq[i:i + size]
+
+
+def _from_cache(cache, key: Optional[str], name: str) -> Optional[str]:
+    """Decide el tipo con features/OCR cacheados, o None si no alcanzan."""
+    if cache is None or not key:
+        return None
+    rec = cache.get(key)
+    if not rec or "features" not in rec:
+        return None
+    feats = PageFeatures(**rec["features"])
+    ocr = rec.get("ocr")
+    if ocr is None and needs_ocr(feats):
+        return None
+    return classify_content(feats, name, ocr=ocr)
+
+
+def _count_analyzed(details: Optional[dict]):
+    PAGES_CLASSIFIED.inc(source="analysis" if details is not None else "fallback")
+
+
+def _store(cache, key: Optional[str], details: Optional[dict]):
+    if cache is None or not key or not details or "features" not in details:
+        return
+    try:
+        cache.put(key, {"features": details["features"], "ocr": details.get("ocr")})
+    except OSError:
+        pass
+
+
+def cnn_predictions(
+    paths: Sequence[str],
+    batch_size: Optional[int] = None,
+    cache=None,
+    should_stop: Optional[Callable[[], bool]] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> List[Optional[str]]:
+    """
+    predict_batch con caché por (contenido, versión de modelo): sólo las
+    páginas nuevas pasan por la CNN. should_stop() se consulta entre lotes
+    (lo no procesado queda en None y no se guarda en caché); progress(done,
+    total) se llama tras cada lote, sobre las páginas que pasan por la CNN.
+    """
+    if get_registry().get() is None:
+        return [None] * len(paths)
+    version = get_registry().info().get("version")
+    if cache is None or not version:
+        return predict_batch(list(paths), batch_size=batch_size, should_stop=should_stop, progress=progress)
+
+    keys = [cache.make_key(d, f"cnn.{version}") if d else None for d in file_digests(paths)]
+    out: List[Optional[str]] = [None] * len(paths)
+    missing = []
+    for i, key in enumerate(keys):
+        rec = cache.get(key) if key else None
+        if rec and "cnn" in rec:
+            out[i] = rec["cnn"]
+        else:
+            missing.append(i)
+    if missing:
+        preds = predict_batch(
+            [paths[i] for i in missing], batch_size=batch_size, should_stop=should_stop, progress=progress
+        )
+        stopped = bool(should_stop and should_stop())
+        for i, pred in zip(missing, preds):
+            out[i] = pred
+            if keys[i] and not (stopped and pred is None):
+                try:
+                    cache.put(keys[i], {"cnn": pred})
+                except OSError:
+                    pass
+    return out
+
+
+def iter_classify_items(
+    paths: Sequence[str],
+    names: Sequence[str],
+    preds: Optional[Sequence[Optional[str]]] = None,
+    workers: Optional[int] = None,
+    chunksize: Optional[int] = None,
+    cache=None,
+) -> Iterator[Tuple[int, str]]:
+    """
+    Clasifica una sesión y va produciendo (idx, tipo) a medida que termina.
+    - preds: predicciones CNN opcionales (tienen prioridad, como en /classify)
+    - workers: nº de procesos (1 = en el proceso actual)
+    - chunksize: páginas por tarea enviada al pool
+    - cache: ResultCache opcional para features/OCR por contenido
+    Cada índice se produce exactamente una vez.
+    """
+    total = len(paths)
+    workers = max(1, int(workers or CLASSIFY_WORKERS))
+    chunksize = max(1, int(chunksize or CLASSIFY_CHUNKSIZE))
+
+    pending: List[Tuple[int, str, str]] = []
+    for idx in range(total):
+        if preds is not None and preds[idx]:
+            PAGES_CLASSIFIED.inc(source="cnn")
+            yield idx, preds[idx]
+            continue
+        hint = hint_from_name_position(names[idx], idx, total, names)
+        if hint:
+            PAGES_CLASSIFIED.inc(source="rules")
+            yield idx, hint
+            continue
+        pending.append((idx, paths[idx], names[idx]))
+
+    # Caché por contenido: sólo se analizan las páginas nuevas/modificadas
+    keys = {}
+    if cache is not None and pending:
+        version = config_version()
+        digests = file_digests([p for _, p, _ in pending])
+        still = []
+        for task, d in zip(pending, digests):
+            idx, _, name = task
+            key = cache.make_key(d, version) if d else None
+            t = _from_cache(cache, key, name)
+            if t:
+                PAGES_CLASSIFIED.inc(source="cache")
+                yield idx, t
+                continue
+            keys[idx] = key
+            still.append(task)
+        pending = still
+
+    if not pending:
+        return
+
+    if workers == 1 or len(pending) <= chunksize:
+        for idx, path, name in pending:
+            t, details = _classify_one(path, name)
+            _store(cache, keys.get(idx), details)
+            _count_analyzed(details)
+            yield idx, t
+        return
+
+    try:
+        pool = get_pool(workers)
+        futures = {pool.submit(_classify_chunk, chunk): chunk for chunk in _chunks(pending, chunksize)}
+    except Exception:
+        # Sin pool disponible: clasificación secuencial
+        for idx, path, name in pending:
+            t, details = _classify_one(path, name)
+            _store(cache, keys.get(idx), details)
+            _count_analyzed(details)
+            yield idx, t
+        return
+
+    try:
+        for fut in as_completed(futures):
+            try:
+                results, timings = fut.result()
+            except Exception:
+                # Worker caído: no se pierde ninguna página, se hacen aquí
+                results, timings = _classify_chunk(futures[fut])
+            replay(timings)
+            for idx, t, details in results:
+                _store(cache, keys.get(idx), details)
+                _count_analyzed(details)
+                yield idx, t
+    finally:
+        # Si el consumidor abandona (p.ej. cancelación), no dejar trabajo en cola
+        for fut in futures:
+            fut.cancel()
+
+
+def classify_items(
+    paths: Sequence[str],
+    names: Sequence[str],
+    preds: Optional[Sequence[Optional[str]]] = None,
+    workers: Optional[int] = None,
+    chunksize: Optional[int] = None,
+    cache=None,
+) -> List[str]:
+    """Versión bloqueante: devuelve la lista de tipos en el orden original."""
+    out: List[str] = [FALLBACK_TYPE] * len(paths)
+    for idx, t in iter_classify_items(paths, names, preds, workers, chunksize, cache):
+        out[idx] = t
+    return out
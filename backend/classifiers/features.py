@@ -0,0 +1,187 @@
+# classifiers/features.py
+# ------------------------------------------------------------
+# Extracción de características de página en una sola pasada:
+# - Un único exif_transpose + conversión a gris por página
+# - Un único suavizado compartido por los dos Canny
+#   (densidad de bordes y métrica de "página en blanco")
+# - Media/desviación en gris y varianza de color sin copiar el array
+# El resultado (PageFeatures) lo consumen guess_type,
+# is_blank_from_gray y la preparación de OCR.
+#
+# Resolución de análisis (ANALYSIS_MAX_SIDE): si es > 0 la página se
+# reduce a ese lado largo antes de las heurísticas, usando la vía rápida
+# (JPEG draft al decodificar + Image.reduce). 0 = resolución completa.
+# Ver benchmarks/calibrate_analysis_resolution.py para elegir el valor.
+# El OCR no usa ese gris reducido: load_ocr_gray vuelve a decodificar la
+# página con su propio límite (OCR_MAX_SIDE, 0 = completa), y sólo cuando
+# la decisión llega al paso de OCR.
+# ------------------------------------------------------------
+
+import os
+import math
+from dataclasses import dataclass, field
+from typing import Optional, Tuple
+
+import numpy as np
+import cv2
+from PIL import Image, ImageOps
+
+from utils.metrics import timed
+
+MIN_CONTOUR_AREA = 25  # px; contornos más pequeños se consideran polvo/ruido
+ANALYSIS_MAX_SIDE = int(os.environ.get("ANALYSIS_MAX_SIDE", "0"))
+OCR_MAX_SIDE = int(os.environ.get("OCR_MAX_SIDE", "0"))
+
+
+@dataclass
+class PageFeatures:
+    width: int
+    height: int
+    mean: float                    # media en gris
+    std: float                     # desviación en gris
+    edge_density: float            # Canny 50/150, proporción de píxeles borde
+    blank_edge_ratio: float        # Canny 40/120 (métrica de página en blanco)
+    contour_density_per_mp: float  # contornos significativos por megapíxel
+    color_variance: float          # desviación global RGB
+    gray: Optional[np.ndarray] = field(default=None, repr=False)
+
+    def scalars(self) -> dict:
+        """Métricas numéricas (sin el array), serializables a JSON."""
+        return {
+            "width": self.width,
+            "height": self.height,
+            "mean": self.mean,
+            "std": self.std,
+            "edge_density": self.edge_density,
+            "blank_edge_ratio": self.blank_edge_ratio,
+            "contour_density_per_mp": self.contour_density_per_mp,
+            "color_variance": self.color_variance,
+        }
+
+
+def blank_metrics(gray_arr: np.ndarray, blur: Optional[np.ndarray] = None) -> Tuple[float, float]:
+    """
+    (edge_ratio, contour_density_per_mp) para la detección estructural de
+    páginas en blanco. Acepta el suavizado ya calculado para no repetirlo.
+    """
+    if blur is None:
+        # Suavizado leve para no contar ruido fino
+        blur = cv2.GaussianBlur(gray_arr, (3, 3), 0)
+
+    # Bordes: Canny conservador
+    edges = cv2.Canny(blur, 40, 120)
+    edge_ratio = float(np.count_nonzero(edges)) / edges.size
+
+    # Dilatamos un poco los bordes para consolidar trazos finos
+    dil = cv2.dilate(edges, np.ones((3, 3), np.uint8), iterations=1)
+
+    # Contornos (sólo externos, sin jerarquía), filtrando los diminutos
+    cnts, _ = cv2.findContours(dil, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    significant = sum(1 for c in cnts if cv2.contourArea(c) >= MIN_CONTOUR_AREA)
+
+    # Densidad por megapíxel para ser invariante al tamaño
+    mpix = gray_arr.size / 1_000_000.0
+    density = (significant / mpix) if mpix > 0 else float(significant)
+    return edge_ratio, density
+
+
+def _global_std(arr: np.ndarray) -> float:
+    """Desviación global de un array HxWxC en una pasada (sin copia ni float64 temporal)."""
+    means, stds = cv2.meanStdDev(arr)
+    means = means.ravel()
+    stds = stds.ravel()
+    # var total = E[var_c + mean_c^2] - (E[mean_c])^2 (canales del mismo tamaño)
+    var = float(np.mean(stds ** 2 + means ** 2) - np.mean(means) ** 2)
+    return float(np.sqrt(max(var, 0.0)))
+
+
+def load_for_analysis(pil_img: Image.Image, max_side: int = 0) -> Image.Image:
+    """
+    Devuelve la página orientada (EXIF) y, si max_side > 0, reducida a ese
+    lado largo. En JPEG aún sin decodificar usa draft (el decoder escala
+    1/2, 1/4, 1/8); después Image.reduce (promedio por bloques, rápido) y
+    un último ajuste bilineal si hace falta.
+    """
+    if max_side and max_side > 0:
+        w, h = pil_img.size
+        long_side = max(w, h)
+        if long_side > max_side:
+            scale = max_side / float(long_side)
+            if pil_img.format == "JPEG":
+                # draft sólo tiene efecto antes de cargar los píxeles
+                pil_img.draft(pil_img.mode, (math.ceil(w * scale), math.ceil(h * scale)))
+
+    im = ImageOps.exif_transpose(pil_img)
+
+    if max_side and max_side > 0 and max(im.size) > max_side:
+        factor = max(im.size) // max_side
+        if factor >= 2:
+            im = im.reduce(factor)
+        if max(im.size) > max_side:
+            scale = max_side / float(max(im.size))
+            im = im.resize(
+                (max(1, round(im.width * scale)), max(1, round(im.height * scale))),
+                Image.BILINEAR,
+            )
+    return im
+
+
+def extract_features(pil_img: Image.Image, keep_gray: bool = True, max_side: Optional[int] = None) -> PageFeatures:
+    """
+    Decodifica una vez y calcula todas las métricas de la página.
+    max_side: lado largo de análisis (None = ANALYSIS_MAX_SIDE, 0 = completa).
+    """
+    if max_side is None:
+        max_side = ANALYSIS_MAX_SIDE
+    with timed("decode"):
+        im = load_for_analysis(pil_img, max_side)
+        im.load()
+
+    with timed("features"):
+        if im.mode == "L":
+            gray = np.asarray(im)
+            color_std = None  # en gris la varianza de color coincide con la de gris
+        else:
+            rgb = im if im.mode == "RGB" else im.convert("RGB")
+            rgb_arr = np.asarray(rgb)
+            color_std = _global_std(rgb_arr)
+            gray = np.asarray(im.convert("L"))
+
+        mean, std = cv2.meanStdDev(gray)
+        mean = float(mean.ravel()[0])
+        std = float(std.ravel()[0])
+
+        blur = cv2.GaussianBlur(gray, (3, 3), 0)
+        edges = cv2.Canny(blur, 50, 150)
+        ed = float(np.count_nonzero(edges)) / edges.size
+        del edges
+        edge_ratio, cnt_density = blank_metrics(gray, blur)
+
+    h, w = gray.shape[:2]
+    return PageFeatures(
+        width=int(w),
+        height=int(h),
+        mean=mean,
+        std=std,
+        edge_density=ed,
+        blank_edge_ratio=edge_ratio,
+        contour_density_per_mp=cnt_density,
+        color_variance=std if color_std is None else color_std,
+        gray=gray if keep_gray else None,
+    )
+
+
+def load_ocr_gray(path: str, feats: Optional[PageFeatures] = None) -> Optional[np.ndarray]:
+    """
+    Gris de la página (orientado) para OCR, limitado a OCR_MAX_SIDE.
+    Devuelve None si feats ya trae el gris a esa resolución (p.ej. con
+    ANALYSIS_MAX_SIDE = 0), para no decodificar dos veces.
+    """
+    with Image.open(path) as im:
+        long_side = max(im.size)
+        target = min(long_side, OCR_MAX_SIDE) if OCR_MAX_SIDE > 0 else long_side
+        if feats is not None and feats.gray is not None and max(feats.width, feats.height) >= target:
+            return None
+        with timed("decode"):
+            im = load_for_analysis(im, OCR_MAX_SIDE)
+            return np.asarray(im.convert("L"))
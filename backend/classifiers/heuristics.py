@@ -6,11 +6,16 @@
 #    de bordes con OCR (cantidad de palabras).
 # ------------------------------------------------------------
 
+import os
+
 import numpy as np
 import cv2
 from PIL import Image, ImageOps
 
-from classifiers.ocr_utils import get_text_stats  # devuelve dict con word_count, etc.
+from classifiers.ocr_utils import get_text_stats, OCR_LANG, TESS_AVAILABLE  # devuelve dict con word_count, etc.
+from classifiers.features import (
+    PageFeatures, extract_features, blank_metrics, load_ocr_gray, ANALYSIS_MAX_SIDE, OCR_MAX_SIDE,
+)
 
 CATEGORIES = [
     "cover",
@@ -25,6 +30,23 @@ CATEGORIES = [
     "reference"
 ]
 
+# Versión de umbrales/algoritmos: cambiarla invalida la caché de resultados
+HEURISTICS_VERSION = "1"
+
+# UMBRALES (ajustables):
+EDGE_ILLUST = 0.05   # 5% de pixeles-borde ~ imagen rica en detalle
+WORDS_TEXT  = 20     # >=20 palabras => muy probablemente página de texto
+
+# OCR de clasificación: "budget" (bandas, parada temprana) o "full"
+OCR_MODE = os.environ.get("CLASSIFY_OCR_MODE", "budget")
+
+
+def config_version() -> str:
+    """Identifica la configuración que produce features/OCR (clave de caché)."""
+    ocr = f"ocr.{OCR_LANG}" if TESS_AVAILABLE else "noocr"
+    return f"h{HEURISTICS_VERSION}-ams{ANALYSIS_MAX_SIDE}-oms{OCR_MAX_SIDE}-{ocr}.{OCR_MODE}"
+
+
 # ---------- Utilidades de imagen ----------
 
 def to_gray_np(pil_img: Image.Image) -> np.ndarray:
@@ -57,7 +79,7 @@ def color_variance(pil_img: Image.Image) -> float:
 
 # ---------- Páginas en blanco (estructura, no color) ----------
 
-def is_blank_from_gray(gray_arr: np.ndarray) -> bool:
+def is_blank_from_gray(gray_arr) -> bool:
     """
     Detecta “página en blanco” basándose en ausencia de estructura:
     - Suavizado + Canny
@@ -65,33 +87,19 @@ def is_blank_from_gray(gray_arr: np.ndarray) -> bool:
     - Conteo de contornos significativos (tras ligera dilatación)
     Considera variaciones de papel envejecido/sombras.
 
+    Acepta un array en gris o un PageFeatures ya calculado (sin recomputar).
+
     Umbrales recomendados (ajustables):
       - edge_ratio < 0.004  (0.4%)
       - contour_density_per_mp < 150 contornos / Mpx
     """
-    if gray_arr is None or gray_arr.size == 0:
-        return False
-
-    # Suavizado leve para no contar ruido fino
-    blur = cv2.GaussianBlur(gray_arr, (3, 3), 0)
-
-    # Bordes: Canny conservador
-    edges = cv2.Canny(blur, 40, 120)
-    edge_ratio = float((edges > 0).mean())
-
-    # Dilatamos un poco los bordes para consolidar trazos finos
-    dil = cv2.dilate(edges, np.ones((3, 3), np.uint8), iterations=1)
-
-    # Contornos (sólo externos, sin jerarquía)
-    cnts, _ = cv2.findContours(dil, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-    # Filtramos contornos muy diminutos (polvo/ruido)
-    MIN_AREA = 25  # px
-    significant = [c for c in cnts if cv2.contourArea(c) >= MIN_AREA]
-
-    # Densidad por megapíxel para ser invariante al tamaño
-    mpix = gray_arr.size / 1_000_000.0
-    contour_density_per_mp = (len(significant) / mpix) if mpix > 0 else len(significant)
+    if isinstance(gray_arr, PageFeatures):
+        edge_ratio = gray_arr.blank_edge_ratio
+        contour_density_per_mp = gray_arr.contour_density_per_mp
+    else:
+        if gray_arr is None or gray_arr.size == 0:
+            return False
+        edge_ratio, contour_density_per_mp = blank_metrics(gray_arr)
 
     # UMBRALES CLAVE (ajustables):
     BLANK_EDGE_MAX = 0.004    # 0.4% de pixeles como borde
@@ -118,16 +126,10 @@ def is_blank_page(pil_or_path) -> bool:
 
 # ---------- Clasificación principal ----------
 
-def guess_type(pil_img: Image.Image, original_name: str, index: int, total: int, neighbors_names):
+def hint_from_name_position(original_name: str, index: int, total: int, neighbors_names):
     """
-    Flujo mejorado:
-      1) Reglas por nombre/posición
-      2) Detección de “página blanca” estructural
-      3) Velinas (bajo contraste + alto brillo medio)
-      4) Densidad de bordes + OCR:
-         - Si bordes altos y OCR detecta poco texto -> ilustración
-         - Si OCR detecta mucho texto -> texto (o frontispicio por hint)
-      5) Fallbacks
+    Paso 1 de guess_type: reglas por nombre/posición (sin abrir la imagen).
+    Devuelve la categoría o None si hace falta analizar la imagen.
     """
     # -------- Hints por nombre ----------
     name_l = (original_name or "").lower()
@@ -156,29 +158,66 @@ def guess_type(pil_img: Image.Image, original_name: str, index: int, total: int,
         if ("ref" in next_name) or ("ins" in next_name):
             return "backcover"
 
-    # -------- Análisis de imagen ----------
-    gray = to_gray_np(pil_img)
+    return None
+
 
+def _structural_type(feats: PageFeatures):
     # 2) Página “en blanco” (estructura, no color)
-    if is_blank_from_gray(gray):
+    if is_blank_from_gray(feats):
         return "blank page"
 
     # 3) Velinas / páginas translúcidas muy claras
-    if is_low_contrast(gray) and float(gray.mean()) > 210.0:
+    if feats.std < 8.0 and feats.mean > 210.0:
         return "flyleaves"
 
-    # 4) Bordes + OCR para diferenciar ilustración vs texto
-    ed = edge_density(gray)
+    return None
+
+
+def needs_ocr(feats: PageFeatures) -> bool:
+    """True si la decisión llega al paso de OCR (no es blanca ni velina)."""
+    return _structural_type(feats) is None
+
 
-    # OCR stats (robusto a falta de Tesseract; ver ocr_utils)
-    ocr = get_text_stats(pil_img)
+def classify_content(page, original_name: str, ocr=None, details=None, source=None):
+    """
+    Pasos 2-5 de guess_type: análisis de la imagen (bordes, contornos, OCR).
+    Sólo depende del contenido y del nombre (hint de frontispicio), no de la
+    posición, por lo que puede ejecutarse en otro proceso.
+    Acepta un PIL.Image o un PageFeatures ya extraído.
+    - ocr: resultado de get_text_stats ya conocido (p.ej. de la caché)
+    - details: dict opcional que recibe "features" (escalares) y "ocr"
+    - source: ruta de la página (por defecto la del PIL.Image, si la tiene);
+      si el análisis se hizo reducido, el OCR la vuelve a decodificar a
+      OCR_MAX_SIDE. Sin ruta, el OCR usa el gris del análisis.
+    """
+    name_l = (original_name or "").lower()
+    if source is None:
+        source = getattr(page, "filename", None) or None
+
+    # -------- Análisis de imagen (una sola decodificación) ----------
+    feats = page if isinstance(page, PageFeatures) else extract_features(page)
+    if details is not None:
+        details["features"] = feats.scalars()
+        details["ocr"] = None
+
+    structural = _structural_type(feats)
+    if structural:
+        return structural
+
+    # 4) Bordes + OCR para diferenciar ilustración vs texto
+    ed = feats.edge_density
+
+    # OCR stats (robusto a falta de Tesseract; ver ocr_utils) sobre el gris
+    # compartido, o uno propio a resolución de OCR si el análisis fue reducido
+    if ocr is None:
+        gray = load_ocr_gray(source, feats) if source and TESS_AVAILABLE else None
+        # Modo "budget": basta con saber si se alcanzan WORDS_TEXT palabras
+        ocr = get_text_stats(feats if gray is None else gray, mode=OCR_MODE, min_words=WORDS_TEXT)
+    if details is not None:
+        details["ocr"] = ocr
     word_count = int(ocr.get("word_count", 0))
     # avg_conf = ocr.get("avg_conf", None) 
 
-    # UMBRALES (ajustables):
-    EDGE_ILLUST = 0.05   # 5% de pixeles-borde ~ imagen rica en detalle
-    WORDS_TEXT  = 20     # >=20 palabras => muy probablemente página de texto
-
     if ed > EDGE_ILLUST and word_count < WORDS_TEXT:
         # Muchos bordes pero muy poco texto -> ilustración
         return "illustration"
@@ -191,7 +230,25 @@ def guess_type(pil_img: Image.Image, original_name: str, index: int, total: int,
 
     # 5) Fallbacks: usa señales débiles restantes
     #    (mejor inclinarse hacia "texto" para minimizar falsos positivos de ilustración)
-    if color_variance(pil_img) > 40.0 and ed > 0.02 and word_count < 10:
+    if feats.color_variance > 40.0 and ed > 0.02 and word_count < 10:
         return "illustration"
 
     return "illustration"
+
+
+def guess_type(pil_img: Image.Image, original_name: str, index: int, total: int, neighbors_names):
+    """
+    Flujo mejorado:
+      1) Reglas por nombre/posición
+      2) Detección de “página blanca” estructural
+      3) Velinas (bajo contraste + alto brillo medio)
+      4) Densidad de bordes + OCR:
+         - Si bordes altos y OCR detecta poco texto -> ilustración
+         - Si OCR detecta mucho texto -> texto (o frontispicio por hint)
+      5) Fallbacks
+    pil_img puede ser un PIL.Image o un PageFeatures ya extraído.
+    """
+    hint = hint_from_name_position(original_name, index, total, neighbors_names)
+    if hint:
+        return hint
+    return classify_content(pil_img, original_name)
@@ -0,0 +1,190 @@
+# classifiers/ocr_engine.py
+# ------------------------------------------------------------
+# Abstracción de motor OCR:
+# - TesserocrPool: N instancias persistentes de Tesseract (tesserocr),
+#   cada una con los idiomas ya cargados; sin fork ni ficheros
+#   temporales por página. Se reutiliza entre peticiones y sesiones.
+# - PytesseractEngine: la vía clásica (un proceso `tesseract` por
+#   llamada), usada como alternativa si tesserocr no está disponible
+#   o si una llamada del pool falla.
+#
+# Configuración:
+#   OCR_ENGINE     = auto | tesserocr | pytesseract   (auto por defecto)
+#   OCR_POOL_SIZE  = nº de instancias por proceso     (2 por defecto)
+# Con el pool de clasificación (CLASSIFY_WORKERS) cada proceso tiene
+# su propio pool: instancias totales = workers x OCR_POOL_SIZE.
+# ------------------------------------------------------------
+
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+import numpy as np
+from PIL import Image
+
+try:
+    import pytesseract
+    PYTESSERACT_AVAILABLE = True
+except Exception:
+    pytesseract = None
+    PYTESSERACT_AVAILABLE = False
+
+try:
+    import tesserocr
+    TESSEROCR_AVAILABLE = True
+except Exception:
+    tesserocr = None
+    TESSEROCR_AVAILABLE = False
+
+OCR_ENGINE = os.environ.get("OCR_ENGINE", "auto").lower()
+OCR_POOL_SIZE = max(1, int(os.environ.get("OCR_POOL_SIZE", "2")))
+
+
+class PytesseractEngine:
+    """Un subproceso `tesseract` por llamada (comportamiento histórico)."""
+
+    name = "pytesseract"
+
+    def image_to_data(self, img: np.ndarray, lang: str) -> Dict[str, Any]:
+        return pytesseract.image_to_data(img, output_type=pytesseract.Output.DICT, lang=lang)
+
+    def info(self) -> dict:
+        return {"engine": self.name}
+
+
+class TesserocrPool:
+    """Pool de instancias PyTessBaseAPI calientes (una por hilo a la vez)."""
+
+    name = "tesserocr"
+
+    def __init__(self, lang: str, size: int = OCR_POOL_SIZE):
+        self.lang = lang
+        self.size = size
+        self._free: "queue.Queue" = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _new_api(self):
+        return tesserocr.PyTessBaseAPI(lang=self.lang)
+
+    @contextmanager
+    def _acquire(self):
+        try:
+            api = self._free.get_nowait()
+        except queue.Empty:
+            api = None
+            with self._lock:
+                if self._created < self.size:
+                    self._created += 1
+                    create = True
+                else:
+                    create = False
+            if create:
+                try:
+                    api = self._new_api()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                api = self._free.get()
+        try:
+            yield api
+        finally:
+            api.Clear()
+            self._free.put(api)
+
+    def warm_up(self):
+        """Crea todas las instancias (carga de traineddata) por adelantado."""
+        apis = []
+        try:
+            for _ in range(self.size):
+                cm = self._acquire()
+                apis.append((cm, cm.__enter__()))
+        finally:
+            for cm, _ in apis:
+                cm.__exit__(None, None, None)
+
+    def image_to_data(self, img: np.ndarray, lang: str) -> Dict[str, Any]:
+        if lang != self.lang:
+            raise ValueError(f"pool loaded with {self.lang!r}, got {lang!r}")
+        texts, confs, tops, heights = [], [], [], []
+        with self._acquire() as api:
+            api.SetImage(Image.fromarray(img))
+            api.Recognize()
+            level = tesserocr.RIL.WORD
+            for r in tesserocr.iterate_level(api.GetIterator(), level):
+                try:
+                    txt = r.GetUTF8Text(level)
+                    conf = r.Confidence(level)
+                    _, y0, _, y1 = r.BoundingBox(level)
+                except (RuntimeError, TypeError):
+                    continue
+                texts.append(txt or "")
+                confs.append(str(conf))
+                tops.append(y0)
+                heights.append(y1 - y0)
+        # Mismo formato que pytesseract.Output.DICT (sólo las claves usadas)
+        return {"text": texts, "conf": confs, "top": tops, "height": heights}
+
+    def info(self) -> dict:
+        return {
+            "engine": self.name,
+            "lang": self.lang,
+            "pool_size": self.size,
+            "instances": self._created,
+            "idle": self._free.qsize(),
+        }
+
+
+class OcrEngine:
+    """Motor preferido con alternativa pytesseract si falla."""
+
+    def __init__(self, primary, fallback=None):
+        self.primary = primary
+        self.fallback = fallback
+
+    @property
+    def available(self) -> bool:
+        return self.primary is not None or self.fallback is not None
+
+    def image_to_data(self, img: np.ndarray, lang: str) -> Dict[str, Any]:
+        if self.primary is not None:
+            try:
+                return self.primary.image_to_data(img, lang)
+            except Exception:
+                if self.fallback is None:
+                    raise
+        return self.fallback.image_to_data(img, lang)
+
+    def warm_up(self):
+        if hasattr(self.primary, "warm_up"):
+            self.primary.warm_up()
+
+    def info(self) -> dict:
+        return {
+            "primary": self.primary.info() if self.primary is not None else None,
+            "fallback": self.fallback.info() if self.fallback is not None else None,
+        }
+
+
+_ENGINE: Optional[OcrEngine] = None
+_ENGINE_LOCK = threading.Lock()
+
+
+def get_engine(lang: str) -> OcrEngine:
+    """Motor OCR del proceso (se crea una vez y se comparte)."""
+    global _ENGINE
+    if _ENGINE is None:
+        with _ENGINE_LOCK:
+            if _ENGINE is None:
+                fallback = PytesseractEngine() if PYTESSERACT_AVAILABLE else None
+                primary = None
+                if TESSEROCR_AVAILABLE and OCR_ENGINE in ("auto", "tesserocr"):
+                    primary = TesserocrPool(lang)
+                elif OCR_ENGINE == "pytesseract":
+                    primary, fallback = fallback, None
+                _ENGINE = OcrEngine(primary, fallback)
+    return _ENGINE
@@ -1,22 +1,35 @@
 # utils/ocr_utils.py
 # ------------------------------------------------------------
-# OCR robusto con pytesseract:
+# OCR robusto con Tesseract (pool persistente o pytesseract, ver ocr_engine):
 # - Preprocesado ligero
 # - Métricas: word_count, char_count, avg_conf
 # - Funciona aunque Tesseract no esté instalado (devuelve 0)
+# - Dos modos:
+#     "full"   -> OCR de la página completa (metadatos)
+#     "budget" -> OCR por bandas horizontales, de mayor a menor densidad
+#                 de bordes, parando en cuanto se alcanza el umbral de
+#                 palabras o las bandas restantes no pueden alcanzarlo
+#                 (cota superior por banda, ver _band_word_caps): la
+#                 decisión word_count >= min_words es la misma que en "full"
 # ------------------------------------------------------------
 
-from typing import Dict, Any
+from typing import Dict, Any, Union
 import numpy as np
 import cv2
 from PIL import Image, ImageOps
 
-try:
-    import pytesseract
-    TESS_AVAILABLE = True
-except Exception:
-    pytesseract = None
-    TESS_AVAILABLE = False
+from classifiers.ocr_engine import get_engine, PYTESSERACT_AVAILABLE, TESSEROCR_AVAILABLE
+from utils.metrics import timed
+
+# OCR disponible si hay algún motor (pool tesserocr o pytesseract)
+TESS_AVAILABLE = PYTESSERACT_AVAILABLE or TESSEROCR_AVAILABLE
+
+OCR_LANG = "spa+eng"  # ajusta según tus materiales
+
+OCR_MIN_SIDE = 1200      # lado corto objetivo para Tesseract
+BUDGET_BANDS = 6         # nº de bandas horizontales en modo "budget"
+BUDGET_BAND_OVERLAP = 0.02   # solape (fracción de altura) para no cortar líneas
+BUDGET_MIN_INK_AREA = 4  # px; manchas menores no pueden formar una palabra
 
 
 def _pil_to_cv_gray(pil_img: Image.Image) -> np.ndarray:
@@ -25,6 +38,24 @@ def _pil_to_cv_gray(pil_img: Image.Image) -> np.ndarray:
     return np.array(g)
 
 
+def _as_gray(page) -> np.ndarray:
+    """Gris listo para OCR: reutiliza PageFeatures.gray o un array ya en gris."""
+    if isinstance(page, np.ndarray):
+        return page
+    gray = getattr(page, "gray", None)  # PageFeatures (evita import circular)
+    if gray is not None:
+        return gray
+    return _pil_to_cv_gray(page)
+
+
+def _ocr_scale(gray: np.ndarray) -> float:
+    """Factor de upscale hasta ~OCR_MIN_SIDE el lado corto (1.0 si ya es grande)."""
+    min_side = min(gray.shape[:2])
+    if min_side and min_side < OCR_MIN_SIDE:
+        return OCR_MIN_SIDE / float(min_side)
+    return 1.0
+
+
 def _prep_for_ocr(gray: np.ndarray) -> np.ndarray:
     """
     Preprocesado sencillo:
@@ -33,10 +64,9 @@ def _prep_for_ocr(gray: np.ndarray) -> np.ndarray:
       - umbral Otsu (binario)
     """
     h, w = gray.shape[:2]
-    min_side = min(h, w)
     # Upscale hasta ~1200px el lado corto para dar más señales al OCR
-    if min_side < 1200:
-        scale = 1200 / float(min_side)
+    scale = _ocr_scale(gray)
+    if scale > 1.0:
         new_w = int(w * scale)
         new_h = int(h * scale)
         gray = cv2.resize(gray, (new_w, new_h), interpolation=cv2.INTER_CUBIC)
@@ -52,49 +82,184 @@ def _prep_for_ocr(gray: np.ndarray) -> np.ndarray:
     return th
 
 
-def get_text_stats(pil_img: Image.Image) -> Dict[str, Any]:
+def _words_from_data(data: Dict[str, Any], rows=None):
+    """
+    Tokens válidos (alfanum >= 2, conf >= 0) y sus confianzas.
+    rows=(y0, y1): sólo cuentan las palabras cuyo centro vertical cae en
+    esas filas (núcleo de una banda; el solape es sólo para reconocer).
+    """
+    n = len(data.get("text", []))
+    words = []
+    confs = []
+    tops, heights = data.get("top"), data.get("height")
+    for i in range(n):
+        txt = (data["text"][i] or "").strip()
+        if rows is not None and tops is not None and heights is not None:
+            center = float(tops[i]) + float(heights[i]) / 2.0
+            if not rows[0] <= center < rows[1]:
+                continue
+        if len([ch for ch in txt if ch.isalnum()]) >= 2:
+            # conf puede ser "-1" cuando es ruido; ignorar
+            conf = float(data.get("conf", ["-1"])[i])
+            if conf >= 0:
+                words.append(txt)
+                confs.append(conf)
+    return words, confs
+
+
+def _ocr_words(img: np.ndarray, rows=None):
+    data = get_engine(OCR_LANG).image_to_data(img, OCR_LANG)
+    return _words_from_data(data, rows)
+
+
+def _stats(words, confs, mode: str, **extra) -> Dict[str, Any]:
+    avg_conf = (sum(confs) / len(confs)) if confs else None
+    out = {
+        "word_count": int(len(words)),
+        "char_count": int(sum(len(w) for w in words)),
+        "avg_conf": (float(avg_conf) if avg_conf is not None else None),
+        "ocr_available": True,
+        "mode": mode,
+    }
+    out.update(extra)
+    return out
+
+
+def _band_edge_density(gray: np.ndarray, bounds) -> list:
+    """Densidad de bordes por banda, medida sobre una copia reducida (barata)."""
+    h, w = gray.shape[:2]
+    f = max(1, min(h, w) // 600)
+    small = gray[::f, ::f] if f > 1 else gray
+    edges = cv2.Canny(small, 50, 150)
+    row_edges = np.count_nonzero(edges, axis=1)
+    out = []
+    for y0, y1 in bounds:
+        r0, r1 = y0 // f, max(y0 // f + 1, y1 // f)
+        band = row_edges[r0:r1]
+        out.append(float(band.sum()) / (max(1, band.size) * edges.shape[1]))
+    return out
+
+
+def _band_word_caps(th: np.ndarray, invert: bool, bounds) -> list:
     """
+    Cota superior de palabras por banda: nº de componentes conexas de tinta
+    (>= BUDGET_MIN_INK_AREA) que tocan sus filas. Una palabra válida (>= 2
+    caracteres alfanuméricos) ocupa al menos una componente y dos palabras
+    no comparten ninguna, así que el OCR de la banda no puede dar más.
+    Se calcula a resolución completa: reducir fusionaría componentes.
+    """
+    ink = th if invert else cv2.bitwise_not(th)
+    _, _, stats, _ = cv2.connectedComponentsWithStats(ink, connectivity=8)
+    stats = stats[1:]  # sin el fondo
+    stats = stats[stats[:, cv2.CC_STAT_AREA] >= BUDGET_MIN_INK_AREA]
+    top = stats[:, cv2.CC_STAT_TOP]
+    bottom = top + stats[:, cv2.CC_STAT_HEIGHT]
+    return [int(np.count_nonzero((top < y1) & (bottom > y0))) for y0, y1 in bounds]
+
+
+def _budget_text_stats(gray: np.ndarray, min_words: int) -> Dict[str, Any]:
+    h, w = gray.shape[:2]
+    scale = _ocr_scale(gray)
+
+    # Umbral Otsu e inversión decididos una vez para toda la página
+    blur = cv2.GaussianBlur(gray, (3, 3), 0)
+    thr, th = cv2.threshold(blur, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    invert = float(np.count_nonzero(th)) / th.size < 0.5
+
+    band_h = int(np.ceil(h / float(BUDGET_BANDS)))
+    overlap = int(h * BUDGET_BAND_OVERLAP)
+    cores = [(i * band_h, min(h, (i + 1) * band_h)) for i in range(BUDGET_BANDS) if i * band_h < h]
+    bounds = [(max(0, c0 - overlap), min(h, c1 + overlap)) for c0, c1 in cores]
+    dens = _band_edge_density(gray, bounds)
+    order = sorted(range(len(bounds)), key=lambda i: dens[i], reverse=True)
+
+    words, confs = [], []
+    caps = None  # sólo si la primera banda no basta (páginas de texto: nunca)
+    scanned = 0
+    stop = "exhausted"
+    for n, i in enumerate(order):
+        if n > 0:
+            if caps is None:
+                caps = _band_word_caps(th, invert, bounds)
+            if len(words) + sum(caps[j] for j in order[n:]) < min_words:
+                stop = "unreachable"
+                break
+            if caps[i] == 0:
+                continue  # sin tinta: no puede aportar palabras
+        y0, y1 = bounds[i]
+        band = blur[y0:y1]
+        if scale > 1.0:
+            band = cv2.resize(band, (int(w * scale), int((y1 - y0) * scale)), interpolation=cv2.INTER_CUBIC)
+        _, band = cv2.threshold(band, thr, 255, cv2.THRESH_BINARY)
+        if invert:
+            band = cv2.bitwise_not(band)
+        # Una línea en el solape aparece en dos bandas: se cuenta sólo en
+        # la banda cuyo núcleo contiene su centro
+        c0, c1 = cores[i]
+        bw, bc = _ocr_words(band, ((c0 - y0) * scale, (c1 - y0) * scale))
+        words.extend(bw)
+        confs.extend(bc)
+        scanned += 1
+
+        if len(words) >= min_words:
+            stop = "threshold"
+            break
+
+    return _stats(
+        words, confs, "budget",
+        regions_scanned=scanned,
+        regions_total=len(bounds),
+        stop_reason=stop,
+    )
+
+
+def get_text_stats(
+    pil_img: Union[Image.Image, np.ndarray, Any],
+    mode: str = "full",
+    min_words: int = 20,
+) -> Dict[str, Any]:
+    """
+    Acepta un PIL.Image, un array en gris o un PageFeatures (sin redecodificar).
     Devuelve métricas de OCR:
       - word_count: nº de palabras detectadas (tokens alfanum >=2)
       - char_count: suma de longitudes de tokens válidos
       - avg_conf: confianza media (si disponible)
       - ocr_available: bool
-    Si pytesseract no está disponible, retorna 0s de forma segura.
+      - mode: "full" | "budget" (modo que produjo el resultado)
+    En modo "budget" word_count puede quedarse en el primer valor >= min_words,
+    o por debajo del real si el resto no podía alcanzarlo (sólo sirve para
+    decidir el umbral, con el mismo resultado que "full") y se añaden
+    regions_scanned, regions_total y stop_reason.
+    Si no hay motor OCR disponible, retorna 0s de forma segura.
     """
     if not TESS_AVAILABLE or pil_img is None:
-        return {"word_count": 0, "char_count": 0, "avg_conf": None, "ocr_available": False}
+        return {"word_count": 0, "char_count": 0, "avg_conf": None, "ocr_available": False, "mode": mode}
 
     try:
-        gray = _pil_to_cv_gray(pil_img)
-        img = _prep_for_ocr(gray)
-
-        data = pytesseract.image_to_data(
-            img,
-            output_type=pytesseract.Output.DICT,
-            lang="spa+eng"  # ajusta según tus materiales
-        )
-        n = len(data.get("text", []))
-        words = []
-        confs = []
-        for i in range(n):
-            txt = (data["text"][i] or "").strip()
-            if len([ch for ch in txt if ch.isalnum()]) >= 2:
-                # conf puede ser "-1" cuando es ruido; ignorar
-                conf = float(data.get("conf", ["-1"])[i])
-                if conf >= 0:
-                    words.append(txt)
-                    confs.append(conf)
-
-        word_count = len(words)
-        char_count = sum(len(w) for w in words)
-        avg_conf = (sum(confs) / len(confs)) if confs else None
-
-        return {
-            "word_count": int(word_count),
-            "char_count": int(char_count),
-            "avg_conf": (float(avg_conf) if avg_conf is not None else None),
-            "ocr_available": True
-        }
+        with timed(f"ocr.{mode}"):
+            gray = _as_gray(pil_img)
+            if mode == "budget":
+                return _budget_text_stats(gray, min_words)
+
+            img = _prep_for_ocr(gray)
+            words, confs = _ocr_words(img)
+            return _stats(words, confs, "full")
     except Exception:
         # Falla silenciosa: preferimos no romper la clasificación
-        return {"word_count": 0, "char_count": 0, "avg_conf": None, "ocr_available": TESS_AVAILABLE}
+        return {"word_count": 0, "char_count": 0, "avg_conf": None, "ocr_available": TESS_AVAILABLE, "mode": mode}
+
+
+def ocr_engine_info() -> Dict[str, Any]:
+    """Motor OCR activo en este proceso (pool tesserocr / pytesseract)."""
+    if not TESS_AVAILABLE:
+        return {"available": False}
+    return dict(get_engine(OCR_LANG).info(), available=True, lang=OCR_LANG)
+
+
+def warm_up_ocr():
+    """Carga por adelantado las instancias del pool OCR (si lo hay)."""
+    if TESS_AVAILABLE:
+        try:
+            get_engine(OCR_LANG).warm_up()
+        except Exception:
+            pass
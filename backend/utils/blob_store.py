@@ -0,0 +1,150 @@
+import os, time, sqlite3, threading
+from typing import List, Optional, Tuple
+
+from .export_engine import link_or_copy
+from .hashing import file_digest, remember_digest
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    digest  TEXT PRIMARY KEY,
+    size    INTEGER NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS refs (
+    path       TEXT PRIMARY KEY,
+    digest     TEXT NOT NULL,
+    session_id TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS refs_by_digest ON refs (digest);
+CREATE INDEX IF NOT EXISTS refs_by_session ON refs (session_id);
+"""
+
+
+class BlobStore:
+    """
+    Content-addressed storage of originals: each distinct file is kept once
+    as root/<d[:2]>/<digest> and sessions see it through a hardlink (reflink
+    or copy where links are not possible) under their own originals/ name.
+
+    References (one per session path) are tracked in root/blobs.db; blobs
+    and their shared thumbnails are deleted when the last reference goes.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.thumbs_root = os.path.join(root, "thumbs")
+        os.makedirs(self.thumbs_root, exist_ok=True)
+        self.db_path = os.path.join(root, "blobs.db")
+        self._local = threading.local()
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest)
+
+    def has(self, digest: Optional[str]) -> bool:
+        return bool(digest) and os.path.exists(self.blob_path(digest))
+
+    def has_ref(self, digest: Optional[str], session_id: str) -> bool:
+        """True if the blob is stored and already referenced by this session."""
+        if not self.has(digest):
+            return False
+        row = self._conn().execute(
+            "SELECT 1 FROM refs WHERE digest = ? AND session_id = ? LIMIT 1", (digest, session_id)
+        ).fetchone()
+        return row is not None
+
+    def _add_ref(self, digest: str, path: str, session_id: str):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR IGNORE INTO blobs (digest, size, created) VALUES (?, ?, ?)",
+                (digest, os.path.getsize(self.blob_path(digest)), time.time()),
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO refs (path, digest, session_id) VALUES (?, ?, ?)",
+                (os.path.abspath(path), digest, session_id),
+            )
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def adopt(self, path: str, session_id: str, digest: Optional[str] = None) -> Tuple[str, bool]:
+        """
+        Puts a freshly saved session file under content addressing. If the
+        content is already stored, the file is replaced by a link to the
+        existing blob (the duplicate bytes are freed); otherwise the file
+        becomes the blob and is linked back. Returns (digest, reused).
+        """
+        digest = digest or file_digest(path)
+        if not digest:
+            raise OSError(f"cannot read {path}")
+        blob = self.blob_path(digest)
+        reused = os.path.exists(blob)
+        if not reused:
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            try:
+                os.link(path, blob)  # the session file already holds the bytes
+            except FileExistsError:
+                reused = True  # stored concurrently by another request
+            except OSError:
+                tmp = f"{blob}.{os.getpid()}.{threading.get_ident()}.tmp"
+                link_or_copy(path, tmp)
+                os.replace(tmp, blob)
+        if reused:
+            link_or_copy(blob, path)
+        remember_digest(path, digest)
+        self._add_ref(digest, path, session_id)
+        return digest, reused
+
+    def link_into(self, digest: str, path: str, session_id: str):
+        """Materializes an already stored blob at path (upload skipped entirely)."""
+        link_or_copy(self.blob_path(digest), path)
+        remember_digest(path, digest)
+        self._add_ref(digest, path, session_id)
+
+    def release_session(self, session_id: str) -> List[str]:
+        """Drops a session's references and deletes unreferenced blobs; returns their digests."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM refs WHERE session_id = ?", (session_id,))
+            orphans = [d for (d,) in conn.execute(
+                "SELECT digest FROM blobs WHERE digest NOT IN (SELECT digest FROM refs)"
+            )]
+            conn.executemany("DELETE FROM blobs WHERE digest = ?", [(d,) for d in orphans])
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        for d in orphans:
+            for p in [self.blob_path(d)] + self._shared_thumbs(d):
+                try:
+                    os.remove(p)
+                except OSError:
+                    pass
+        return orphans
+
+    def _shared_thumbs(self, digest: str) -> List[str]:
+        d = os.path.join(self.thumbs_root, digest[:2])
+        try:
+            return [os.path.join(d, fn) for fn in os.listdir(d) if fn.startswith(digest)]
+        except OSError:
+            return []
+
+    def stats(self) -> dict:
+        conn = self._conn()
+        blobs, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs").fetchone()
+        refs, ref_size = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(b.size), 0) FROM refs r JOIN blobs b ON b.digest = r.digest"
+        ).fetchone()
+        return {"blobs": blobs, "bytes": size, "references": refs, "bytes_saved": ref_size - size}
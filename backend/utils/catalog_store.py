@@ -0,0 +1,179 @@
+import io, csv, json, time, hashlib, sqlite3, threading, itertools
+from typing import Any, BinaryIO, Callable, Dict, Iterable, List, Optional
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS versions (
+    version INTEGER PRIMARY KEY AUTOINCREMENT,
+    sha256  TEXT NOT NULL,
+    source  TEXT,
+    rows    INTEGER NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS versions_by_sha ON versions (sha256);
+CREATE TABLE IF NOT EXISTS entries (
+    version    INTEGER NOT NULL,
+    catalog_id TEXT NOT NULL,
+    data       TEXT NOT NULL,
+    PRIMARY KEY (version, catalog_id)
+) WITHOUT ROWID;
+"""
+
+_BATCH = 5000
+_PRUNE_GRACE = 600  # s; a version just ingested may not be saved in its session yet
+_encode = json.JSONEncoder(ensure_ascii=False).encode
+_HASH_CHUNK = 1 << 20
+
+
+class _HashingReader(io.RawIOBase):
+    """Read-through wrapper that hashes every byte handed to the CSV parser."""
+
+    def __init__(self, raw: BinaryIO):
+        self.raw = raw
+        self.sha = hashlib.sha256()
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        data = self.raw.read(len(b))
+        n = len(data)
+        b[:n] = data
+        self.sha.update(data)
+        return n
+
+
+def _stream_sha256(stream: BinaryIO) -> str:
+    sha = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(_HASH_CHUNK), b""):
+        sha.update(chunk)
+    return sha.hexdigest()
+
+
+class CatalogStore:
+    """
+    Shared master catalogue in SQLite, indexed by (version, catalog_id).
+
+    Each distinct CSV (by sha256) is parsed once, streamed row by row into a
+    new version; sessions keep only the version number and look entries up
+    by id. Uploading a CSV identical to a stored one returns that version
+    without parsing it again. Versions no session references are removed
+    by prune(), so re-uploading edited catalogues does not grow the file
+    without bound (SQLite reuses the freed pages).
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _by_sha(self, conn, sha256: str) -> Optional[Dict[str, Any]]:
+        row = conn.execute(
+            "SELECT version, rows FROM versions WHERE sha256 = ? ORDER BY version DESC LIMIT 1", (sha256,)
+        ).fetchone()
+        return {"version": row[0], "rows": row[1], "reused": True} if row else None
+
+    def ingest(self, stream: BinaryIO, normalize: Callable[[Dict[str, Any]], Dict[str, Any]],
+               source: str = "") -> Dict[str, Any]:
+        """
+        Loads a CSV (UTF-8, optional BOM, delimiter sniffed from the first
+        lines) as a new version with constant memory. `normalize` maps a raw
+        row to canonical keys; rows without "catalog_id" are skipped and a
+        repeated id keeps its last row. Returns {version, rows, reused}.
+
+        Seekable streams are hashed first, so a known CSV is found without
+        parsing it. Werkzeug uploads (request.files[...].stream) are spooled
+        to memory or a temporary file and are seekable; a non-seekable
+        stream is parsed while hashing and the new version is rolled back if
+        the hash turns out to be known.
+        """
+        conn = self._conn()
+        if stream.seekable():
+            start = stream.tell()
+            known = self._by_sha(conn, _stream_sha256(stream))
+            if known:
+                return known
+            stream.seek(start)
+
+        hashing = _HashingReader(stream)
+        text = io.TextIOWrapper(io.BufferedReader(hashing), encoding="utf-8-sig", errors="ignore", newline="")
+        head = list(itertools.islice(text, 5))
+        try:
+            dialect = csv.Sniffer().sniff("".join(head))
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.DictReader(itertools.chain(head, text), dialect=dialect)
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = conn.execute(
+                "INSERT INTO versions (sha256, source, rows, created) VALUES ('', ?, 0, ?)", (source, time.time())
+            ).lastrowid
+            batch = []
+            for row in reader:
+                norm = normalize(row)
+                cid = norm.get("catalog_id")
+                if cid:
+                    batch.append((version, cid, _encode(norm)))
+                if len(batch) >= _BATCH:
+                    conn.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?)", batch)
+                    batch = []
+            if batch:
+                conn.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?)", batch)
+            sha256 = hashing.sha.hexdigest()
+            known = self._by_sha(conn, sha256)
+            if known:  # stream was not seekable: same file stored before
+                conn.execute("ROLLBACK")
+                return known
+            rows = conn.execute("SELECT COUNT(*) FROM entries WHERE version = ?", (version,)).fetchone()[0]
+            conn.execute("UPDATE versions SET sha256 = ?, rows = ? WHERE version = ?", (sha256, rows, version))
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return {"version": version, "rows": rows, "reused": False}
+
+    def prune(self, referenced: Iterable[int], keep_last: int = 2) -> List[int]:
+        """
+        Deletes versions not in `referenced` (the ones sessions use), except
+        the `keep_last` newest and any created in the last _PRUNE_GRACE
+        seconds. Returns the removed version numbers.
+        """
+        conn = self._conn()
+        keep = set(referenced)
+        rows = conn.execute("SELECT version, created FROM versions ORDER BY version DESC").fetchall()
+        cutoff = time.time() - _PRUNE_GRACE
+        doomed = [v for i, (v, created) in enumerate(rows)
+                  if i >= keep_last and v not in keep and created < cutoff]
+        for version in doomed:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DELETE FROM entries WHERE version = ?", (version,))
+                conn.execute("DELETE FROM versions WHERE version = ?", (version,))
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        return doomed
+
+    def get(self, version: int, catalog_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            "SELECT data FROM entries WHERE version = ? AND catalog_id = ?", (version, catalog_id)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def info(self, version: int) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            "SELECT version, sha256, source, rows, created FROM versions WHERE version = ?", (version,)
+        ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("version", "sha256", "source", "rows", "created"), row))
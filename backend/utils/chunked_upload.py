@@ -0,0 +1,267 @@
+import os, re, json, time, uuid, hashlib, threading
+from typing import Any, BinaryIO, Dict, Optional, Tuple
+
+from .file_utils import is_allowed
+from .hashing import file_digest, remember_digest
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process lock applies
+    fcntl = None
+
+PARTIAL_DIR = ".partial"
+CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_MB", "8")) * 1024 * 1024  # suggested to clients
+PARTIAL_TTL_SECONDS = int(os.environ.get("UPLOAD_PARTIAL_TTL_HOURS", "48")) * 3600
+_COPY = 1 << 20
+_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+class UploadError(Exception):
+    """Chunked-upload failure with the HTTP status and extra fields to report."""
+
+    def __init__(self, message: str, status: int = 400, **fields):
+        super().__init__(message)
+        self.status = status
+        self.fields = fields
+
+
+class ChunkedUploads:
+    """
+    Resumable uploads into <session>/originals/.partial/<upload_id>.part,
+    with a <upload_id>.json sidecar (filename, size, expected sha256).
+
+    Chunks are appended at an explicit offset and streamed to disk in 1 MB
+    pieces, so memory stays constant whatever the file size. The received
+    offset is simply the size of the .part file, so an interrupted upload
+    resumes from upload_status after a restart or on another worker.
+    Finalize checks size and checksum and renames the file into originals/.
+
+    With a BlobStore, finished files are deduplicated by content. An upload
+    whose declared sha256 is already referenced by the same session can be
+    finalized right away without sending any bytes (init reports it as
+    "duplicate"). Content stored only for other sessions must be sent in
+    full and is checked before linking, so a hash alone never reveals or
+    grants another session's file.
+    """
+
+    def __init__(self, workspace: str, blobs=None):
+        self.workspace = workspace
+        self.blobs = blobs
+        self._locks: Dict[str, threading.Lock] = {}
+        self._hashers: Dict[str, Tuple[int, Any]] = {}  # upload_id -> (offset, sha256 so far)
+        self._lock = threading.Lock()
+
+    # ---------- paths / metadata ----------
+    def _dir(self, session_id: str) -> str:
+        return os.path.join(self.workspace, session_id, "originals", PARTIAL_DIR)
+
+    def _paths(self, session_id: str, upload_id: str) -> Tuple[str, str]:
+        if not _ID_RE.match(upload_id or ""):
+            raise UploadError("invalid upload_id")
+        d = self._dir(session_id)
+        return os.path.join(d, f"{upload_id}.part"), os.path.join(d, f"{upload_id}.json")
+
+    def _meta(self, session_id: str, upload_id: str) -> Dict[str, Any]:
+        part, meta_path = self._paths(session_id, upload_id)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            raise UploadError("upload not found", 404)
+        meta["offset"] = os.path.getsize(part) if os.path.exists(part) else 0
+        return meta
+
+    def _lock_for(self, upload_id: str) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(upload_id, threading.Lock())
+
+    def _cleanup(self, session_id: str):
+        """Drops partial uploads untouched for longer than PARTIAL_TTL_SECONDS."""
+        d = self._dir(session_id)
+        now = time.time()
+        for fn in os.listdir(d):
+            p = os.path.join(d, fn)
+            try:
+                if now - os.path.getmtime(p) > PARTIAL_TTL_SECONDS:
+                    os.remove(p)
+            except OSError:
+                pass
+
+    # ---------- protocol ----------
+    def init(self, session_id: str, filename: str, size: int, sha256: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Registers an upload (or returns the unfinished one for the same
+        filename/size/checksum, so a restarted client resumes it).
+        """
+        filename = os.path.basename(filename or "")
+        if not filename or not is_allowed(filename):
+            raise UploadError("file type not allowed")
+        if size is None or int(size) < 0:
+            raise UploadError("missing size")
+        size = int(size)
+        sha256 = (sha256 or "").lower() or None
+        d = self._dir(session_id)
+        os.makedirs(d, exist_ok=True)
+        self._cleanup(session_id)
+
+        for fn in os.listdir(d):
+            if not fn.endswith(".json"):
+                continue
+            try:
+                meta = self._meta(session_id, fn[:-5])
+            except UploadError:
+                continue
+            if (meta["filename"], meta["size"], meta.get("sha256")) == (filename, size, sha256):
+                return self._public(meta, session_id)
+
+        upload_id = uuid.uuid4().hex
+        part, meta_path = self._paths(session_id, upload_id)
+        meta = {"upload_id": upload_id, "filename": filename, "size": size,
+                "sha256": sha256, "created": time.time()}
+        open(part, "wb").close()
+        tmp = meta_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp, meta_path)
+        meta["offset"] = 0
+        return self._public(meta, session_id)
+
+    def _public(self, meta: Dict[str, Any], session_id: str) -> Dict[str, Any]:
+        return {
+            "upload_id": meta["upload_id"],
+            "filename": meta["filename"],
+            "size": meta["size"],
+            "offset": meta["offset"],
+            "complete": meta["offset"] == meta["size"],
+            "chunk_size": CHUNK_SIZE,
+            "duplicate": bool(self.blobs is not None and self.blobs.has_ref(meta.get("sha256"), session_id)),
+        }
+
+    def status(self, session_id: str, upload_id: str) -> Dict[str, Any]:
+        return self._public(self._meta(session_id, upload_id), session_id)
+
+    def write_chunk(self, session_id: str, upload_id: str, offset: int,
+                    stream: BinaryIO, length: Optional[int]) -> Dict[str, Any]:
+        """
+        Writes the request body at `offset`. The offset may repeat bytes already
+        received (a retried chunk: the file is truncated there first) but not
+        skip ahead; on a gap the current offset is returned with 409.
+        """
+        part, _ = self._paths(session_id, upload_id)
+        with self._lock_for(upload_id):
+            meta = self._meta(session_id, upload_id)
+            with open(part, "r+b") as f:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX)  # another worker on the same upload
+                current = os.fstat(f.fileno())
+                if offset is None or offset < 0 or offset > current.st_size:
+                    raise UploadError("offset mismatch", 409, offset=current.st_size)
+                if length is not None and offset + length > meta["size"]:
+                    raise UploadError("chunk exceeds declared size", 413, offset=current.st_size)
+                hasher = self._hasher_at(upload_id, offset, current)
+                f.seek(offset)
+                f.truncate()
+                written = 0
+                while True:
+                    buf = stream.read(_COPY)
+                    if not buf:
+                        break
+                    if offset + written + len(buf) > meta["size"]:
+                        f.truncate(offset + written)
+                        raise UploadError("chunk exceeds declared size", 413, offset=offset + written)
+                    f.write(buf)
+                    if hasher is not None:
+                        hasher.update(buf)
+                    written += len(buf)
+                f.flush()
+                end = offset + written
+                if hasher is not None:
+                    with self._lock:
+                        self._hashers[upload_id] = (end, os.fstat(f.fileno()).st_mtime_ns, hasher)
+        meta["offset"] = end
+        return self._public(meta, session_id)
+
+    def _hasher_at(self, upload_id: str, offset: int, st: os.stat_result):
+        """
+        Running sha256 if this process wrote every byte up to offset (and no
+        other process touched the file since), else None. It is taken out of
+        the table until the chunk completes, so a broken chunk never leaves a
+        hasher that disagrees with the file.
+        """
+        with self._lock:
+            prev = self._hashers.pop(upload_id, None)
+        if offset == 0:
+            return hashlib.sha256()
+        if prev and prev[0] == offset == st.st_size and prev[1] == st.st_mtime_ns:
+            return prev[2]
+        return None
+
+    def finalize(self, session_id: str, upload_id: str, sha256: Optional[str] = None,
+                 dest_dir: Optional[str] = None) -> Tuple[str, str, bool]:
+        """
+        Verifies size and checksum and moves the file into originals/
+        (name disambiguated like save_upload). Returns (path, sha256, reused)
+        where reused means the content was already in the blob store.
+        A checksum mismatch discards the partial file.
+        """
+        part, meta_path = self._paths(session_id, upload_id)
+        dest_dir = dest_dir or os.path.dirname(self._dir(session_id))
+        with self._lock_for(upload_id):
+            meta = self._meta(session_id, upload_id)
+            known = (sha256 or meta.get("sha256") or "").lower()
+            if meta["offset"] < meta["size"] and self.blobs is not None and self.blobs.has_ref(known, session_id):
+                # Content this session already has: no need to receive the rest
+                dest = _claim_name(dest_dir, meta["filename"])
+                self.blobs.link_into(known, dest, session_id)
+                for p in (part, meta_path):
+                    try:
+                        os.remove(p)
+                    except OSError:
+                        pass
+                with self._lock:
+                    self._locks.pop(upload_id, None)
+                    self._hashers.pop(upload_id, None)
+                return dest, known, True
+            with open(part, "rb") as f:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                if not os.path.exists(meta_path):  # finalized meanwhile by another worker
+                    raise UploadError("upload not found", 404)
+                st = os.fstat(f.fileno())
+                if st.st_size != meta["size"]:
+                    raise UploadError("upload incomplete", 409, offset=st.st_size, size=meta["size"])
+                hasher = self._hasher_at(upload_id, st.st_size, st)
+                digest = hasher.hexdigest() if hasher is not None else file_digest(part)
+                if known and known != digest:
+                    for p in (part, meta_path):
+                        try:
+                            os.remove(p)
+                        except OSError:
+                            pass
+                    raise UploadError("checksum mismatch", 422, sha256=digest)
+
+                dest = _claim_name(dest_dir, meta["filename"])
+                os.replace(part, dest)
+                os.remove(meta_path)
+        with self._lock:
+            self._locks.pop(upload_id, None)
+        reused = False
+        if self.blobs is not None:
+            digest, reused = self.blobs.adopt(dest, session_id, digest)
+        else:
+            remember_digest(dest, digest)
+        return dest, digest, reused
+
+
+def _claim_name(dest_dir: str, filename: str) -> str:
+    """Reserves a free name (name, name(1), ...) atomically, even across processes."""
+    base, ext = os.path.splitext(filename)
+    i = 0
+    while True:
+        name = filename if i == 0 else f"{base}({i}){ext}"
+        dest = os.path.join(dest_dir, name)
+        try:
+            os.close(os.open(dest, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return dest
+        except FileExistsError:
+            i += 1
@@ -0,0 +1,203 @@
+import os, errno, shutil
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from PIL import Image, ImageOps
+
+EXPORT_WORKERS = int(os.environ.get("EXPORT_WORKERS", "0")) or (os.cpu_count() or 1)
+COPY_THREADS = 4
+
+DERIVATIVE_FORMATS = {"jpeg": ("JPEG", ".jpg"), "webp": ("WEBP", ".webp")}
+
+try:
+    import fcntl
+    _FICLONE = 0x40049409  # linux/fs.h: _IOW(0x94, 9, int)
+except ImportError:  # Windows
+    fcntl = None
+    _FICLONE = None
+
+
+def _reflink(src: str, dst: str) -> bool:
+    """Copy-on-write clone (btrfs/xfs/APFS-like filesystems on Linux)."""
+    if fcntl is None:
+        return False
+    try:
+        with open(src, "rb") as fs, open(dst, "wb") as fd:
+            fcntl.ioctl(fd.fileno(), _FICLONE, fs.fileno())
+        shutil.copystat(src, dst)
+        return True
+    except OSError:
+        try:
+            os.remove(dst)
+        except OSError:
+            pass
+        return False
+
+
+def link_or_copy(src: str, dst: str) -> str:
+    """
+    Places src at dst without duplicating data when possible.
+    Returns the method used: "hardlink", "reflink" or "copy".
+    """
+    if os.path.lexists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+        return "hardlink"
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP, errno.EACCES):
+            raise
+    if _reflink(src, dst):
+        return "reflink"
+    shutil.copy2(src, dst)
+    return "copy"
+
+
+def _to_rgb(im: Image.Image) -> Image.Image:
+    im = ImageOps.exif_transpose(im)
+    if im.mode in ("RGBA", "LA", "P"):
+        im = im.convert("RGBA")
+        bg = Image.new("RGB", im.size, (255, 255, 255))
+        bg.paste(im, mask=im.split()[-1])
+        return bg
+    if im.mode != "RGB":
+        return im.convert("RGB")
+    return im
+
+
+def transcode_master(src: str, dst: str) -> str:
+    """Re-encodes src as JPEG q90 next to dst (used when src can't be linked/copied)."""
+    base_no_ext, _ = os.path.splitext(dst)
+    out = base_no_ext + ".jpg"
+    with Image.open(src) as im:
+        _to_rgb(im).save(out, format="JPEG", quality=90)
+    return out
+
+
+def make_derivative(src: str, dst: str, max_size: int, fmt: str, quality: int = 85) -> str:
+    """Access copy: fits src inside max_size x max_size and saves as JPEG/WebP."""
+    pil_fmt, _ = DERIVATIVE_FORMATS[fmt]
+    with Image.open(src) as im:
+        if im.format == "JPEG":
+            im.draft("RGB", (max_size, max_size))  # decode at reduced scale
+        im = _to_rgb(im)
+        im.thumbnail((max_size, max_size), Image.LANCZOS)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        im.save(dst, format=pil_fmt, quality=quality)
+    return dst
+
+
+def parse_derivatives(spec: Any) -> List[Dict[str, Any]]:
+    """
+    Normalizes a derivatives request: [{"format": "jpeg"|"webp", "max_size": int,
+    "quality": int?}, ...]. Unknown formats and non-positive sizes are dropped.
+    """
+    out = []
+    for d in spec or []:
+        if not isinstance(d, dict):
+            continue
+        fmt = str(d.get("format", "jpeg")).lower()
+        if fmt == "jpg":
+            fmt = "jpeg"
+        try:
+            size = int(d.get("max_size", 0))
+            quality = int(d.get("quality", 85))
+        except (TypeError, ValueError):
+            continue
+        if fmt in DERIVATIVE_FORMATS and size > 0:
+            out.append({"format": fmt, "max_size": size, "quality": quality})
+    return out
+
+
+def _mp_context():
+    methods = mp.get_all_start_methods()
+    return mp.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def materialize_export(
+    files: Sequence[Tuple[str, str]],
+    export_dir: str,
+    derivatives: Optional[List[Dict[str, Any]]] = None,
+    workers: Optional[int] = None,
+    derivative_files: Optional[Sequence[Tuple[str, str]]] = None,
+) -> Dict[str, Any]:
+    """
+    Builds export_dir from (src_path, new_name) pairs.
+    - Masters are hardlinked/reflinked (or copied) under their new names.
+    - Sources that can't be placed that way are transcoded to JPEG, and
+      derivative access copies (derivatives/<format>_<size>/...) are rendered,
+      both on a process pool.
+    derivative_files: pairs to render derivatives for (default: files).
+    Returns {"files": [{name, method, source}], "derivatives": [{name, path}],
+    "errors": [...]}.
+    """
+    derivatives = derivatives or []
+    workers = max(1, int(workers or EXPORT_WORKERS))
+    report: Dict[str, Any] = {"files": [], "derivatives": [], "errors": []}
+    to_transcode: List[Tuple[str, str, str]] = []
+
+    def _place(pair):
+        src, name = pair
+        dst = os.path.join(export_dir, name)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        try:
+            return name, link_or_copy(src, dst), None
+        except Exception as e:
+            return name, None, str(e)
+
+    with ThreadPoolExecutor(max_workers=COPY_THREADS) as tex:
+        placed = list(tex.map(_place, files))
+    for (src, name), (_, method, err) in zip(files, placed):
+        if method:
+            report["files"].append({"name": name, "method": method, "source": name})
+        else:
+            to_transcode.append((src, os.path.join(export_dir, name), err))
+
+    jobs = []
+    for src, name in (files if derivative_files is None else derivative_files):
+        base = os.path.splitext(name)[0]
+        for d in derivatives:
+            _, ext = DERIVATIVE_FORMATS[d["format"]]
+            sub = f"{d['format']}_{d['max_size']}"
+            dst = os.path.join(export_dir, "derivatives", sub, base + ext)
+            jobs.append(("derivative", name, (src, dst, d["max_size"], d["format"], d["quality"]), None))
+    for src, dst, copy_err in to_transcode:
+        jobs.append(("transcode", os.path.basename(dst), (src, dst), copy_err))
+
+    if not jobs:
+        return report
+
+    def _record(kind, name, note, result=None, error=None):
+        if error is not None:
+            if note:
+                error = f"copy failed ({note}); transcode failed ({error})"
+            report["errors"].append({"file": name, "stage": kind, "error": error})
+            return
+        rel = os.path.relpath(result, export_dir).replace(os.sep, "/")
+        if kind == "transcode":
+            report["files"].append({"name": rel, "method": "transcode", "source": name})
+        else:
+            report["derivatives"].append({"name": name, "path": rel})
+
+    if workers == 1 or len(jobs) == 1:
+        for kind, name, args, note in jobs:
+            fn = transcode_master if kind == "transcode" else make_derivative
+            try:
+                _record(kind, name, note, fn(*args))
+            except Exception as e:
+                _record(kind, name, note, error=str(e))
+        return report
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), mp_context=_mp_context()) as pex:
+        futures = {}
+        for kind, name, args, note in jobs:
+            fn = transcode_master if kind == "transcode" else make_derivative
+            futures[pex.submit(fn, *args)] = (kind, name, note)
+        for fut in as_completed(futures):
+            kind, name, note = futures[fut]
+            try:
+                _record(kind, name, note, fut.result())
+            except Exception as e:
+                _record(kind, name, note, error=str(e))
+    return report
@@ -0,0 +1,61 @@
+import os, hashlib, threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Sequence
+
+_CHUNK = 1 << 20
+_MEMO_MAX = 100_000
+
+# (path, size, mtime_ns, inode) -> hex digest; avoids re-reading unchanged files
+_memo: "OrderedDict[tuple, str]" = OrderedDict()
+_memo_lock = threading.Lock()
+
+
+def _stat_key(path: str) -> Optional[tuple]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (path, st.st_size, st.st_mtime_ns, st.st_ino)
+
+
+def remember_digest(path: str, digest: str):
+    """Records a digest computed elsewhere (e.g. while streaming an upload)."""
+    key = _stat_key(path)
+    if key is None:
+        return
+    with _memo_lock:
+        _memo[key] = digest
+        _memo.move_to_end(key)
+        while len(_memo) > _MEMO_MAX:
+            _memo.popitem(last=False)
+
+
+def file_digest(path: str) -> Optional[str]:
+    """SHA-256 of a file's content (memoized by path + stat signature)."""
+    key = _stat_key(path)
+    if key is None:
+        return None
+    with _memo_lock:
+        d = _memo.get(key)
+        if d:
+            _memo.move_to_end(key)
+            return d
+    h = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(_CHUNK), b""):
+                h.update(chunk)
+    except OSError:
+        return None
+    d = h.hexdigest()
+    remember_digest(path, d)
+    return d
+
+
+def file_digests(paths: Sequence[str], workers: int = 4) -> List[Optional[str]]:
+    """Hashes several files concurrently (hashlib releases the GIL on large buffers)."""
+    if len(paths) <= 1 or workers <= 1:
+        return [file_digest(p) for p in paths]
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        return list(ex.map(file_digest, paths))
@@ -0,0 +1,228 @@
+import os, json, copy, struct, hashlib, zipfile
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .export_engine import materialize_export
+from .hashing import file_digests
+from .metrics import timed
+from .zip_stream import compress_type_for
+
+MANIFEST_NAME = "export_manifest.json"
+MANIFEST_VERSION = 1
+_CHUNK = 1 << 20
+
+
+def load_manifest(session_dir: str) -> Dict[str, Any]:
+    try:
+        with open(os.path.join(session_dir, MANIFEST_NAME), "r", encoding="utf-8") as f:
+            m = json.load(f)
+        return m if m.get("version") == MANIFEST_VERSION else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(session_dir: str, manifest: Dict[str, Any]):
+    p = os.path.join(session_dir, MANIFEST_NAME)
+    tmp = p + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, p)
+
+
+def _copy_raw_entry(src_fp, zinfo: zipfile.ZipInfo, dst: zipfile.ZipFile) -> bool:
+    """
+    Appends an entry from another archive to dst without decompressing or
+    recompressing it (local header + compressed bytes copied as-is).
+    Returns False if the entry uses a trailing data descriptor.
+    """
+    if zinfo.flag_bits & 0x08:
+        return False
+    src_fp.seek(zinfo.header_offset)
+    header = src_fp.read(zipfile.sizeFileHeader)
+    fields = struct.unpack(zipfile.structFileHeader, header)
+    if fields[0] != zipfile.stringFileHeader:
+        return False
+    name_len = fields[zipfile._FH_FILENAME_LENGTH]
+    extra_len = fields[zipfile._FH_EXTRA_FIELD_LENGTH]
+    remaining = name_len + extra_len + zinfo.compress_size
+
+    out = dst.fp
+    out.seek(dst.start_dir)
+    new_info = copy.copy(zinfo)
+    new_info.header_offset = out.tell()
+    out.write(header)
+    while remaining > 0:
+        chunk = src_fp.read(min(_CHUNK, remaining))
+        if not chunk:
+            raise zipfile.BadZipFile(f"truncated entry {zinfo.filename}")
+        out.write(chunk)
+        remaining -= len(chunk)
+    dst.start_dir = out.tell()
+    dst.filelist.append(new_info)
+    dst.NameToInfo[new_info.filename] = new_info
+    return True
+
+
+def _write_zip(
+    zip_path: str,
+    export_dir: str,
+    meta_bytes: bytes,
+    arcnames: Sequence[str],
+    reusable: set,
+    errors: List[Dict[str, Any]],
+) -> Tuple[int, int]:
+    """
+    Writes a new archive: metadata.json first, then arcnames in order.
+    Names in `reusable` are copied raw from the previous archive when present;
+    the rest are read from export_dir. Returns (reused, written).
+    """
+    old = None
+    if reusable and os.path.exists(zip_path):
+        try:
+            old = zipfile.ZipFile(zip_path, "r")
+        except zipfile.BadZipFile:
+            old = None
+    tmp = zip_path + ".tmp"
+    reused = written = 0
+    try:
+        with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+            zf.writestr("metadata.json", meta_bytes)
+            for arc in arcnames:
+                if old is not None and arc in reusable:
+                    info = old.NameToInfo.get(arc)
+                    if info is not None and _copy_raw_entry(old.fp, info, zf):
+                        reused += 1
+                        continue
+                full = os.path.join(export_dir, arc)
+                zf.write(full, arcname=arc, compress_type=compress_type_for(full))
+                written += 1
+            if errors:
+                zf.writestr("export_errors.json", json.dumps(errors, ensure_ascii=False, indent=2))
+    finally:
+        if old is not None:
+            old.close()
+    os.replace(tmp, zip_path)
+    return reused, written
+
+
+def _remove_empty_dirs(root: str):
+    for d, _, _ in sorted(os.walk(root), key=lambda t: len(t[0]), reverse=True):
+        if d != root:
+            try:
+                os.rmdir(d)
+            except OSError:
+                pass
+
+
+def incremental_export(
+    session_dir: str,
+    export_dir: str,
+    zip_path: str,
+    files: Sequence[Tuple[str, str]],
+    metadata: Any,
+    derivatives: Optional[List[Dict[str, Any]]] = None,
+    workers: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Exports (src_path, new_name) pairs + metadata into export_dir and zip_path,
+    redoing only what changed since the last export:
+    - the manifest records, per entry, the source content hash and the names
+      written (master + derivatives), plus the metadata hash;
+    - unchanged entries keep their files in export_dir and are copied raw
+      from the previous ZIP; metadata.json is always rewritten (patched);
+    - if nothing changed at all the previous ZIP is returned as is.
+    Returns the export_engine report plus "cached", "reused", "written".
+    """
+    derivatives = derivatives or []
+    meta_bytes = json.dumps(metadata, ensure_ascii=False, indent=2).encode("utf-8")
+    meta_hash = hashlib.sha256(meta_bytes).hexdigest()
+    deriv_key = json.dumps(derivatives, sort_keys=True)
+
+    digests = file_digests([src for src, _ in files])
+    desired = {name: d for (_, name), d in zip(files, digests)}
+
+    manifest = load_manifest(session_dir)
+    old_entries: Dict[str, Any] = manifest.get("entries", {})
+    same_derivs = manifest.get("derivatives") == deriv_key
+
+    if (
+        manifest
+        and os.path.exists(zip_path)
+        and same_derivs
+        and manifest.get("metadata_hash") == meta_hash
+        and not manifest.get("errors")
+        and {n: e.get("source_hash") for n, e in old_entries.items()} == desired
+    ):
+        return {"cached": True, "reused": len(desired), "written": 0,
+                "files": [], "derivatives": [], "errors": []}
+
+    # Qué entradas se pueden conservar tal cual
+    keep_master, keep_derivs = {}, {}
+    for name, digest in desired.items():
+        old = old_entries.get(name)
+        if not old or not digest or old.get("source_hash") != digest:
+            continue
+        if not os.path.exists(os.path.join(export_dir, old["arcname"])):
+            continue
+        keep_master[name] = old["arcname"]
+        if same_derivs and all(os.path.exists(os.path.join(export_dir, p)) for p in old.get("derivatives", [])):
+            keep_derivs[name] = old.get("derivatives", [])
+
+    # Limpiar export_dir: fuera todo lo que no se conserva
+    keep_paths = {"metadata.json"} | set(keep_master.values())
+    for paths in keep_derivs.values():
+        keep_paths.update(paths)
+    os.makedirs(export_dir, exist_ok=True)
+    for root, _, names in os.walk(export_dir):
+        for fn in names:
+            full = os.path.join(root, fn)
+            rel = os.path.relpath(full, export_dir).replace(os.sep, "/")
+            if rel not in keep_paths:
+                os.remove(full)
+    _remove_empty_dirs(export_dir)
+
+    with open(os.path.join(export_dir, "metadata.json"), "wb") as f:
+        f.write(meta_bytes)
+
+    # Rehacer sólo lo cambiado
+    todo_masters = [(src, name) for src, name in files if name not in keep_master]
+    todo_derivs = [(src, name) for src, name in files if name not in keep_derivs]
+    with timed("export.copy"):
+        report = materialize_export(
+            todo_masters, export_dir,
+            derivatives=derivatives, workers=workers, derivative_files=todo_derivs,
+        )
+
+    master_arc = dict(keep_master)
+    for f in report["files"]:
+        master_arc[f["source"]] = f["name"]
+    deriv_arcs: Dict[str, List[str]] = {n: list(p) for n, p in keep_derivs.items()}
+    for d in report["derivatives"]:
+        deriv_arcs.setdefault(d["name"], []).append(d["path"])
+    failed = {e["file"] for e in report["errors"]}
+
+    arcnames = []
+    entries = {}
+    for _, name in files:
+        if name in master_arc:
+            arcnames.append(master_arc[name])
+        derivs = sorted(deriv_arcs.get(name, []))
+        if name in master_arc and name not in failed:
+            entries[name] = {"source_hash": desired[name], "arcname": master_arc[name], "derivatives": derivs}
+    for _, name in files:
+        arcnames.extend(sorted(deriv_arcs.get(name, [])))
+
+    reusable = set(keep_master.values())
+    for paths in keep_derivs.values():
+        reusable.update(paths)
+    with timed("export.zip"):
+        reused, written = _write_zip(zip_path, export_dir, meta_bytes, arcnames, reusable, report["errors"])
+
+    save_manifest(session_dir, {
+        "version": MANIFEST_VERSION,
+        "metadata_hash": meta_hash,
+        "derivatives": deriv_key,
+        "entries": entries,
+        "errors": len(report["errors"]),
+    })
+    report.update({"cached": False, "reused": reused, "written": written})
+    return report
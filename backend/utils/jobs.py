@@ -0,0 +1,242 @@
+import json, time, uuid, sqlite3, threading
+from typing import Any, Callable, Dict, Optional
+
+JOB_TTL_SECONDS = 3600  # finished jobs are kept this long for polling
+JOB_SYNC_SECONDS = 0.5  # progress is written to the shared table at most this often
+JOB_STALE_SECONDS = 120  # a running job without heartbeat for this long is dead
+
+_JOBS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id     TEXT PRIMARY KEY,
+    kind       TEXT NOT NULL,
+    session_id TEXT,
+    status     TEXT NOT NULL,
+    total      INTEGER NOT NULL,
+    done       INTEGER NOT NULL,
+    results    TEXT NOT NULL DEFAULT '{}',
+    error      TEXT,
+    created    REAL NOT NULL,
+    started    REAL,
+    finished   REAL,
+    heartbeat  REAL NOT NULL,
+    cancel     INTEGER NOT NULL DEFAULT 0,
+    stage      TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_by_session ON jobs (session_id, kind, status);
+"""
+
+
+class Job:
+    """Background job with progress counters, partial results and cancellation."""
+
+    def __init__(self, kind: str, session_id: str, total: int = 0):
+        self.id = str(uuid.uuid4())
+        self.kind = kind
+        self.session_id = session_id
+        self.status = "queued"  # queued | running | done | cancelled | error
+        self.stage: Optional[str] = None  # current phase; done/total count within it
+        self.total = total
+        self.done = 0
+        self.results: Dict[str, Any] = {}  # image_id -> result
+        self.error: Optional[str] = None
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self._stage_started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.cancel_event = threading.Event()
+        self._lock = threading.Lock()
+        self._sync: Optional[Callable[["Job"], None]] = None
+        self._last_sync = 0.0
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def _maybe_sync(self, force: bool = False):
+        # Also refreshes the heartbeat and picks up a cancel from another process
+        if self._sync and (force or time.time() - self._last_sync >= JOB_SYNC_SECONDS):
+            self._last_sync = time.time()
+            self._sync(self)
+
+    def record(self, key: str, value: Any):
+        with self._lock:
+            self.results[key] = value
+            self.done += 1
+        self._maybe_sync()
+
+    def set_stage(self, stage: str, total: int):
+        """Starts a new phase: done/total (and the ETA) restart from 0/total."""
+        with self._lock:
+            self.stage, self.total, self.done = stage, total, 0
+            self._stage_started = time.time()
+        self._maybe_sync(force=True)
+
+    def advance(self, done: int, total: Optional[int] = None):
+        """Progress within the current stage, for work that records no results."""
+        with self._lock:
+            self.done = done
+            if total is not None:
+                self.total = total
+        self._maybe_sync()
+
+    def eta_seconds(self) -> Optional[float]:
+        if not self.started or self.done <= 0 or self.finished:
+            return 0.0 if self.finished else None
+        elapsed = time.time() - (self._stage_started or self.started)
+        return elapsed / self.done * max(0, self.total - self.done)
+
+    def to_dict(self, with_results: bool = True) -> dict:
+        with self._lock:
+            out = {
+                "job_id": self.id,
+                "kind": self.kind,
+                "session_id": self.session_id,
+                "status": self.status,
+                "stage": self.stage,
+                "done": self.done,
+                "total": self.total,
+                "eta_seconds": self.eta_seconds(),
+                "created": self.created,
+                "started": self.started,
+                "finished": self.finished,
+                "error": self.error,
+            }
+            if with_results:
+                out["results"] = dict(self.results)
+        return out
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> "Job":
+        """Read-only snapshot of a job that runs (or ran) in another process."""
+        job = cls(row["kind"], row["session_id"], row["total"])
+        job.id = row["job_id"]
+        job.status = row["status"]
+        job.stage = row["stage"]
+        job.done = row["done"]
+        job.results = json.loads(row["results"] or "{}")
+        job.error = row["error"]
+        job.created, job.started, job.finished = row["created"], row["started"], row["finished"]
+        if row["cancel"]:
+            job.cancel_event.set()
+        if job.status in ("queued", "running") and time.time() - row["heartbeat"] > JOB_STALE_SECONDS:
+            job.status, job.error = "error", "worker process lost"
+        return job
+
+
+class JobManager:
+    """
+    Registry of background jobs (one thread per job, in the process that
+    received the request). With ``db_path`` the jobs are mirrored to a
+    SQLite table, so any worker process can report status or cancel them.
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self.db_path = db_path
+        self._local = threading.local()
+        if db_path:
+            conn = self._conn()
+            conn.executescript(_JOBS_SCHEMA)
+            cols = {r[1] for r in conn.execute("PRAGMA table_info(jobs)")}
+            if "stage" not in cols:  # databases created before stages existed
+                conn.execute("ALTER TABLE jobs ADD COLUMN stage TEXT")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def _write(self, job: Job):
+        """Upserts the job row and picks up a cancel requested elsewhere."""
+        if not self.db_path:
+            return
+        d = job.to_dict(with_results=True)
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO jobs (job_id, kind, session_id, status, stage, total, done, results, error, "
+            "created, started, finished, heartbeat) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(job_id) DO UPDATE SET status = excluded.status, stage = excluded.stage, "
+            "total = excluded.total, done = excluded.done, "
+            "results = excluded.results, error = excluded.error, started = excluded.started, "
+            "finished = excluded.finished, heartbeat = excluded.heartbeat",
+            (d["job_id"], d["kind"], d["session_id"], d["status"], d["stage"], d["total"], d["done"],
+             json.dumps(d["results"], ensure_ascii=False), d["error"],
+             d["created"], d["started"], d["finished"], time.time()),
+        )
+        row = conn.execute("SELECT cancel FROM jobs WHERE job_id = ?", (job.id,)).fetchone()
+        if row and row["cancel"]:
+            job.cancel_event.set()
+
+    def _read(self, job_id: str) -> Optional[Job]:
+        if not self.db_path:
+            return None
+        row = self._conn().execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return Job.from_row(row) if row else None
+
+    def _prune(self):
+        now = time.time()
+        for jid, job in list(self._jobs.items()):
+            if job.finished and now - job.finished > JOB_TTL_SECONDS:
+                del self._jobs[jid]
+        if self.db_path:
+            self._conn().execute(
+                "DELETE FROM jobs WHERE finished IS NOT NULL AND finished < ?", (now - JOB_TTL_SECONDS,)
+            )
+
+    def submit(self, kind: str, session_id: str, total: int, fn: Callable[[Job], None]) -> Job:
+        """Runs fn(job) in a daemon thread; fn reports progress through job.record() / advance()."""
+        job = Job(kind, session_id, total)
+        job._sync = self._write
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        self._write(job)
+
+        def _run():
+            job.status = "running"
+            job.started = time.time()
+            self._write(job)
+            try:
+                fn(job)
+                job.status = "cancelled" if job.cancelled else "done"
+            except Exception as e:
+                job.status = "error"
+                job.error = str(e)
+            finally:
+                job.finished = time.time()
+                self._write(job)
+
+        threading.Thread(target=_run, name=f"job-{job.id[:8]}", daemon=True).start()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id) or self._read(job_id)
+
+    def active_for_session(self, session_id: str, kind: str) -> Optional[Job]:
+        for job in list(self._jobs.values()):
+            if job.session_id == session_id and job.kind == kind and job.status in ("queued", "running"):
+                return job
+        if self.db_path:
+            rows = self._conn().execute(
+                "SELECT * FROM jobs WHERE session_id = ? AND kind = ? AND status IN ('queued', 'running')",
+                (session_id, kind),
+            ).fetchall()
+            for row in rows:
+                job = Job.from_row(row)
+                if job.status in ("queued", "running"):
+                    return job
+        return None
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        job = self._jobs.get(job_id)
+        if job:
+            job.cancel_event.set()
+        if self.db_path:
+            # The owning process sees the flag on its next progress sync
+            self._conn().execute("UPDATE jobs SET cancel = 1 WHERE job_id = ?", (job_id,))
+        return job or self._read(job_id)
@@ -1,24 +1,292 @@
-import os, uuid, time
+import os, sys, json, uuid, time
+from json.encoder import encode_basestring_ascii
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterator, List, Optional
 
-def new_session_state(session_id: str) -> dict:
-    return {
+# Item fields new_filename depends on (besides original_filename, which never changes)
+RENAME_FIELDS = ("type", "page_number", "number_scheme", "extra", "ghost_number")
+
+
+class ItemList(list):
+    """List of item dicts that flags any change of membership or order."""
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.dirty = True
+
+
+def _marks_dirty(name: str):
+    base = getattr(list, name)
+
+    def method(self, *args, **kwargs):
+        out = base(self, *args, **kwargs)
+        self.dirty = True
+        return out
+    method.__name__ = name
+    return method
+
+
+for _name in ("append", "extend", "insert", "remove", "pop", "clear", "sort", "reverse",
+              "__setitem__", "__delitem__", "__iadd__", "__imul__"):
+    setattr(ItemList, _name, _marks_dirty(_name))
+
+
+class SessionState(dict):
+    """
+    Session state dict with an id -> item / id -> position index over
+    state["items"], rebuilt only after the list changes (append, sort...).
+    Items whose rename fields are set through set_fields() are kept aside
+    until take_renames(), so only those names need recomputing.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._index: Dict[str, Dict[str, Any]] = {}
+        self._positions: Dict[str, int] = {}
+        self._indexed: Optional[ItemList] = None
+        self._renames: Dict[str, Dict[str, Any]] = {}
+        self["items"] = self.get("items", [])
+
+    def __setitem__(self, key, value):
+        if key == "items" and not isinstance(value, ItemList):
+            value = ItemList(value)
+        super().__setitem__(key, value)
+
+    def _ensure_index(self):
+        items = self["items"]
+        if items.dirty or self._indexed is not items:
+            self._index = {it["id"]: it for it in items}
+            self._positions = {it["id"]: i for i, it in enumerate(items)}
+            self._indexed = items
+            items.dirty = False
+
+    def get_item(self, image_id: str) -> Optional[Dict[str, Any]]:
+        self._ensure_index()
+        return self._index.get(image_id)
+
+    def position(self, image_id: str) -> Optional[int]:
+        self._ensure_index()
+        return self._positions.get(image_id)
+
+    def set_fields(self, item: Dict[str, Any], fields: Dict[str, Any]):
+        """Updates an item; touching any RENAME_FIELDS marks it for renaming."""
+        item.update(fields)
+        if any(k in fields for k in RENAME_FIELDS):
+            self._renames[item["id"]] = item
+
+    def take_renames(self) -> List[Dict[str, Any]]:
+        """Items marked since the last call (and clears the marks)."""
+        out = list(self._renames.values())
+        self._renames.clear()
+        return out
+
+
+def new_session_state(session_id: str) -> SessionState:
+    return SessionState({
         "session_id": session_id,
         "created": time.time(),
         "items": [],  # list of dicts per image
-    }
-
-def new_item(image_id: str, path: str, original_filename: str) -> dict:
-    return {
-        "id": image_id,
-        "path": path,
-        "original_filename": original_filename,
-        "type": None,
-        "validated": False,
-        "page_number": None,  # int | False
-        "number_scheme": "arabic",
-        "extra": "",
-        "ghost_number": False,
-        "graphic": False,
-        "keywords": "",
-        "new_filename": None,
-    }
+    })
+
+
+class _Unset:
+    """Marks a key absent from an item; pickles/copies as the same singleton."""
+
+    __slots__ = ()
+
+    def __reduce__(self):
+        return "_UNSET"  # module global: pickle and copy resolve it to this object
+
+    def __repr__(self) -> str:
+        return "_UNSET"
+
+
+_UNSET = _Unset()
+_KEYS = ("id", "path", "original_filename", "type", "validated", "page_number", "number_scheme",
+         "extra", "ghost_number", "graphic", "keywords", "new_filename", "rev")
+_KEY_SET = frozenset(_KEYS)
+_FIELDS = _KEY_SET - {"path"}
+_INTERNED = frozenset(("type", "number_scheme", "extra"))  # small vocabularies
+# Same output as Flask's provider (sorted keys, ASCII, compact)
+_encode_json = json.JSONEncoder(sort_keys=True, separators=(",", ":")).encode
+_SEP = os.sep
+
+
+def _json_scalar(v: Any) -> str:
+    """JSON for the scalar field values items hold; TypeError for anything else."""
+    if v is None:
+        return "null"
+    if v is True:
+        return "true"
+    if v is False:
+        return "false"
+    t = type(v)
+    if t is str:
+        return encode_basestring_ascii(v)
+    if t is int:
+        return str(v)
+    raise TypeError(t)
+
+
+class Item(MutableMapping):
+    """
+    One page, stored in __slots__ instead of a 12-key dict. Behaves as the
+    usual item dict (it["type"], it.get(...), "rev" in it, update...) and
+    converts to a plain dict with to_dict() at the API / storage boundary.
+
+    To keep large sessions small:
+    - "path" is split into the session's originals dir (interned, shared by
+      every item) and the file name, which is the original_filename object
+      itself when they match;
+    - type / number_scheme / extra are interned;
+    - unknown keys go to a side dict, created only when needed.
+
+    to_json() writes the JSON text directly in a fixed (sorted) key order,
+    without building the dict; the app's JSON provider uses it for "items".
+    """
+
+    __slots__ = ("id", "_dir", "_file", "original_filename", "type", "validated", "page_number",
+                 "number_scheme", "extra", "ghost_number", "graphic", "keywords", "new_filename",
+                 "rev", "_more")
+
+    def __init__(self, image_id: str, path: str, original_filename: str):
+        self.id = image_id
+        self.original_filename = original_filename
+        self._set_path(path)
+        self.type = None
+        self.validated = False
+        self.page_number = None  # int | False
+        self.number_scheme = "arabic"
+        self.extra = ""
+        self.ghost_number = False
+        self.graphic = False
+        self.keywords = ""
+        self.new_filename = None
+        self.rev = _UNSET
+        self._more: Optional[Dict[str, Any]] = None
+
+    def _set_path(self, path: str):
+        d, f = os.path.split(path)
+        self._dir = sys.intern(d)
+        self._file = self.original_filename if f == self.original_filename else f
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "Item":
+        it = cls.__new__(cls)
+        g = d.get
+        it.id = d["id"]
+        it.original_filename = g("original_filename", "")
+        it._set_path(g("path", ""))
+        for k in ("type", "number_scheme", "extra"):
+            v = g(k, _UNSET)
+            setattr(it, k, sys.intern(v) if type(v) is str else v)
+        it.validated = g("validated", _UNSET)
+        it.page_number = g("page_number", _UNSET)
+        it.ghost_number = g("ghost_number", _UNSET)
+        it.graphic = g("graphic", _UNSET)
+        it.keywords = g("keywords", _UNSET)
+        it.new_filename = g("new_filename", _UNSET)
+        it.rev = g("rev", _UNSET)
+        it._more = None if _KEY_SET.issuperset(d) else {k: v for k, v in d.items() if k not in _KEY_SET}
+        return it
+
+    def to_dict(self) -> Dict[str, Any]:
+        d = {
+            "id": self.id,
+            "path": os.path.join(self._dir, self._file),
+            "original_filename": self.original_filename,
+            "type": self.type,
+            "validated": self.validated,
+            "page_number": self.page_number,
+            "number_scheme": self.number_scheme,
+            "extra": self.extra,
+            "ghost_number": self.ghost_number,
+            "graphic": self.graphic,
+            "keywords": self.keywords,
+            "new_filename": self.new_filename,
+            "rev": self.rev,
+        }
+        unset = [k for k, v in d.items() if v is _UNSET]
+        for k in unset:
+            del d[k]
+        if self._more:
+            d.update(self._more)
+        return d
+
+    def to_json(self) -> str:
+        """
+        to_dict() as compact JSON with sorted keys. Items with extra keys,
+        unset fields or non-scalar values go through to_dict().
+        """
+        if self._more is None:
+            d, f, j = self._dir, self._file, _json_scalar
+            try:
+                return (
+                    f'{{"extra":{j(self.extra)},"ghost_number":{j(self.ghost_number)},'
+                    f'"graphic":{j(self.graphic)},"id":{j(self.id)},"keywords":{j(self.keywords)},'
+                    f'"new_filename":{j(self.new_filename)},"number_scheme":{j(self.number_scheme)},'
+                    f'"original_filename":{j(self.original_filename)},"page_number":{j(self.page_number)},'
+                    f'"path":{j(d + _SEP + f if d and d[-1] != _SEP else d + f)},"rev":{j(self.rev)},'
+                    f'"type":{j(self.type)},"validated":{j(self.validated)}}}'
+                )
+            except TypeError:
+                pass
+        return _encode_json(self.to_dict())
+
+    # ---------- mapping protocol ----------
+    def __getitem__(self, key: str) -> Any:
+        if key == "path":
+            return os.path.join(self._dir, self._file)
+        if key in _FIELDS:
+            v = getattr(self, key)
+            if v is not _UNSET:
+                return v
+        elif self._more is not None and key in self._more:
+            return self._more[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: Any):
+        if key == "path":
+            self._set_path(value)
+        elif key in _FIELDS:
+            if key in _INTERNED and type(value) is str:
+                value = sys.intern(value)
+            setattr(self, key, value)
+        else:
+            if self._more is None:
+                self._more = {}
+            self._more[key] = value
+
+    def __delitem__(self, key: str):
+        if key in _FIELDS and getattr(self, key) is not _UNSET:
+            setattr(self, key, _UNSET)
+        elif self._more is not None and key in self._more:
+            del self._more[key]
+        else:
+            raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        for k in _KEYS:
+            if k == "path" or getattr(self, k) is not _UNSET:
+                yield k
+        if self._more:
+            yield from self._more
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"Item({self.to_dict()!r})"
+
+    def __reduce__(self):
+        # pickle / copy / deepcopy (e.g. to a process pool) through the dict form
+        return Item.from_dict, (self.to_dict(),)
+
+
+def as_dict(item) -> Dict[str, Any]:
+    """Plain dict form of an item (Item or already a dict)."""
+    return item.to_dict() if isinstance(item, Item) else item
+
+
+def new_item(image_id: str, path: str, original_filename: str) -> Item:
+    return Item(image_id, path, original_filename)
@@ -0,0 +1,424 @@
+import os, json, time, bisect, socket, threading
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock
+    fcntl = None
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+RETIRED_FILE = "retired.json"  # totals of worker processes that have exited
+
+# Seconds; covers a cached lookup (~1 ms) up to a full-resolution OCR pass
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Key = Tuple[str, ...]
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: Sequence[Tuple[str, str]] = ()) -> str:
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _num(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _merge(a: Any, b: Any) -> Any:
+    """Adds two sample values: counter numbers or histogram [buckets, sum, count]."""
+    if isinstance(a, list):
+        return [[x + y for x, y in zip(a[0], b[0])], a[1] + b[1], a[2] + b[2]]
+    return a + b
+
+
+def _merge_into(total: Dict[str, Dict[Key, Any]], snap: Dict[str, Dict[Key, Any]]):
+    for name, values in snap.items():
+        dst = total.setdefault(name, {})
+        for key, value in values.items():
+            dst[key] = _merge(dst[key], value) if key in dst else value
+
+
+def _has_samples(snap: Dict[str, Dict[Key, Any]]) -> bool:
+    return any(v[2] if isinstance(v, list) else v for values in snap.values() for v in values.values())
+
+
+def _encode(snap: Dict[str, Dict[Key, Any]]) -> Dict[str, list]:
+    return {name: [[list(k), v] for k, v in values.items()] for name, values in snap.items()}
+
+
+def _decode(data: Dict[str, list]) -> Dict[str, Dict[Key, Any]]:
+    return {name: {tuple(k): v for k, v in rows} for name, rows in data.items()}
+
+
+class Counter:
+    """Monotonic counter with optional labels (thread-safe)."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Key, float] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Key:
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self) -> Dict[Key, Any]:
+        with self._lock:
+            return dict(self._values)
+
+    def samples(self, values: Dict[Key, Any]) -> Iterable[str]:
+        for key in sorted(values):
+            yield f"{self.name}{_labels(self.labelnames, key)} {_num(values[key])}"
+
+
+class CounterFunc(Counter):
+    """Counter whose values are read at scrape time (e.g. counters kept by a cache)."""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str], fn: Callable[[], Dict[Key, float]]):
+        super().__init__(name, help, labelnames)
+        self.fn = fn
+
+    def snapshot(self) -> Dict[Key, Any]:
+        try:
+            return {tuple(k): v for k, v in self.fn().items()}
+        except Exception:
+            return {}
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels (thread-safe)."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Key, list] = {}  # key -> [per-bucket counts (+Inf last), sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            v = self._values.get(key)
+            if v is None:
+                v = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            v[0][i] += 1
+            v[1] += value
+            v[2] += 1
+
+    def snapshot(self) -> Dict[Key, Any]:
+        with self._lock:
+            return {k: [list(v[0]), v[1], v[2]] for k, v in self._values.items()}
+
+    def samples(self, values: Dict[Key, Any]) -> Iterable[str]:
+        bounds = [_num(b) for b in self.buckets] + ["+Inf"]
+        for key in sorted(values):
+            counts, total, count = values[key]
+            cumulative = 0
+            for le, n in zip(bounds, counts):
+                cumulative += n
+                yield f"{self.name}_bucket{_labels(self.labelnames, key, [('le', le)])} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, key)} {_num(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, key)} {count}"
+
+
+class Registry:
+    """
+    Process-local metrics rendered in the Prometheus text format (0.0.4).
+
+    With share(directory), every process writes a snapshot to
+    <directory>/<host>-<pid>.json (from a background thread every interval, and after
+    requests) and exposition() adds up the snapshots of all live processes
+    plus retired.json, where the last totals of exited processes are folded,
+    so any worker behind a load balancer reports the whole server and the
+    counters never go down.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._dir: Optional[str] = None
+        self._interval = 1.0
+        self._flushed = 0.0
+        self._flusher_pid: Optional[int] = None
+        self._written: Optional[Dict[str, Dict[Key, Any]]] = None
+        self._host = socket.gethostname().replace("-", "_")
+
+    def _add(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, help, labelnames))
+
+    def counter_func(self, name: str, help: str, labelnames: Sequence[str], fn) -> CounterFunc:
+        with self._lock:
+            metric = self._metrics[name] = CounterFunc(name, help, labelnames, fn)
+        return metric
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    # ---------- cross-process sharing ----------
+    def share(self, directory: str, interval: float = 1.0):
+        os.makedirs(directory, exist_ok=True)
+        self._dir = directory
+        self._interval = interval
+        # A previous process with this pid (restart, pid reuse) left its totals
+        self._retire(self._own_file())
+        self._start_flusher()
+
+    def _own_file(self) -> str:
+        # Per host: with a workspace on shared storage, pids of other hosts
+        # cannot be checked here and are never retired by this host
+        return f"{self._host}-{os.getpid()}.json"
+
+    def _start_flusher(self):
+        """Background flush every interval, so a worker busy with a job (no
+        requests) still publishes; restarted after fork (one per pid)."""
+        if self._dir is None or self._flusher_pid == os.getpid():
+            return
+        self._flusher_pid = os.getpid()
+
+        def _run():
+            while True:
+                time.sleep(self._interval)
+                self.flush(force=True)
+
+        threading.Thread(target=_run, name="metrics-flush", daemon=True).start()
+
+    def snapshot(self) -> Dict[str, Dict[Key, Any]]:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {m.name: m.snapshot() for m in metrics}
+
+    def _write(self, path: str, snap: Dict[str, Dict[Key, Any]]):
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(_encode(snap), f)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def _read(path: str) -> Optional[Dict[str, Dict[Key, Any]]]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return _decode(json.load(f))
+        except (OSError, ValueError):
+            return None
+
+    def flush(self, force: bool = False):
+        """Writes this process's snapshot (at most once per interval unless forced)."""
+        now = time.monotonic()
+        if self._dir is None or (not force and now - self._flushed < self._interval):
+            return
+        self._flushed = now
+        self._start_flusher()
+        snap = self.snapshot()
+        if snap == self._written or (self._written is None and not _has_samples(snap)):
+            return  # unchanged, or a process that never recorded anything (e.g. pool workers)
+        try:
+            self._write(os.path.join(self._dir, self._own_file()), snap)
+            self._written = snap
+        except OSError:
+            pass
+
+    @contextmanager
+    def _dir_lock(self):
+        with open(os.path.join(self._dir, ".lock"), "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            yield
+
+    def _retire(self, fn: str):
+        try:
+            with self._dir_lock():
+                self._retire_locked(fn)
+        except OSError:
+            pass
+
+    def _retire_locked(self, fn: str):
+        """
+        Folds the last snapshot of a finished process into retired.json, so
+        counters keep growing when gunicorn recycles or restarts a worker
+        (otherwise Prometheus would see a counter reset). Caller holds the lock.
+        """
+        path = os.path.join(self._dir, fn)
+        snap = self._read(path)
+        if snap is None:  # already retired by another worker
+            return
+        retired_path = os.path.join(self._dir, RETIRED_FILE)
+        retired = self._read(retired_path) or {}
+        _merge_into(retired, snap)
+        self._write(retired_path, retired)
+        os.remove(path)
+
+    def _peer_snapshots(self) -> List[Dict[str, Dict[Key, Any]]]:
+        """Other live processes + retired totals, read under the lock so a
+        snapshot being retired is never counted twice."""
+        out = []
+        if self._dir is None:
+            return out
+        own = self._own_file()
+        try:
+            with self._dir_lock():
+                for fn in os.listdir(self._dir):
+                    host, _, pid = fn[:-len(".json")].rpartition("-")
+                    if not fn.endswith(".json") or not pid.isdigit() or fn == own:
+                        continue
+                    if host == self._host and not _alive(int(pid)):
+                        self._retire_locked(fn)
+                        continue
+                    snap = self._read(os.path.join(self._dir, fn))
+                    if snap is not None:
+                        out.append(snap)
+                retired = self._read(os.path.join(self._dir, RETIRED_FILE))
+        except OSError:
+            return out
+        if retired is not None:
+            out.append(retired)
+        return out
+
+    def exposition(self) -> str:
+        total: Dict[str, Dict[Key, Any]] = {}
+        for snap in [self.snapshot()] + self._peer_snapshots():
+            _merge_into(total, snap)
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for m in metrics:
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            lines.extend(m.samples(total.get(m.name, {})))
+        return "\n".join(lines) + "\n"
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "preservia_stage_seconds", "Time spent in each processing stage (per call).", ["stage"]
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    "preservia_request_seconds", "HTTP request handling time (until the response starts).", ["endpoint"]
+)
+PAGES_CLASSIFIED = REGISTRY.counter(
+    "preservia_pages_classified_total", "Pages classified, by what decided the type.", ["source"]
+)
+EXPORT_BYTES = REGISTRY.counter(
+    "preservia_export_bytes_total", "Bytes of ZIP archives sent to clients.", ["mode"]
+)
+
+
+# ---------- stage timers ----------
+class RequestTiming:
+    """Per-request accumulator: stage -> [seconds, calls], for the Server-Timing header."""
+
+    __slots__ = ("start", "stages")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages: Dict[str, list] = {}
+
+    def add(self, stage: str, seconds: float):
+        s = self.stages.get(stage)
+        if s is None:
+            self.stages[stage] = [seconds, 1]
+        else:
+            s[0] += seconds
+            s[1] += 1
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def header(self, total: float) -> str:
+        parts = []
+        for stage, (seconds, calls) in self.stages.items():
+            desc = f';desc="{calls} calls"' if calls > 1 else ""
+            parts.append(f"{stage};dur={seconds * 1e3:.2f}{desc}")
+        parts.append(f"total;dur={total * 1e3:.2f}")
+        return ", ".join(parts)
+
+
+_REQUEST: ContextVar[Optional[RequestTiming]] = ContextVar("metrics_request", default=None)
+_DEFERRED: ContextVar[Optional[list]] = ContextVar("metrics_deferred", default=None)
+
+
+def begin_request() -> RequestTiming:
+    timing = RequestTiming()
+    _REQUEST.set(timing)
+    return timing
+
+
+def end_request() -> Optional[RequestTiming]:
+    timing = _REQUEST.get()
+    _REQUEST.set(None)
+    return timing
+
+
+def observe(stage: str, seconds: float):
+    """Records one stage duration in the histogram and the current request (if any)."""
+    buf = _DEFERRED.get()
+    if buf is not None:
+        buf.append((stage, seconds))
+        return
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timing = _REQUEST.get()
+    if timing is not None:
+        timing.add(stage, seconds)
+
+
+@contextmanager
+def timed(stage: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - t0)
+
+
+@contextmanager
+def deferred():
+    """
+    Collects stage timings into a list instead of recording them, so work
+    done in a pool process can hand them back to the parent (see replay).
+    """
+    buf: List[Tuple[str, float]] = []
+    token = _DEFERRED.set(buf)
+    try:
+        yield buf
+    finally:
+        _DEFERRED.reset(token)
+
+
+def replay(timings: Optional[Iterable[Tuple[str, float]]]):
+    for stage, seconds in timings or ():
+        observe(stage, seconds)
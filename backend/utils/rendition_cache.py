@@ -0,0 +1,88 @@
+import os, bisect, threading
+from typing import Dict, Optional, Sequence
+
+from PIL import Image, ImageOps
+
+from .metrics import timed
+from .result_cache import ResultCache
+
+DEFAULT_WIDTHS = (320, 640, 1024, 1600, 2400)
+
+
+def snap_width(width: Optional[int], widths: Sequence[int] = DEFAULT_WIDTHS) -> Optional[int]:
+    """
+    Rounds a requested width up to the next configured size, so nearby
+    requests (?w=1500, ?w=1600) share one rendition. Widths above the
+    largest size (or none at all) mean full resolution (None).
+    """
+    if not width or width <= 0:
+        return None
+    i = bisect.bisect_left(widths, width)
+    return widths[i] if i < len(widths) else None
+
+
+def render_preview(src: str, dst: str, width: Optional[int], quality: int = 85) -> str:
+    """Web-safe JPEG of src, at most `width` px wide (decoded at reduced scale when possible)."""
+    with Image.open(src) as im:
+        if width and im.format == "JPEG":
+            im.draft("RGB", (width, width))  # DCT scaling, never below the target (any orientation)
+        im = ImageOps.exif_transpose(im)
+        if im.mode in ("RGBA", "LA", "P"):
+            im = im.convert("RGBA")
+            bg = Image.new("RGB", im.size, (255, 255, 255))
+            bg.paste(im, mask=im.split()[-1])
+            im = bg
+        elif im.mode not in ("RGB",):
+            im = im.convert("RGB")
+
+        if width and width < im.width:
+            h = int(im.height * (width / im.width))
+            im = im.resize((width, h), Image.LANCZOS)
+
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        tmp = f"{dst}.{os.getpid()}.{threading.get_ident()}.tmp"
+        im.save(tmp, format="JPEG", quality=quality)
+    os.replace(tmp, dst)
+    return dst
+
+
+class RenditionCache(ResultCache):
+    """Bounded on-disk cache of rendered previews (JPEG files, LRU by mtime).
+
+    Keys are (content digest, snapped width, quality), so renditions are
+    shared across sessions and invalidated by content, not by path.
+    """
+
+    EXT = ".jpg"
+
+    def __init__(self, root: str, max_bytes: int = 1024 * 1024 * 1024,
+                 widths: Sequence[int] = DEFAULT_WIDTHS):
+        super().__init__(root, max_bytes=max_bytes)
+        self.widths = tuple(sorted(widths))
+        self._renders: Dict[str, threading.Lock] = {}
+
+    @staticmethod
+    def rendition_key(digest: str, width: Optional[int], quality: int) -> str:
+        return f"{digest}-w{width or 'full'}-q{quality}"
+
+    def get_or_render(self, src: str, digest: str, width: Optional[int], quality: int = 85) -> str:
+        """Path of the cached rendition, rendering it first on a miss."""
+        key = self.rendition_key(digest, width, quality)
+        p = self._path(key)
+        if os.path.exists(p):
+            self._touch(key, p)
+            return p
+        with self._lock:
+            lock = self._renders.setdefault(key, threading.Lock())
+        with lock:  # concurrent requests for the same rendition render once
+            if os.path.exists(p):
+                self._touch(key, p)
+                return p
+            with self._lock:
+                self.misses += 1
+            with timed("preview.render"):
+                render_preview(src, p, width, quality)
+            self._account(key, p)
+        with self._lock:
+            self._renders.pop(key, None)
+        return p
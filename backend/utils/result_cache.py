@@ -0,0 +1,140 @@
+import os, json, time, threading
+from typing import Any, Dict, Optional
+
+
+class ResultCache:
+    """On-disk, content-addressed cache of per-page analysis results.
+
+    Entries are small JSON files under ``root/<k[:2]>/<k>.json`` where the key
+    is the image content hash plus a config version string, so any change in
+    classifier/OCR settings naturally misses. Total size is bounded; the least
+    recently used entries (by file mtime, refreshed on every hit) are evicted.
+    """
+
+    EXT = ".json"
+
+    def __init__(self, root: str, max_bytes: int = 256 * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._index: Optional[Dict[str, list]] = None  # key -> [size, last_access]
+        self._total = 0
+        os.makedirs(root, exist_ok=True)
+
+    # ---------- internals ----------
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], f"{key}{self.EXT}")
+
+    def _load_index(self):
+        if self._index is not None:
+            return
+        index: Dict[str, list] = {}
+        total = 0
+        for sub in os.listdir(self.root):
+            d = os.path.join(self.root, sub)
+            if not os.path.isdir(d):
+                continue
+            for fn in os.listdir(d):
+                if not fn.endswith(self.EXT):
+                    continue
+                try:
+                    st = os.stat(os.path.join(d, fn))
+                except OSError:
+                    continue
+                index[fn[: -len(self.EXT)]] = [st.st_size, st.st_mtime]
+                total += st.st_size
+        self._index = index
+        self._total = total
+
+    def _evict(self):
+        if self._total <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)
+        for key, (size, _) in sorted(self._index.items(), key=lambda kv: kv[1][1]):
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+            self._total -= size
+            del self._index[key]
+            self.evictions += 1
+            if self._total <= target:
+                break
+
+    def _touch(self, key: str, p: str):
+        """Counts a hit and refreshes the entry's LRU position."""
+        now = time.time()
+        try:
+            os.utime(p, (now, now))
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+            if self._index is not None and key in self._index:
+                self._index[key][1] = now
+
+    def _account(self, key: str, p: str):
+        """Registers a freshly written entry and evicts if over budget."""
+        size = os.path.getsize(p)
+        with self._lock:
+            self._load_index()
+            old = self._index.get(key)
+            if old:
+                self._total -= old[0]
+            self._index[key] = [size, time.time()]
+            self._total += size
+            self._evict()
+
+    @staticmethod
+    def make_key(digest: str, version: str) -> str:
+        return f"{digest}-{version}"
+
+    # ---------- API ----------
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        p = self._path(key)
+        try:
+            with open(p, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        self._touch(key, p)
+        return data
+
+    def put(self, key: str, data: Dict[str, Any]):
+        p = self._path(key)
+        os.makedirs(os.path.dirname(p), exist_ok=True)
+        tmp = f"{p}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, p)  # atomic: readers never see a partial entry
+        self._account(key, p)
+
+    def update(self, key: str, **fields):
+        """Merges fields into an existing entry (or creates it)."""
+        p = self._path(key)
+        try:
+            with open(p, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        data.update(fields)
+        self.put(key, data)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._load_index()
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._index),
+                "bytes": self._total,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else None,
+                "evictions": self.evictions,
+            }
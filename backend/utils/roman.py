@@ -1,24 +1,29 @@
+_VALUES = (
+    (1000, "M"), (900, "CM"), (500, "D"), (400, "CD"),
+    (100, "C"), (90, "XC"), (50, "L"), (40, "XL"),
+    (10, "X"), (9, "IX"), (5, "V"), (4, "IV"), (1, "I"),
+)
+ROMAN_TABLE_MAX = 3999  # largest number with a standard roman form
+
+
+def _to_roman(num: int) -> str:
+    parts = []
+    for value, sym in _VALUES:
+        count, num = divmod(num, value)
+        parts.append(sym * count)
+    return "".join(parts)
+
+
+# Precomputed once: page numbers are looked up on every rename
+_TABLE = [""] + [_to_roman(n) for n in range(1, ROMAN_TABLE_MAX + 1)]
+
+
 def int_to_roman(num: int) -> str:
     if num <= 0:
         return str(num)
-    val = [
-        1000, 900, 500, 400,
-        100, 90, 50, 40,
-        10, 9, 5, 4, 1
-        ]
-    syms = [
-        "M", "CM", "D", "CD",
-        "C", "XC", "L", "XL",
-        "X", "IX", "V", "IV", "I"
-        ]
-    roman_num = ""
-    i = 0
-    while num > 0:
-        for _ in range(num // val[i]):
-            roman_num += syms[i]
-            num -= val[i]
-        i += 1
-    return roman_num
+    if num <= ROMAN_TABLE_MAX:
+        return _TABLE[num]
+    return _to_roman(num)
 
 def format_number(n: int, scheme: str = "arabic", ghost: bool = False) -> str:
     if scheme == "roman":
@@ -0,0 +1,260 @@
+import json, time, sqlite3, threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from .metadata_store import Item, as_dict, new_session_state
+
+# Top-level state keys stored in their own columns / table; the rest go to `data`
+_COLUMN_KEYS = ("session_id", "created", "label", "rev", "items")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    created    REAL NOT NULL,
+    updated    REAL NOT NULL,
+    label      TEXT,
+    data       TEXT NOT NULL DEFAULT '{}',
+    rev        INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS items (
+    session_id TEXT NOT NULL,
+    id         TEXT NOT NULL,
+    position   INTEGER NOT NULL,
+    data       TEXT NOT NULL,
+    PRIMARY KEY (session_id, id)
+);
+CREATE INDEX IF NOT EXISTS items_by_position ON items (session_id, position);
+"""
+
+
+class SessionStore:
+    """Durable session state: SQLite (WAL) with a bounded in-memory cache.
+
+    Sessions are one row each (label + remaining top-level keys as JSON) and
+    items are one row per page, so a single edit rewrites a single row.
+    Every write bumps the session ``rev``; cached sessions are checked
+    against it on each access, so several processes can share the database
+    (gunicorn workers, or hosts on shared storage with working POSIX locks).
+    Items carry the ``rev`` of their last change and the session the
+    ``order_rev`` of its last full rewrite (items added or reordered), so
+    clients can ask for what changed since a revision they already have.
+
+    Read-modify-write sequences go through ``locked()``, which holds the
+    database write lock and hands out the latest state; ``save_*`` inside it
+    join that transaction.
+    """
+
+    def __init__(self, db_path: str, cache_size: int = 32):
+        self.db_path = db_path
+        self.cache_size = cache_size
+        self._local = threading.local()
+        self._cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.RLock()
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+        cols = {r[1] for r in conn.execute("PRAGMA table_info(sessions)")}
+        if "rev" not in cols:  # databases created before rev existed
+            conn.execute("ALTER TABLE sessions ADD COLUMN rev INTEGER NOT NULL DEFAULT 0")
+
+    # ---------- connection / cache ----------
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _tx(self) -> Iterator[sqlite3.Connection]:
+        """Write transaction; joins the caller's one if already open."""
+        conn = self._conn()
+        if conn.in_transaction:
+            yield conn
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _remember(self, state: Dict[str, Any]):
+        with self._lock:
+            sid = state["session_id"]
+            self._cache[sid] = state
+            self._cache.move_to_end(sid)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _forget(self, session_id: str):
+        with self._lock:
+            self._cache.pop(session_id, None)
+
+    # ---------- read ----------
+    def _read(self, conn, session_id: str) -> Optional[Dict[str, Any]]:
+        row = conn.execute(
+            "SELECT created, label, data, rev FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        state = new_session_state(session_id)
+        state.update(json.loads(row[2] or "{}"))
+        state["created"] = row[0]
+        state["label"] = row[1]
+        state["rev"] = row[3]
+        state["items"] = [
+            Item.from_dict(json.loads(d)) for (d,) in conn.execute(
+                "SELECT data FROM items WHERE session_id = ? ORDER BY position", (session_id,)
+            )
+        ]
+        self._remember(state)
+        return state
+
+    def _current(self, conn, session_id: str) -> Optional[Dict[str, Any]]:
+        """Cached state if its rev is still the stored one, else re-read."""
+        row = conn.execute("SELECT rev FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        if row is None:
+            self._forget(session_id)
+            return None
+        with self._lock:
+            state = self._cache.get(session_id)
+            if state is not None and state.get("rev") == row[0]:
+                self._cache.move_to_end(session_id)
+                return state
+        return self._read(conn, session_id)
+
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Returns the latest session state (cached or restored from disk), or None."""
+        conn = self._conn()
+        if conn.in_transaction:
+            return self._current(conn, session_id)
+        conn.execute("BEGIN")  # consistent snapshot of session row + items
+        try:
+            return self._current(conn, session_id)
+        finally:
+            conn.execute("COMMIT")
+
+    def exists(self, session_id: str) -> bool:
+        row = self._conn().execute(
+            "SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return row is not None
+
+    @contextmanager
+    def locked(self, session_id: str, create: bool = False) -> Iterator[Optional[Dict[str, Any]]]:
+        """
+        Exclusive read-modify-write of a session across threads and processes:
+        yields the latest state (None if missing and not ``create``) while
+        holding the write lock. Changes must be saved with ``save_*`` inside
+        the block; on error nothing is written and the cached copy is dropped.
+        """
+        with self._tx() as conn:
+            try:
+                state = self._current(conn, session_id)
+                if state is None and create:
+                    state = self.create(session_id)
+                yield state
+            except BaseException:
+                self._forget(session_id)
+                raise
+
+    # ---------- write ----------
+    def _session_row(self, state: Dict[str, Any]):
+        extra = {k: v for k, v in state.items() if k not in _COLUMN_KEYS}
+        return (
+            state["session_id"],
+            state.get("created") or time.time(),
+            time.time(),
+            state.get("label"),
+            json.dumps(extra, ensure_ascii=False),
+        )
+
+    def _upsert_session(self, conn, state: Dict[str, Any]):
+        conn.execute(
+            "INSERT INTO sessions (session_id, created, updated, label, data) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(session_id) DO UPDATE SET updated = excluded.updated, "
+            "label = excluded.label, data = excluded.data",
+            self._session_row(state),
+        )
+
+    def _next_rev(self, conn, state: Dict[str, Any]) -> int:
+        row = conn.execute("SELECT rev FROM sessions WHERE session_id = ?", (state["session_id"],)).fetchone()
+        return (row[0] if row else 0) + 1
+
+    def _bump(self, conn, state: Dict[str, Any], rev: int):
+        conn.execute(
+            "UPDATE sessions SET rev = ?, updated = ? WHERE session_id = ?",
+            (rev, time.time(), state["session_id"]),
+        )
+        state["rev"] = rev
+        self._remember(state)
+
+    def create(self, session_id: str) -> Dict[str, Any]:
+        state = new_session_state(session_id)
+        state.setdefault("label", None)
+        self.save(state)
+        return state
+
+    def save_session(self, state: Dict[str, Any]):
+        """Persists the session-level fields (label, catalog, ...) only."""
+        with self._tx() as conn:
+            rev = self._next_rev(conn, state)
+            self._upsert_session(conn, state)
+            self._bump(conn, state, rev)
+
+    def save_items(self, state: Dict[str, Any], items: Iterable[Dict[str, Any]]):
+        """Upserts the given items (positions taken from the current order) and bumps their rev."""
+        items = list(items)
+        if not items:
+            return
+        sid = state["session_id"]
+        with self._tx() as conn:
+            rev = self._next_rev(conn, state)
+            rows = []
+            for it in items:
+                it["rev"] = rev
+                rows.append((sid, it["id"], state.position(it["id"]) or 0, json.dumps(as_dict(it), ensure_ascii=False)))
+            conn.executemany(
+                "INSERT INTO items (session_id, id, position, data) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(session_id, id) DO UPDATE SET position = excluded.position, data = excluded.data",
+                rows,
+            )
+            self._bump(conn, state, rev)
+
+    def save(self, state: Dict[str, Any]):
+        """
+        Persists the whole session (row + every item, dropping removed ones).
+        Items without a rev (new ones) get the new rev; edits to existing
+        items must go through ``save_items`` to be reported as changed.
+        """
+        sid = state["session_id"]
+        items: List[Dict[str, Any]] = state.get("items", [])
+        with self._tx() as conn:
+            rev = self._next_rev(conn, state)
+            state["order_rev"] = rev
+            for it in items:
+                it.setdefault("rev", rev)
+            rows = [(sid, it["id"], i, json.dumps(as_dict(it), ensure_ascii=False)) for i, it in enumerate(items)]
+            self._upsert_session(conn, state)
+            conn.execute("DELETE FROM items WHERE session_id = ?", (sid,))
+            conn.executemany(
+                "INSERT INTO items (session_id, id, position, data) VALUES (?, ?, ?, ?)", rows
+            )
+            self._bump(conn, state, rev)
+
+    def catalog_versions(self) -> set:
+        """Catalogue versions (catalog_store) referenced by at least one session."""
+        rows = self._conn().execute(
+            "SELECT DISTINCT json_extract(data, '$.catalog_version') FROM sessions"
+        ).fetchall()
+        return {int(v) for (v,) in rows if v is not None}
+
+    def delete(self, session_id: str):
+        with self._tx() as conn:
+            conn.execute("DELETE FROM items WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        self._forget(session_id)
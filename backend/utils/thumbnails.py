@@ -0,0 +1,206 @@
+import os, time, threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from PIL import Image, ImageOps, features
+
+from .export_engine import link_or_copy
+
+LEGACY_SIZE = 300  # thumbs/<id>.jpg keeps existing clients working
+THUMB_SIZES = tuple(sorted(
+    {int(s) for s in os.environ.get("THUMB_SIZES", "150,300,600").split(",") if s.strip()} | {LEGACY_SIZE}
+))
+THUMB_WORKERS = max(1, int(os.environ.get("THUMB_WORKERS", "2")))
+THUMB_STALE_SECONDS = 120  # a pending marker older than this is assumed orphaned
+
+FORMATS = {"jpeg": ("JPEG", ".jpg")}
+if features.check("webp"):
+    FORMATS["webp"] = ("WEBP", ".webp")
+
+
+def thumb_file(session_dir: str, image_id: str, size: int = LEGACY_SIZE, fmt: str = "jpeg") -> str:
+    d = os.path.join(session_dir, "thumbs")
+    if size == LEGACY_SIZE and fmt == "jpeg":
+        return os.path.join(d, f"{image_id}.jpg")
+    return os.path.join(d, f"{image_id}_{size}{FORMATS[fmt][1]}")
+
+
+def shared_thumb_file(shared_root: str, digest: str, size: int, fmt: str) -> str:
+    return os.path.join(shared_root, digest[:2], f"{digest}_{size}{FORMATS[fmt][1]}")
+
+
+def _marker(session_dir: str, image_id: str, kind: str) -> str:
+    return os.path.join(session_dir, "thumbs", f"{image_id}.{kind}")
+
+
+def snap_size(size: Optional[int]) -> int:
+    """Smallest configured size >= size (largest if above all, legacy if unset)."""
+    if not size:
+        return LEGACY_SIZE
+    for s in THUMB_SIZES:
+        if s >= size:
+            return s
+    return THUMB_SIZES[-1]
+
+
+def _reduced_source(im: Image.Image, target: int) -> Image.Image:
+    """
+    Decodes as little as possible for a `target` px box: JPEG DCT scaling,
+    or the smallest TIFF reduced-resolution page / SubIFD still >= target.
+    """
+    if im.format == "JPEG":
+        im.draft("RGB", (target, target))
+        return im
+    if im.format != "TIFF":
+        return im
+    best: Tuple[int, Optional[Image.Image]] = (im.width * im.height, None)
+    candidates: List[Image.Image] = []
+    try:
+        candidates.extend(getattr(im, "get_child_images", lambda: [])())  # SubIFDs
+    except Exception:
+        pass
+    for i in range(1, getattr(im, "n_frames", 1)):
+        try:
+            im.seek(i)
+        except EOFError:
+            break
+        if im.tag_v2.get(254, 0) & 1:  # NewSubfileType: reduced-resolution image
+            candidates.append(im.copy())
+    if getattr(im, "n_frames", 1) > 1:
+        im.seek(0)
+    for c in candidates:
+        if min(c.size) >= target and c.width * c.height < best[0]:
+            best = (c.width * c.height, c)
+    return best[1] if best[1] is not None else im
+
+
+def make_thumbnails(
+    src: str,
+    session_dir: str,
+    image_id: str,
+    sizes: Sequence[int] = THUMB_SIZES,
+    formats: Sequence[str] = tuple(FORMATS),
+    quality: int = 85,
+) -> List[str]:
+    """Decodes src once (reduced) and writes every size x format; returns the paths."""
+    out = []
+    os.makedirs(os.path.join(session_dir, "thumbs"), exist_ok=True)
+    with Image.open(src) as im:
+        base = _reduced_source(im, max(sizes))
+        base = ImageOps.exif_transpose(base)
+        if base.mode in ("RGBA", "LA", "P"):
+            base = base.convert("RGBA")
+            bg = Image.new("RGB", base.size, (255, 255, 255))
+            bg.paste(base, mask=base.split()[-1])
+            base = bg
+        elif base.mode != "RGB":
+            base = base.convert("RGB")
+        for size in sorted(sizes, reverse=True):  # each size shrinks the previous one
+            base.thumbnail((size, size), Image.LANCZOS)
+            for fmt in formats:
+                pil_fmt, _ = FORMATS[fmt]
+                dst = thumb_file(session_dir, image_id, size, fmt)
+                tmp = dst + ".tmp"
+                base.save(tmp, format=pil_fmt, quality=quality)
+                os.replace(tmp, dst)
+                out.append(dst)
+    return out
+
+
+class ThumbnailPipeline:
+    """
+    Background thumbnail generation (thread pool). While a job is queued or
+    running, thumbs/<id>.pending exists; failures leave thumbs/<id>.failed
+    with the error. Markers live on disk so any worker process can report
+    status, and orphaned markers (process died) are requeued.
+
+    With `shared_root` (the blob store's thumbs dir) thumbnails are also kept
+    per content digest: a page already seen in any session gets its
+    thumbnails hardlinked instead of decoded again.
+    """
+
+    def __init__(self, workers: int = THUMB_WORKERS, shared_root: Optional[str] = None):
+        self.shared_root = shared_root
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="thumbs")
+        self._inflight: Dict[str, bool] = {}
+        self._lock = threading.Lock()
+
+    def _link_shared(self, digest: str, session_dir: str, image_id: str) -> bool:
+        """Links every size/format from the shared store; False if any is missing."""
+        pairs = [
+            (shared_thumb_file(self.shared_root, digest, size, fmt), thumb_file(session_dir, image_id, size, fmt))
+            for size in THUMB_SIZES for fmt in FORMATS
+        ]
+        if not all(os.path.exists(src) for src, _ in pairs):
+            return False
+        for src, dst in pairs:
+            link_or_copy(src, dst)
+        return True
+
+    def _publish_shared(self, digest: str, session_dir: str, image_id: str):
+        for size in THUMB_SIZES:
+            for fmt in FORMATS:
+                dst = shared_thumb_file(self.shared_root, digest, size, fmt)
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                tmp = f"{dst}.{os.getpid()}.{threading.get_ident()}.tmp"
+                link_or_copy(thumb_file(session_dir, image_id, size, fmt), tmp)
+                os.replace(tmp, dst)
+
+    def _run(self, src: str, session_dir: str, image_id: str, digest: Optional[str] = None):
+        pending = _marker(session_dir, image_id, "pending")
+        shared = bool(self.shared_root and digest)
+        try:
+            if not (shared and self._link_shared(digest, session_dir, image_id)):
+                make_thumbnails(src, session_dir, image_id)
+                if shared:
+                    self._publish_shared(digest, session_dir, image_id)
+        except Exception as e:
+            with open(_marker(session_dir, image_id, "failed"), "w", encoding="utf-8") as f:
+                f.write(str(e))
+        finally:
+            try:
+                os.remove(pending)
+            except OSError:
+                pass
+            with self._lock:
+                self._inflight.pop(pending, None)
+
+    def submit(self, src: str, session_dir: str, image_id: str, digest: Optional[str] = None):
+        os.makedirs(os.path.join(session_dir, "thumbs"), exist_ok=True)
+        pending = _marker(session_dir, image_id, "pending")
+        with self._lock:
+            if pending in self._inflight:
+                return
+            self._inflight[pending] = True
+        open(pending, "w").close()
+        try:
+            os.remove(_marker(session_dir, image_id, "failed"))
+        except OSError:
+            pass
+        self._pool.submit(self._run, src, session_dir, image_id, digest)
+
+    def status(self, session_dir: str, image_id: str, src: Optional[str] = None,
+               path: Optional[str] = None) -> str:
+        """
+        ready | pending | failed | missing for the thumbnail at `path` (legacy
+        JPEG by default). With `src`, orphaned or never-made thumbnails
+        (sessions from before the pipeline, new sizes) are requeued.
+        """
+        if os.path.exists(path or thumb_file(session_dir, image_id)):
+            return "ready"
+        pending = _marker(session_dir, image_id, "pending")
+        if os.path.exists(pending):
+            with self._lock:
+                mine = pending in self._inflight
+            try:
+                stale = time.time() - os.path.getmtime(pending) > THUMB_STALE_SECONDS
+            except OSError:
+                stale = False
+            if mine or not stale or not src:
+                return "pending"
+        elif os.path.exists(_marker(session_dir, image_id, "failed")):
+            return "failed"
+        if src and os.path.exists(src):
+            self.submit(src, session_dir, image_id)  # sessions from before the pipeline
+            return "pending"
+        return "missing"
@@ -0,0 +1,100 @@
+import os, time, zipfile
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
+
+# Formats that are already compressed: deflating them only burns CPU
+STORED_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".gif", ".jp2"}
+TIFF_EXTS = {".tif", ".tiff"}
+CHUNK = 1 << 20
+
+
+class _Sink:
+    """Write-only, non-seekable buffer that zipfile writes into and we drain."""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+        self._pos = 0
+
+    def write(self, b) -> int:
+        b = bytes(b)
+        self._parts.append(b)
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def _tiff_is_uncompressed(path: str) -> bool:
+    """Reads only the TIFF header: True if pixel data is stored raw."""
+    try:
+        from PIL import Image
+        with Image.open(path) as im:
+            return im.info.get("compression", "raw") == "raw"
+    except Exception:
+        return False
+
+
+def compress_type_for(path: str) -> int:
+    ext = os.path.splitext(path.lower())[1]
+    if ext in STORED_EXTS:
+        return zipfile.ZIP_STORED
+    if ext in TIFF_EXTS and not _tiff_is_uncompressed(path):
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def _zinfo(arcname: str, mtime: float, size: int, compress_type: int) -> zipfile.ZipInfo:
+    zi = zipfile.ZipInfo(arcname, date_time=time.localtime(max(mtime, 315532800))[:6])
+    zi.compress_type = compress_type
+    zi.file_size = size  # lets zipfile pick ZIP64 headers up front for >4 GB entries
+    zi.external_attr = 0o644 << 16
+    return zi
+
+
+Entry = Tuple[str, Union[str, bytes]]
+
+
+def stream_zip(entries: Iterable[Entry], errors: Optional[list] = None) -> Iterator[bytes]:
+    """
+    Yields a ZIP archive chunk by chunk. ``entries`` are (arcname, source)
+    where source is a file path (read in 1 MB chunks) or in-memory bytes.
+    Memory stays bounded by the chunk size regardless of archive size;
+    ZIP64 is used automatically. Unreadable sources are skipped and appended
+    to ``errors`` as {"file", "error"} dicts.
+    """
+    sink = _Sink()
+    zf = zipfile.ZipFile(sink, "w", allowZip64=True)
+    try:
+        for arcname, src in entries:
+            if isinstance(src, (bytes, bytearray)):
+                zi = _zinfo(arcname, time.time(), len(src), zipfile.ZIP_DEFLATED)
+                zf.writestr(zi, bytes(src))
+                yield sink.drain()
+                continue
+            try:
+                st = os.stat(src)
+                f = open(src, "rb")
+            except OSError as e:
+                if errors is not None:
+                    errors.append({"file": arcname, "error": str(e)})
+                continue
+            with f:
+                zi = _zinfo(arcname, st.st_mtime, st.st_size, compress_type_for(src))
+                with zf.open(zi, "w") as w:
+                    for chunk in iter(lambda: f.read(CHUNK), b""):
+                        w.write(chunk)
+                        data = sink.drain()
+                        if data:
+                            yield data
+            yield sink.drain()
+    finally:
+        zf.close()
+    yield sink.drain()